@@ -0,0 +1,58 @@
+"""File Encryptor: шифрование файлов AES-256 без графического интерфейса"""
+from .archive import create_archive, open_archive
+from .core import (
+    CHUNK_SIZE,
+    DEFAULT_FORMAT,
+    FORMAT_CBC,
+    FORMAT_LEGACY,
+    FORMAT_SEGMENTED,
+    FORMAT_STREAM,
+    FORMATS,
+    decrypt_file,
+    decrypt_stream,
+    default_output_path,
+    encrypt_file,
+    encrypt_stream,
+    process_file,
+    process_file_in_place,
+    read_file_info,
+)
+from .errors import (CancelledError, EncryptorError, FormatError,
+                     SegmentError, TruncatedError, WrongPasswordError)
+from .kdf import DEFAULT_ITERATIONS, derive_key
+from .keys import KeySession
+from .ranges import open_encrypted
+from .resume import encrypt_file_resumable
+
+__all__ = [
+    "CHUNK_SIZE",
+    "DEFAULT_FORMAT",
+    "DEFAULT_ITERATIONS",
+    "FORMAT_CBC",
+    "FORMAT_LEGACY",
+    "FORMAT_SEGMENTED",
+    "FORMAT_STREAM",
+    "FORMATS",
+    "CancelledError",
+    "EncryptorError",
+    "FormatError",
+    "KeySession",
+    "SegmentError",
+    "TruncatedError",
+    "WrongPasswordError",
+    "create_archive",
+    "decrypt_file",
+    "decrypt_stream",
+    "default_output_path",
+    "derive_key",
+    "encrypt_file",
+    "encrypt_file_resumable",
+    "encrypt_stream",
+    "open_archive",
+    "open_encrypted",
+    "process_file",
+    "process_file_in_place",
+    "read_file_info",
+]
+
+__version__ = "2.1"
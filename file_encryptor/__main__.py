@@ -0,0 +1,6 @@
+"""Запуск консольного интерфейса: python -m file_encryptor"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
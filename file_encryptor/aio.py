@@ -0,0 +1,301 @@
+"""Асинхронный API шифрования для сервисов на asyncio
+
+KDF и шифрование сегментов выполняются в пуле потоков, а цикл событий
+только читает и пишет потоки. Пока шифруются уже прочитанные сегменты,
+читается следующий, а запись ждет writer.drain() - медленный получатель
+притормаживает чтение (обратное давление). Семафор ограничивает число
+одновременных задач, а окно depth - число сегментов одной задачи в
+памяти, так что общий объем буферов не превышает
+max_jobs * memory_per_job независимо от числа запросов. Отмененная
+файловая задача держит свой слот, пока поток пула не остановится.
+
+Потоковые функции работают с форматом seg: reader должен поддерживать
+await reader.readexactly(n) (asyncio.StreamReader), writer - write() и
+await writer.drain() (asyncio.StreamWriter).
+"""
+import asyncio
+import os
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import core, header, keys, segmented
+from .errors import EncryptorError, FormatError, SegmentError, TruncatedError
+from .kdf import DEFAULT_ITERATIONS
+from .progress import ProgressTracker, tracker_for
+
+# Сегментов одной задачи в обработке одновременно
+DEFAULT_DEPTH = 2
+# Потоков пула ядра на задачу для файловых функций
+DEFAULT_JOB_WORKERS = 2
+
+
+def default_max_jobs():
+    """Число одновременных задач по умолчанию - по числу ядер"""
+    return os.cpu_count() or 1
+
+
+class AsyncEncryptor:
+    """Асинхронное шифрование с ограничением числа задач и памяти"""
+
+    def __init__(self, max_jobs=None, segment_size=segmented.SEGMENT_SIZE,
+                 depth=DEFAULT_DEPTH, job_workers=DEFAULT_JOB_WORKERS,
+                 executor=None):
+        if depth < 1:
+            raise EncryptorError("Глубина конвейера должна быть не меньше 1")
+        self.max_jobs = max_jobs or default_max_jobs()
+        self.segment_size = segment_size
+        self.depth = depth
+        self.job_workers = job_workers
+        # Семафор на каждый цикл событий: примитивы asyncio привязаны к циклу
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=self.max_jobs * max(depth, job_workers),
+            thread_name_prefix="file_encryptor")
+
+    @property
+    def memory_per_job(self):
+        """Оценка буферов одной потоковой задачи в байтах
+
+        depth сегментов в обработке и один читаемый; у каждого открытый
+        текст и шифртекст.
+        """
+        return (self.depth + 1) * 2 * (self.segment_size + segmented.TAG_SIZE)
+
+    def close(self):
+        """Остановить собственный пул потоков"""
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _limit(self):
+        """Семафор задач для текущего цикла событий"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_jobs)
+        return semaphore
+
+    def _run(self, func, *args):
+        """Выполнить func в пуле потоков"""
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _write_next(self, pending, writer, tracker):
+        """Дождаться старейшего сегмента окна и записать его"""
+        block, size = await pending.popleft()
+        writer.write(block)
+        await writer.drain()
+        tracker.advance(size)
+
+    async def _pipeline(self, blocks, writer, tracker):
+        """Обработать (вызов, размер) из асинхронного генератора blocks окном depth"""
+        pending = deque()
+        try:
+            async for func, args, size in blocks:
+                pending.append(self._wrap(func, args, size))
+                if len(pending) >= self.depth:
+                    await self._write_next(pending, writer, tracker)
+            while pending:
+                await self._write_next(pending, writer, tracker)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _wrap(self, func, args, size):
+        """Задача пула, возвращающая (результат, число байт данных)"""
+        future = self._run(func, *args)
+
+        async def result():
+            return await future, size
+        return asyncio.ensure_future(result())
+
+    async def encrypt_stream(self, reader, writer, password, length,
+                             iterations=DEFAULT_ITERATIONS, session=None,
+                             kdf_params=None, progress=None, cancel=None):
+        """Зашифровать length байт из reader в writer (формат seg)
+
+        Длина нужна заранее: она записывается в заголовок (например,
+        Content-Length загрузки).
+        """
+        async with self._limit():
+            tracker = tracker_for(progress, cancel)
+            tracker.stage("Генерация ключа...")
+            key, prefix, fields = await self._run(
+                segmented.new_header, password, length, iterations,
+                self.segment_size, session, kdf_params)
+            writer.write(header.pack_header(fields))
+
+            segment_size = self.segment_size
+            count = segmented.segment_count(length, segment_size)
+
+            async def blocks():
+                for index in range(count):
+                    size = min(segment_size, length - index * segment_size)
+                    try:
+                        data = await reader.readexactly(size)
+                    except asyncio.IncompleteReadError:
+                        raise EncryptorError("Поток короче заявленной длины")
+                    yield (segmented.encrypt_segment,
+                           (key, prefix, index, index == count - 1, data), size)
+
+            tracker.start("Шифрование данных...", length)
+            await self._pipeline(blocks(), writer, tracker)
+            if tracker is not progress:
+                tracker.finish("Шифрование завершено")
+
+    async def decrypt_stream(self, reader, writer, password, session=None,
+                             progress=None, cancel=None):
+        """Расшифровать один контейнер seg из reader в writer
+
+        Читается ровно один контейнер: данные после него остаются в reader.
+        """
+        async with self._limit():
+            tracker = tracker_for(progress, cancel)
+            fields = await self._read_header(reader)
+            if fields["cipher"] != segmented.CIPHER_NAME or "compression" in fields:
+                raise FormatError("Потоковое дешифрование поддерживает только "
+                                  "формат seg без сжатия")
+
+            tracker.stage("Восстановление ключа...")
+            file_key = await self._run(keys.key_from_header, fields, password, session)
+            key = keys.data_key(file_key)
+            prefix = segmented.check_header(fields)
+            segment_size = fields["segment_size"]
+            length = fields["length"]
+            count = segmented.segment_count(length, segment_size)
+
+            async def blocks():
+                for index in range(count):
+                    size = min(segment_size, length - index * segment_size)
+                    try:
+                        data = await reader.readexactly(size + segmented.TAG_SIZE)
+                    except asyncio.IncompleteReadError:
+                        raise TruncatedError("Файл поврежден: данные обрезаны")
+                    yield (segmented.decrypt_segment,
+                           (key, prefix, index, index == count - 1, data), size)
+
+            tracker.start("Дешифрование данных...", length)
+            try:
+                await self._pipeline(blocks(), writer, tracker)
+            except SegmentError as e:
+                raise segmented.segment_failure(e, fields)
+            if tracker is not progress:
+                tracker.finish("Дешифрование завершено")
+
+    async def _read_header(self, reader):
+        """Прочитать и проверить заголовок FENC из reader"""
+        try:
+            prefix = await reader.readexactly(header.PREFIX_SIZE)
+            body = await reader.readexactly(header.parse_prefix(prefix))
+        except asyncio.IncompleteReadError:
+            raise FormatError("Неверный формат файла")
+        fields = header.parse_body(body)
+        core.check_fenc_fields(fields)
+        return fields
+
+    async def encrypt_file(self, input_path, output_path, password,
+                           iterations=DEFAULT_ITERATIONS, fmt=core.DEFAULT_FORMAT,
+                           session=None, kdf_params=None, progress=None,
+                           cancel=None):
+        """Зашифровать файл в пуле потоков (все форматы ядра)
+
+        Внутри задачи ядро использует job_workers потоков, так что чтение
+        диска перекрывается с шифрованием.
+        """
+        await self._file_job(lambda stop: core.encrypt_file(
+            input_path, output_path, password, iterations, progress, fmt,
+            self.job_workers, session, kdf_params, stop), progress, cancel)
+
+    async def decrypt_file(self, input_path, output_path, password,
+                           iterations=DEFAULT_ITERATIONS, session=None,
+                           progress=None, cancel=None):
+        """Расшифровать файл в пуле потоков (все форматы ядра)"""
+        await self._file_job(lambda stop: core.decrypt_file(
+            input_path, output_path, password, iterations, progress,
+            self.job_workers, session, stop), progress, cancel)
+
+    async def _file_job(self, func, progress, cancel):
+        """Выполнить func(флаг отмены) в пуле, занимая слот семафора
+
+        Отмена корутины не прерывает поток пула: она устанавливает флаг,
+        который ядро проверяет на каждом блоке, а слот освобождается,
+        только когда поток действительно завершится.
+        """
+        if isinstance(progress, ProgressTracker):
+            # Готовый трекер ядро использует как есть, со своим флагом
+            stop = progress.cancel = _JobCancel(progress.cancel)
+        else:
+            stop = _JobCancel(cancel)
+        semaphore = self._limit()
+        await semaphore.acquire()
+        try:
+            future = self._run(func, stop)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def finished(future):
+            semaphore.release()
+            if not future.cancelled():
+                # Результат после отмены никто не ждет: без этого asyncio
+                # сообщит о непрочитанном исключении
+                future.exception()
+
+        future.add_done_callback(finished)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+
+
+class _JobCancel:
+    """Флаг отмены задачи: отмена корутины или флаг вызывающего"""
+
+    def __init__(self, cancel=None):
+        self._cancel = cancel
+        self._event = threading.Event()
+
+    def set(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set() or (self._cancel is not None and self._cancel.is_set())
+
+
+_default = None
+
+
+def default_encryptor():
+    """Общий экземпляр AsyncEncryptor с параметрами по умолчанию"""
+    global _default
+    if _default is None:
+        _default = AsyncEncryptor()
+    return _default
+
+
+async def encrypt_stream(reader, writer, password, length, **kwargs):
+    """AsyncEncryptor.encrypt_stream общего экземпляра"""
+    await default_encryptor().encrypt_stream(reader, writer, password, length, **kwargs)
+
+
+async def decrypt_stream(reader, writer, password, **kwargs):
+    """AsyncEncryptor.decrypt_stream общего экземпляра"""
+    await default_encryptor().decrypt_stream(reader, writer, password, **kwargs)
+
+
+async def encrypt_file(input_path, output_path, password, **kwargs):
+    """AsyncEncryptor.encrypt_file общего экземпляра"""
+    await default_encryptor().encrypt_file(input_path, output_path, password, **kwargs)
+
+
+async def decrypt_file(input_path, output_path, password, **kwargs):
+    """AsyncEncryptor.decrypt_file общего экземпляра"""
+    await default_encryptor().decrypt_file(input_path, output_path, password, **kwargs)
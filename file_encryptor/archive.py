@@ -0,0 +1,286 @@
+"""Зашифрованный архив: много файлов в одном контейнере FENC
+
+Структура:
+    заголовок FENC (type=archive: KDF, соль, проверочное значение,
+    размер сегмента, nonce индекса)
+    данные файлов - сегменты AES-256-GCM, как в формате seg; у каждого
+    файла свой случайный ключ и префикс nonce
+    индекс - JSON (пути, смещения, размеры, ключи файлов), зашифрованный
+    одним сегментом GCM ключом архива
+    окончание (24 байта): FIDX + смещение индекса + размер индекса
+
+KDF выполняется один раз на архив. Окончание находится в конце файла,
+поэтому для списка файлов расшифровывается только индекс, а для
+извлечения одного файла - индекс и сегменты этого файла.
+"""
+import json
+import os
+import posixpath
+import struct
+
+from Crypto.Random import get_random_bytes
+
+from . import fsutil, header, keys, segmented
+from .errors import EncryptorError, FormatError, SegmentError, TruncatedError
+from .kdf import DEFAULT_ITERATIONS
+from .progress import tracker_for
+
+INDEX_VERSION = 1
+TRAILER_MAGIC = b'FIDX'
+_TRAILER = struct.Struct(">4sQQ")
+TRAILER_SIZE = _TRAILER.size
+
+MEMBER_KEY_SIZE = 32
+# Защита от чтения огромного "индекса" из поврежденного файла
+MAX_INDEX_SIZE = 256 * 1024 * 1024
+
+
+class Member:
+    """Запись индекса архива"""
+
+    def __init__(self, name, offset, size, key, nonce, mtime=None, mode=None):
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.key = key
+        self.nonce = nonce
+        self.mtime = mtime
+        self.mode = mode
+
+    def to_dict(self):
+        """Представление для индекса"""
+        return {
+            "name": self.name,
+            "offset": self.offset,
+            "size": self.size,
+            "key": header.b64encode(self.key),
+            "nonce": header.b64encode(self.nonce),
+            "mtime": self.mtime,
+            "mode": self.mode,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из индекса с проверкой полей"""
+        try:
+            member = cls(data["name"], data["offset"], data["size"],
+                         header.b64decode(data["key"]),
+                         header.b64decode(data["nonce"]),
+                         data.get("mtime"), data.get("mode"))
+        except (KeyError, TypeError):
+            raise FormatError("Архив поврежден: неверная запись индекса")
+        if (not isinstance(member.name, str) or not isinstance(member.offset, int)
+                or not isinstance(member.size, int) or member.offset < 0
+                or member.size < 0 or len(member.key) != MEMBER_KEY_SIZE
+                or len(member.nonce) != segmented.NONCE_PREFIX_SIZE):
+            raise FormatError("Архив поврежден: неверная запись индекса")
+        return member
+
+    def __repr__(self):
+        return f"Member({self.name!r}, {self.size})"
+
+
+def member_name(path, root=None):
+    """Имя файла в архиве: относительный путь с разделителем /"""
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    return relative.replace(os.sep, "/")
+
+
+def safe_path(dest_dir, name):
+    """Путь извлечения внутри dest_dir; абсолютные пути и .. запрещены"""
+    normalized = posixpath.normpath(name)
+    if (not name or normalized.startswith(("/", "../")) or normalized == ".."
+            or "\\" in name or ":" in normalized.split("/")[0]):
+        raise FormatError(f"Недопустимое имя в архиве: {name}")
+    return os.path.join(dest_dir, *normalized.split("/"))
+
+
+def _body_size(size, segment_size):
+    """Размер зашифрованных данных файла"""
+    return segmented.body_size({"length": size, "segment_size": segment_size})
+
+
+def create_archive(output_path, files, password, iterations=DEFAULT_ITERATIONS,
+                   progress=None, workers=None, session=None, kdf_params=None,
+                   segment_size=segmented.SEGMENT_SIZE, cancel=None):
+    """Упаковать файлы в зашифрованный архив
+
+    files - список (путь, имя в архиве). Возвращает список Member.
+    """
+    tracker = tracker_for(progress, cancel)
+    workers = workers or segmented.default_workers()
+    if not 0 < segment_size <= header.MAX_SEGMENT_SIZE:
+        raise EncryptorError("Недопустимый размер сегмента")
+    names = set()
+    for _, name in files:
+        if name in names:
+            raise EncryptorError(f"Повторяющееся имя в архиве: {name}")
+        names.add(name)
+        safe_path(".", name)
+
+    tracker.stage("Генерация ключа...")
+    archive_key, fields = keys.new_file_keys(password, iterations, kdf_params, session)
+    index_prefix = get_random_bytes(segmented.NONCE_PREFIX_SIZE)
+    fields.update({
+        "type": header.TYPE_ARCHIVE,
+        "cipher": segmented.CIPHER_NAME,
+        "segment_size": segment_size,
+        "index_nonce": header.b64encode(index_prefix),
+    })
+
+    total = sum(os.path.getsize(path) for path, _ in files)
+    members = []
+    try:
+        with open(output_path, 'wb') as dst:
+            header.write_header(dst, fields)
+            tracker.start("Шифрование архива...", total)
+            for path, name in files:
+                with open(path, 'rb') as src:
+                    stat = os.fstat(src.fileno())
+                    member = Member(name, dst.tell(), stat.st_size,
+                                    get_random_bytes(MEMBER_KEY_SIZE),
+                                    get_random_bytes(segmented.NONCE_PREFIX_SIZE),
+                                    stat.st_mtime, stat.st_mode & 0o777)
+                    for _ in segmented.encrypt_body(src, dst, keys.data_key(member.key),
+                                                    member.nonce, member.size,
+                                                    segment_size, tracker, workers):
+                        pass
+                members.append(member)
+
+            index = json.dumps({"version": INDEX_VERSION,
+                                "members": [m.to_dict() for m in members]},
+                               separators=(',', ':')).encode('utf-8')
+            index_offset = dst.tell()
+            block = segmented.encrypt_segment(keys.data_key(archive_key), index_prefix,
+                                              0, True, index)
+            dst.write(block)
+            dst.write(_TRAILER.pack(TRAILER_MAGIC, index_offset, len(block)))
+    except BaseException:
+        fsutil.remove_quietly(output_path)
+        raise
+    if tracker is not progress:
+        tracker.finish("Архив создан")
+    return members
+
+
+class Archive:
+    """Открытый для чтения архив: список файлов и извлечение по одному"""
+
+    def __init__(self, path, password, session=None):
+        self.path = path
+        fsutil.recover(path)
+        self._file = open(path, 'rb')
+        try:
+            self._load(password, session)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _load(self, password, session):
+        """Прочитать заголовок, проверить пароль и расшифровать индекс"""
+        src = self._file
+        fields, header_size = header.read_header(src)
+        if fields.get("type") != header.TYPE_ARCHIVE:
+            raise FormatError("Файл не является архивом")
+        if fields.get("cipher") != segmented.CIPHER_NAME:
+            raise FormatError(f"Неподдерживаемый шифр: {fields.get('cipher')}")
+        segment_size = fields.get("segment_size")
+        if not isinstance(segment_size, int) or not 0 < segment_size <= header.MAX_SEGMENT_SIZE:
+            raise FormatError("Файл поврежден: неверный размер сегмента")
+        header.check_kdf(fields)
+        keys.check_key_fields(fields)
+        index_prefix = header.b64decode(fields.get("index_nonce", ""))
+        if len(index_prefix) != segmented.NONCE_PREFIX_SIZE:
+            raise FormatError("Файл поврежден: неверный nonce индекса")
+
+        # Окончание проверяется до KDF: обрезанный архив отклоняется сразу
+        file_size = os.fstat(src.fileno()).st_size
+        if file_size < header_size + TRAILER_SIZE:
+            raise TruncatedError("Архив поврежден: нет индекса")
+        src.seek(file_size - TRAILER_SIZE)
+        magic, index_offset, index_size = _TRAILER.unpack(src.read(TRAILER_SIZE))
+        if (magic != TRAILER_MAGIC or index_size > MAX_INDEX_SIZE
+                or index_size < segmented.TAG_SIZE
+                or index_offset < header_size
+                or index_offset + index_size != file_size - TRAILER_SIZE):
+            raise FormatError("Архив поврежден: неверное окончание")
+
+        archive_key = keys.key_from_header(fields, password, session)
+        src.seek(index_offset)
+        try:
+            index = segmented.decrypt_segment(keys.data_key(archive_key), index_prefix,
+                                              0, True, src.read(index_size))
+        except SegmentError:
+            raise FormatError("Архив поврежден: индекс не прошел проверку")
+        try:
+            data = json.loads(index.decode('utf-8'))
+            entries = data["members"]
+        except (ValueError, KeyError, TypeError):
+            raise FormatError("Архив поврежден: индекс не читается")
+
+        self.segment_size = segment_size
+        self.members = [Member.from_dict(entry) for entry in entries]
+        self._by_name = {member.name: member for member in self.members}
+        for member in self.members:
+            end = member.offset + _body_size(member.size, segment_size)
+            if member.offset < header_size or end > index_offset:
+                raise FormatError(f"Архив поврежден: неверное смещение {member.name}")
+
+    def names(self):
+        """Имена файлов в порядке упаковки"""
+        return [member.name for member in self.members]
+
+    def get(self, name):
+        """Запись индекса по имени"""
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise EncryptorError(f"Файл не найден в архиве: {name}")
+
+    def extract_to(self, name, dst, progress=None, workers=None, cancel=None):
+        """Расшифровать один файл в поток dst; читаются только его сегменты"""
+        member = self.get(name)
+        tracker = tracker_for(progress, cancel)
+        fields = {"nonce": header.b64encode(member.nonce),
+                  "segment_size": self.segment_size, "length": member.size}
+        self._file.seek(member.offset)
+        # Ключ файла взят из индекса, который прошел проверку: ошибка
+        # сегмента - повреждение, а не неверный пароль
+        segmented.decrypt_body(self._file, dst, fields, member.key, tracker,
+                               workers, check_end=False, key_verified=True)
+
+    def extract(self, name, dest_dir=".", progress=None, workers=None, cancel=None):
+        """Извлечь файл в каталог dest_dir с сохранением пути; возвращает путь"""
+        member = self.get(name)
+        output_path = safe_path(dest_dir, member.name)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        try:
+            with open(output_path, 'wb') as dst:
+                self.extract_to(name, dst, progress, workers, cancel)
+        except BaseException:
+            fsutil.remove_quietly(output_path)
+            raise
+        if member.mode is not None:
+            os.chmod(output_path, member.mode)
+        if member.mtime is not None:
+            os.utime(output_path, (member.mtime, member.mtime))
+        return output_path
+
+    def extract_all(self, dest_dir=".", progress=None, workers=None, cancel=None):
+        """Извлечь все файлы; возвращает список путей"""
+        return [self.extract(name, dest_dir, progress, workers, cancel)
+                for name in self.names()]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_archive(path, password, session=None):
+    """Открыть архив для чтения (проверяет пароль и расшифровывает индекс)"""
+    return Archive(path, password, session)
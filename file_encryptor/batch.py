@@ -0,0 +1,167 @@
+"""Пакетная обработка файлов и каталогов пулом потоков или процессов"""
+import glob
+import os
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from . import core, mmapio
+from .keys import KeySession
+from .errors import CancelledError, EncryptorError
+from .kdf import DEFAULT_ITERATIONS
+
+
+class FileResult:
+    """Результат обработки одного файла пакета"""
+
+    def __init__(self, path, output, size, error=None):
+        self.path = path
+        self.output = output
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"FileResult({self.path!r}, {status})"
+
+
+def collect_files(inputs, recursive=True):
+    """Развернуть файлы, каталоги и glob-шаблоны в список (путь, корень)
+
+    Корень - каталог, относительно которого путь повторяется в выходном
+    дереве; для отдельных файлов это их собственный каталог.
+    """
+    found = []
+    seen = set()
+
+    def add(path, root):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            found.append((path, root))
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, dirnames, filenames in os.walk(item):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    add(os.path.join(dirpath, name), item)
+                if not recursive:
+                    break
+        elif os.path.isfile(item):
+            add(item, os.path.dirname(item))
+        else:
+            matches = sorted(glob.glob(item, recursive=recursive))
+            if not matches:
+                raise EncryptorError(f"Файл не найден: {item}")
+            for path in matches:
+                if os.path.isfile(path):
+                    add(path, os.path.dirname(path))
+    return found
+
+
+def output_path_for(path, root, encrypt=True, output_root=None):
+    """Выходной путь: рядом с исходным или в зеркальном дереве output_root"""
+    if output_root is None:
+        return core.default_output_path(path, encrypt)
+    relative = os.path.relpath(path, root or os.path.dirname(path))
+    return os.path.join(output_root, relative)
+
+
+def _process_one(path, output, password, encrypt, in_place, options,
+                 session=None, backup=True, cancel=None):
+    """Обработать один файл; выполняется в рабочем потоке или процессе"""
+    size = 0
+    try:
+        size = os.path.getsize(path)
+        if in_place:
+            core.process_file_in_place(path, password, encrypt,
+                                       session=session, backup=backup,
+                                       cancel=cancel, **options)
+        elif os.path.abspath(output) == os.path.abspath(path):
+            raise EncryptorError("Выходной файл совпадает с исходным")
+        else:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            core.process_file(path, output, password, encrypt,
+                              session=session, cancel=cancel, **options)
+    except CancelledError:
+        raise
+    except Exception as e:
+        # Любая ошибка файла (в том числе непредвиденная, например ValueError
+        # из поврежденного заголовка) не прерывает пакет
+        return FileResult(path, output, size, str(e) or type(e).__name__)
+    return FileResult(path, output, size)
+
+
+def run_batch(files, password, encrypt=True, iterations=DEFAULT_ITERATIONS,
+              fmt=core.DEFAULT_FORMAT, jobs=None, use_processes=False,
+              output_root=None, in_place=False, progress=None, session=None,
+              kdf_params=None, backup=True, cancel=None, io_mode=mmapio.IO_AUTO,
+              compression=None):
+    """Обработать список (путь, корень) параллельно
+
+    Ошибка одного файла не прерывает пакет. progress(done, total, result)
+    вызывается после каждого файла с числом обработанных и общим числом байт.
+    Для пула потоков создается общая сессия ключей (keys.KeySession), и
+    PBKDF2 выполняется один раз на пакет; ключи процессов не разделяются.
+    После установки cancel (threading.Event) новые файлы не запускаются,
+    а обрабатываемые прерываются (только пул потоков), и выбрасывается
+    CancelledError. Возвращает список FileResult в порядке завершения.
+    """
+    if session is None and not use_processes:
+        with KeySession(password, iterations, kdf_params=kdf_params) as own_session:
+            return run_batch(files, password, encrypt, iterations, fmt, jobs,
+                             use_processes, output_root, in_place, progress,
+                             own_session, kdf_params, backup, cancel, io_mode,
+                             compression)
+
+    jobs = jobs or os.cpu_count() or 1
+    # Внутри файла - один поток, параллелизм обеспечивает пул пакета
+    options = {"iterations": iterations, "fmt": fmt, "workers": 1,
+               "io_mode": io_mode}
+    if encrypt:
+        options["kdf_params"] = kdf_params
+        options["compression"] = compression
+
+    tasks = []
+    total = 0
+    for path, root in files:
+        output = path if in_place else output_path_for(path, root, encrypt, output_root)
+        tasks.append((path, output))
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    results = []
+    done_bytes = 0
+    with executor_class(max_workers=jobs) as pool:
+        # Ограниченное окно задач, чтобы не держать в очереди весь список
+        queue = iter(tasks)
+        pending = set()
+        while True:
+            for path, output in queue:
+                if cancel is not None and cancel.is_set():
+                    break
+                pending.add(pool.submit(_process_one, path, output, password,
+                                        encrypt, in_place, options,
+                                        None if use_processes else session,
+                                        backup, None if use_processes else cancel))
+                if len(pending) >= jobs * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                results.append(result)
+                done_bytes += result.size
+                if progress is not None:
+                    progress(done_bytes, total, result)
+    if cancel is not None and cancel.is_set():
+        raise CancelledError("Операция отменена")
+    return results
@@ -0,0 +1,212 @@
+"""Замер производительности шифрования
+
+Прогоняет шифрование и дешифрование синтетических файлов по сетке
+параметров (формат, размер блока, число потоков, итерации PBKDF2,
+режим ввода-вывода: буферизованный или mmap) и
+возвращает результаты в виде JSON, пригодного для сравнения версий.
+Каждый вариант выполняется в отдельном процессе, чтобы пиковый RSS
+относился только к нему.
+"""
+import itertools
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import Crypto
+
+from . import core, mmapio, segmented
+from .kdf import derive_key
+from .progress import MB
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_PASSWORD = "benchmark-password"
+_PATTERN_SIZE = 1024 * 1024
+
+
+def peak_rss_kb():
+    """Пиковый RSS текущего процесса в КБ (None, если недоступно)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class SyntheticReader:
+    """Поток заданной длины без хранения данных в памяти"""
+
+    def __init__(self, size):
+        self._pattern = os.urandom(_PATTERN_SIZE)
+        self._size = size
+        self._position = 0
+
+    def read(self, n=-1):
+        remaining = self._size - self._position
+        if n < 0 or n > remaining:
+            n = remaining
+        parts = []
+        offset = self._position % _PATTERN_SIZE
+        left = n
+        while left:
+            piece = self._pattern[offset:offset + left]
+            parts.append(piece)
+            left -= len(piece)
+            offset = 0
+        self._position += n
+        return b"".join(parts)
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position,
+                os.SEEK_END: self._size}[whence]
+        self._position = max(0, min(self._size, base + offset))
+        return self._position
+
+
+class NullWriter:
+    """Приемник, отбрасывающий данные"""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+
+def make_input(path, size):
+    """Создать файл из случайных данных заданного размера"""
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(remaining, _PATTERN_SIZE))
+            f.write(block)
+            remaining -= len(block)
+
+
+def _timed(func, *args, **kwargs):
+    """Выполнить функцию и вернуть время в секундах"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _copy(src_path, dst_path, chunk_size):
+    """Простое копирование блоками - базовая линия ввода-вывода"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            dst.write(chunk)
+
+
+def _rate(size, seconds):
+    """Пропускная способность в МБ/с"""
+    return round(size / MB / seconds, 2) if seconds > 0 else None
+
+
+def run_case(input_path, work_dir, size, fmt, chunk_size, workers, iterations,
+             io_mode=mmapio.IO_AUTO):
+    """Замер одного варианта параметров; выполняется в отдельном процессе"""
+    encrypted = os.path.join(work_dir, f"bench_{os.getpid()}.enc")
+    decrypted = os.path.join(work_dir, f"bench_{os.getpid()}.dec")
+    options = {"fmt": fmt, "workers": workers, "chunk_size": chunk_size}
+    try:
+        kdf_s = _timed(derive_key, BENCH_PASSWORD, iterations=iterations)
+
+        # Шифр без диска: синтетический поток -> пустой приемник
+        cipher_s = _timed(core.encrypt_stream, SyntheticReader(size), NullWriter(),
+                          BENCH_PASSWORD, iterations, **options) - kdf_s
+
+        io_s = _timed(_copy, input_path, decrypted, chunk_size)
+
+        with open(input_path, 'rb') as src, open(encrypted, 'w+b') as dst:
+            encrypt_s = _timed(core.encrypt_stream, src, dst, BENCH_PASSWORD,
+                               iterations, io_mode=io_mode, **options)
+        with open(encrypted, 'rb') as src, open(decrypted, 'w+b') as dst:
+            decrypt_s = _timed(core.decrypt_stream, src, dst, BENCH_PASSWORD,
+                               iterations, workers=workers, chunk_size=chunk_size,
+                               io_mode=io_mode)
+
+        return {
+            "format": fmt,
+            "size": size,
+            "chunk_size": chunk_size,
+            "workers": workers,
+            "iterations": iterations,
+            "io_mode": io_mode,
+            "stages": {
+                "kdf_s": round(kdf_s, 6),
+                "cipher_s": round(max(cipher_s, 0.0), 6),
+                "io_copy_s": round(io_s, 6),
+            },
+            "encrypt_s": round(encrypt_s, 6),
+            "decrypt_s": round(decrypt_s, 6),
+            "cipher_mbps": _rate(size, cipher_s),
+            "io_copy_mbps": _rate(size, io_s),
+            "encrypt_mbps": _rate(size, encrypt_s),
+            "decrypt_mbps": _rate(size, decrypt_s),
+            "output_size": os.path.getsize(encrypted),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+    finally:
+        for path in (encrypted, decrypted):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_benchmark(sizes, formats=core.FORMATS, chunk_sizes=(core.CHUNK_SIZE,),
+                  workers=(1,), iterations=(10000,), work_dir=None, progress=None,
+                  io_modes=(mmapio.IO_AUTO,)):
+    """Прогнать сетку параметров; возвращает словарь для JSON"""
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="file_encryptor_bench_")
+    results = []
+    try:
+        for size in sizes:
+            input_path = os.path.join(work_dir, f"bench_input_{size}")
+            make_input(input_path, size)
+            try:
+                for case in itertools.product(formats, chunk_sizes, workers, iterations,
+                                              io_modes):
+                    fmt, chunk_size, worker_count, iteration_count, io_mode = case
+                    # Многопоточность и mmap влияют только на формат seg
+                    if fmt != core.FORMAT_SEGMENTED and (worker_count != workers[0]
+                                                         or io_mode != io_modes[0]):
+                        continue
+                    # Отдельный процесс на вариант - честный пиковый RSS
+                    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                        result = pool.apply(run_case, (input_path, work_dir, size,
+                                                       fmt, chunk_size, worker_count,
+                                                       iteration_count, io_mode))
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+            finally:
+                os.remove(input_path)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pycryptodome": Crypto.__version__,
+        "cpu_count": os.cpu_count(),
+        "default_segment_size": segmented.SEGMENT_SIZE,
+        "mmap_threshold": mmapio.MMAP_THRESHOLD,
+        "results": results,
+    }
@@ -0,0 +1,807 @@
+"""Консольный интерфейс: python -m file_encryptor encrypt|decrypt|batch|archive|verify"""
+import argparse
+import getpass
+import json
+import os
+import sys
+import time
+
+from . import (archive, batch, bench, compress, core, dedup, fsutil, incremental, kdf,
+               keys, metrics, mmapio, progress, ranges, rekey, resume, verify, watch)
+
+# Переменная окружения с паролем для неинтерактивного запуска
+PASSWORD_ENV = "FILE_ENCRYPTOR_PASSWORD"
+
+
+def read_password(args, confirm=False):
+    """Получить пароль из файла-ключа, аргументов, окружения или с терминала"""
+    if getattr(args, "keyfile", None):
+        return keys.keyfile_password(args.keyfile)
+    if args.password_file:
+        with open(args.password_file, 'r', encoding='utf-8') as f:
+            return f.readline().rstrip('\r\n')
+    if os.environ.get(PASSWORD_ENV):
+        return os.environ[PASSWORD_ENV]
+
+    password = getpass.getpass("Пароль: ")
+    if confirm and getpass.getpass("Подтверждение: ") != password:
+        raise core.EncryptorError("Пароли не совпадают")
+    return password
+
+
+def print_progress(event):
+    """Прогресс-бар в stderr: байты, скорость и оставшееся время"""
+    if event.stage == progress.STAGE_DATA:
+        filled = int(event.percent * 30 / 100)
+        bar = "#" * filled + "-" * (30 - filled)
+        rate = f"{event.rate / 1024 ** 2:.1f} МБ/с" if event.rate else "-- МБ/с"
+        total = format_size(event.total) if event.total else "?"
+        line = (f"[{bar}] {event.percent:5.1f}% {format_size(event.done)} / {total} "
+                f"{rate} ETA {progress.format_eta(event.eta)}")
+    else:
+        line = event.status
+    end = "\n" if event.stage == progress.STAGE_DONE else ""
+    print("\r" + line.ljust(79), end=end, file=sys.stderr, flush=True)
+
+
+def print_progress_json(event):
+    """События прогресса в stderr построчно в JSON"""
+    print(json.dumps(event.to_dict(), ensure_ascii=False), file=sys.stderr, flush=True)
+
+
+PROGRESS_PRINTERS = {"bar": print_progress, "json": print_progress_json}
+
+
+def run_pipe(path, output, password, encrypt, args, on_progress):
+    """Шифрование из stdin и/или в stdout ("-" вместо пути)"""
+    if args.in_place or getattr(args, "resume", False):
+        raise core.EncryptorError("stdin/stdout несовместимы с --in-place и --resume")
+    if output is None:
+        output = "-" if path == "-" else core.default_output_path(path, encrypt)
+    fmt = args.format
+    if path == "-" and fmt == core.DEFAULT_FORMAT:
+        # Длина stdin неизвестна: по умолчанию - потоковый формат
+        fmt = core.FORMAT_STREAM
+    src = sys.stdin.buffer if path == "-" else open(path, 'rb')
+    try:
+        dst = sys.stdout.buffer if output == "-" else open(output, 'wb')
+        try:
+            if encrypt:
+                core.encrypt_stream(src, dst, password, args.iterations, on_progress, fmt,
+                                    args.workers, kdf_params=args.kdf_params,
+                                    compression=args.compress)
+            else:
+                core.decrypt_stream(src, dst, password, args.iterations, on_progress,
+                                    args.workers)
+            dst.flush()
+        except BaseException:
+            if output != "-":
+                dst.close()
+                fsutil.remove_quietly(output)
+            raise
+        finally:
+            if output != "-":
+                dst.close()
+    finally:
+        if path != "-":
+            src.close()
+    return output
+
+
+def run_one(path, output, password, encrypt, args):
+    """Обработать один файл согласно аргументам командной строки"""
+    mode = args.progress or ("bar" if args.verbose else None)
+    on_progress = PROGRESS_PRINTERS.get(mode)
+    if path == "-" or output == "-":
+        return run_pipe(path, output, password, encrypt, args, on_progress)
+    if args.in_place:
+        if getattr(args, "resume", False):
+            raise core.EncryptorError("--resume несовместим с --in-place")
+        core.process_file_in_place(path, password, encrypt,
+                                   args.iterations, on_progress,
+                                   args.format, args.workers,
+                                   kdf_params=args.kdf_params,
+                                   backup=not args.no_backup, io_mode=args.io,
+                                   compression=args.compress)
+        return path
+    output = output or core.default_output_path(path, encrypt)
+    if getattr(args, "resume", False):
+        if args.format != core.FORMAT_SEGMENTED:
+            raise core.EncryptorError("--resume поддерживает только формат seg")
+        if args.compress:
+            raise core.EncryptorError("--resume несовместим с --compress")
+        start = resume.encrypt_file_resumable(path, output, password,
+                                              args.iterations, on_progress,
+                                              args.workers, kdf_params=args.kdf_params)
+        if start:
+            print(f"Продолжено с сегмента {start}", file=sys.stderr)
+        return output
+    core.process_file(path, output, password, encrypt,
+                      args.iterations, on_progress, args.format, args.workers,
+                      kdf_params=args.kdf_params, io_mode=args.io,
+                      compression=args.compress)
+    return output
+
+
+def kdf_params_from_args(args):
+    """Параметры KDF для шифрования: заданные или откалиброванные"""
+    if args.kdf == kdf.KDF_SCRYPT:
+        if args.calibrate:
+            return kdf.calibrate_scrypt(args.calibrate)
+        return kdf.scrypt_params(args.scrypt_n)
+    if args.calibrate:
+        args.iterations = kdf.calibrate_iterations(args.calibrate)
+    return kdf.pbkdf2_params(args.iterations)
+
+
+def cmd_info(args):
+    """Команда info: параметры зашифрованного файла из заголовка"""
+    print(json.dumps(core.read_file_info(args.input), indent=2, ensure_ascii=False))
+    return 0
+
+
+def cmd_dedup(args):
+    """Команда dedup: init, backup, list, restore"""
+    if args.action == "init":
+        password = read_password(args, confirm=True)
+        dedup.init_store(args.store, password, kdf_params=kdf_params_from_args(args))
+        print(f"Хранилище создано: {args.store}")
+        return 0
+
+    password = read_password(args)
+    store = dedup.open_store(args.store, password)
+    on_progress = PROGRESS_PRINTERS.get(getattr(args, "progress", None)
+                                        or ("bar" if getattr(args, "verbose", False) else None))
+    if args.action == "backup":
+        files = [(path, archive.member_name(path, root))
+                 for path, root in batch.collect_files(args.inputs,
+                                                       recursive=not args.no_recursive)]
+        result = store.backup(files, args.name, on_progress, args.workers)
+        print(f"Снимок {result.snapshot}: файлов {result.files}, фрагментов "
+              f"{result.chunks}, новых {result.new_chunks} "
+              f"({format_size(result.new_size)} из {format_size(result.size)})")
+    elif args.action == "list":
+        if args.snapshot:
+            for entry in store.manifest(args.snapshot)["files"]:
+                print(f"{format_size(entry['size']):>10}  {entry['name']}")
+        else:
+            for name in store.snapshots():
+                print(name)
+    else:
+        for path in store.restore(args.snapshot, args.directory, args.members,
+                                  on_progress, args.workers):
+            print(f"Файл сохранен: {path}")
+    return 0
+
+
+def read_new_password(args):
+    """Новый пароль для команды passwd: файл-ключ, файл или запрос"""
+    if args.new_keyfile:
+        return keys.keyfile_password(args.new_keyfile)
+    if args.new_password_file:
+        with open(args.new_password_file, 'r', encoding='utf-8') as f:
+            return f.readline().rstrip('\r\n')
+    password = getpass.getpass("Новый пароль: ")
+    if getpass.getpass("Подтверждение: ") != password:
+        raise core.EncryptorError("Пароли не совпадают")
+    return password
+
+
+def cmd_passwd(args):
+    """Команда passwd: сменить, добавить или удалить пароль без перешифрования"""
+    password = read_password(args)
+    if args.remove:
+        left = rekey.remove_password(args.input, password)
+        print(f"Пароль удален, осталось паролей: {left}")
+        return 0
+    new_password = read_new_password(args)
+    kdf_params = kdf_params_from_args(args)
+    if args.add:
+        total = rekey.add_password(args.input, password, new_password, args.iterations,
+                                   kdf_params)
+        print(f"Пароль добавлен, всего паролей: {total}")
+    else:
+        rekey.change_password(args.input, password, new_password, args.iterations,
+                              kdf_params)
+        print("Пароль изменен")
+    return 0
+
+
+def cmd_update(args):
+    """Команда update: перешифровать только изменившиеся сегменты"""
+    password = read_password(args, confirm=not os.path.exists(args.output))
+    kdf_params = kdf_params_from_args(args)
+    on_progress = PROGRESS_PRINTERS.get(args.progress or ("bar" if args.verbose else None))
+    result = incremental.update_file(args.input, args.output, password, args.iterations,
+                                     on_progress, args.workers, kdf_params=kdf_params,
+                                     atomic=not args.in_place)
+    print(f"Файл сохранен: {args.output} (перезаписано сегментов: "
+          f"{result.changed} из {result.total})")
+    return 0
+
+
+def cmd_read(args):
+    """Команда read: расшифровать диапазон байт без дешифрования всего файла"""
+    if args.offset < 0 or (args.length is not None and args.length < 0):
+        raise core.EncryptorError("Смещение и длина не могут быть отрицательными")
+    password = read_password(args)
+    with ranges.open_encrypted(args.input, password) as f:
+        size = max(0, f.length - args.offset) if args.length is None else args.length
+        # Порциями: весь диапазон в памяти не держится
+        if args.output:
+            with open(args.output, 'wb') as out:
+                f.copy_range(args.offset, size, out)
+        else:
+            f.copy_range(args.offset, size, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+    return 0
+
+
+def cmd_calibrate(args):
+    """Команда calibrate: подобрать стоимость KDF под целевое время"""
+    rate = kdf.pbkdf2_rate()
+    iterations = kdf.calibrate_iterations(args.target_ms, rate)
+    scrypt = kdf.calibrate_scrypt(args.target_ms)
+    report = {
+        "target_ms": args.target_ms,
+        "pbkdf2_iterations_per_second": int(rate),
+        "pbkdf2": dict(kdf.pbkdf2_params(iterations),
+                       estimated_ms=round(iterations / rate * 1000)),
+        "scrypt": dict(scrypt,
+                       estimated_ms=round(kdf.estimate_seconds(scrypt) * 1000),
+                       memory=kdf.scrypt_memory(scrypt["n"], scrypt["r"], scrypt["p"])),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_single(args, encrypt):
+    """Команды encrypt/decrypt"""
+    password = read_password(args, confirm=encrypt)
+    output = run_one(args.input, args.output, password, encrypt, args)
+    if output != "-":
+        print(f"Файл сохранен: {output}")
+    return 0
+
+
+def format_size(size):
+    """Размер в человекочитаемом виде"""
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def print_batch_progress(done, total, result):
+    """Общий прогресс-бар пакета (байты) и строка результата по файлу"""
+    # Стереть строку прогресс-бара перед выводом результата
+    print("\r" + " " * 79 + "\r", end="", file=sys.stderr, flush=True)
+    if result.ok:
+        print(f"OK    {result.path} -> {result.output}", flush=True)
+    else:
+        print(f"FAIL  {result.path}: {result.error}", flush=True)
+    fraction = done / total if total else 1.0
+    filled = int(fraction * 30)
+    bar = "#" * filled + "-" * (30 - filled)
+    print(f"[{bar}] {fraction:6.1%} {format_size(done)} / {format_size(total)}",
+          end="", file=sys.stderr, flush=True)
+
+
+def cmd_batch(args):
+    """Команда batch: файлы, каталоги и glob-шаблоны пулом потоков/процессов"""
+    encrypt = args.mode == "encrypt"
+    files = batch.collect_files(args.inputs, recursive=not args.no_recursive)
+    if not files:
+        print("Нет файлов для обработки", file=sys.stderr)
+        return 0
+    password = read_password(args, confirm=encrypt)
+
+    results = batch.run_batch(
+        files, password, encrypt,
+        iterations=args.iterations, fmt=args.format, jobs=args.jobs,
+        use_processes=args.processes, output_root=args.output_root,
+        in_place=args.in_place, progress=print_batch_progress,
+        kdf_params=args.kdf_params, backup=not args.no_backup, io_mode=args.io,
+        compression=args.compress)
+    print(file=sys.stderr)
+
+    failed = sum(1 for result in results if not result.ok)
+    print(f"Обработано: {len(results) - failed}, ошибок: {failed}")
+    return 1 if failed else 0
+
+
+def print_verify_result(done, total, result):
+    """Строка по каждому проверенному файлу"""
+    if result.ok:
+        print(f"OK    {result.path} ({format_size(result.size)}, "
+              f"{result.mbps:.1f} МБ/с)", flush=True)
+    else:
+        print(f"{result.status.upper()}  {result.path}: {result.error}", flush=True)
+
+
+def cmd_verify(args):
+    """Команда verify: проверить файлы без записи результата"""
+    files = [path for path, _ in batch.collect_files(args.inputs,
+                                                     recursive=not args.no_recursive)]
+    if not files:
+        print("Нет файлов для проверки", file=sys.stderr)
+        return 0
+    password = read_password(args)
+
+    started = time.perf_counter()
+    results = verify.verify_files(files, password, args.iterations, args.jobs,
+                                  progress=None if args.quiet else print_verify_result)
+    report = verify.summarize(results, time.perf_counter() - started)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+
+    counts = report["counts"]
+    print(f"Проверено: {report['files']} ({format_size(report['bytes'])}, "
+          f"{report['mbps']} МБ/с): ok {counts[verify.STATUS_OK]}, "
+          f"неверный пароль {counts[verify.STATUS_WRONG_PASSWORD]}, "
+          f"повреждено {counts[verify.STATUS_CORRUPT]}, "
+          f"обрезано {counts[verify.STATUS_TRUNCATED]}, "
+          f"ошибок {counts[verify.STATUS_ERROR]}")
+    return 1 if report["failures"] else 0
+
+
+def cmd_watch(args):
+    """Команда watch: шифровать новые файлы каталога, пока не прервут (Ctrl+C)"""
+    password = read_password(args, confirm=True)
+    kdf_params = kdf_params_from_args(args)
+
+    def on_result(result):
+        if result.ok:
+            print(f"OK    {result.path} -> {result.output}", flush=True)
+        else:
+            print(f"FAIL  {result.path}: {result.error}", flush=True)
+
+    watcher = watch.FolderWatcher(
+        args.directory, args.output_dir, password, args.iterations, args.format,
+        kdf_params, args.jobs, args.settle, args.interval, args.state,
+        recursive=not args.no_recursive, use_inotify=not args.poll,
+        on_result=on_result)
+    print(f"Наблюдение за {args.directory} (Ctrl+C - выход)", file=sys.stderr)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Остановлено", file=sys.stderr)
+    return 0
+
+
+def cmd_archive(args):
+    """Команда archive: create, list, extract"""
+    if args.action == "create":
+        output = os.path.abspath(args.output)
+        files = [(path, archive.member_name(path, root))
+                 for path, root in batch.collect_files(args.inputs,
+                                                       recursive=not args.no_recursive)
+                 if os.path.abspath(path) != output]
+        if not files:
+            print("Нет файлов для упаковки", file=sys.stderr)
+            return 0
+        password = read_password(args, confirm=True)
+        kdf_params = kdf_params_from_args(args)
+        on_progress = PROGRESS_PRINTERS.get(args.progress or ("bar" if args.verbose else None))
+        members = archive.create_archive(args.output, files, password, args.iterations,
+                                         on_progress, args.workers, kdf_params=kdf_params)
+        print(f"Архив сохранен: {args.output} (файлов: {len(members)})")
+        return 0
+
+    password = read_password(args)
+    with archive.open_archive(args.archive, password) as arc:
+        if args.action == "list":
+            if args.json:
+                listing = [{"name": m.name, "size": m.size, "mtime": m.mtime}
+                           for m in arc.members]
+                print(json.dumps(listing, indent=2, ensure_ascii=False))
+            else:
+                for member in arc.members:
+                    print(f"{format_size(member.size):>10}  {member.name}")
+            return 0
+
+        on_progress = PROGRESS_PRINTERS.get(args.progress or ("bar" if args.verbose else None))
+        for name in args.members or arc.names():
+            path = arc.extract(name, args.directory, on_progress, args.workers)
+            print(f"Файл сохранен: {path}")
+    return 0
+
+
+def parse_size(text):
+    """Размер с суффиксом K/M/G: 64K, 16M, 1G"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверный размер: {text}")
+
+
+def size_list(text):
+    """Список размеров через запятую"""
+    return [parse_size(item) for item in text.split(",") if item]
+
+
+def int_list(item_type):
+    """Тип аргумента: список чисел через запятую, каждое проверяет item_type"""
+    def parse(text):
+        values = [item_type(item) for item in text.split(",") if item]
+        if not values:
+            raise argparse.ArgumentTypeError("пустой список чисел")
+        return values
+    return parse
+
+
+def format_list(text):
+    """Список форматов через запятую"""
+    formats = [item for item in text.split(",") if item]
+    unknown = set(formats) - set(core.FORMATS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"неизвестный формат: {', '.join(unknown)}")
+    return formats
+
+
+def io_mode_list(text):
+    """Список режимов ввода-вывода через запятую"""
+    modes = [item for item in text.split(",") if item]
+    unknown = set(modes) - set(mmapio.IO_MODES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"неизвестный режим: {', '.join(unknown)}")
+    return modes
+
+
+def iteration_count(text):
+    """Число итераций PBKDF2 в допустимом диапазоне"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверное число: {text}")
+    if not 0 < value <= kdf.MAX_CALIBRATED_ITERATIONS:
+        raise argparse.ArgumentTypeError(
+            f"число итераций должно быть от 1 до {kdf.MAX_CALIBRATED_ITERATIONS}")
+    return value
+
+
+def scrypt_cost(text):
+    """Параметр N scrypt: степень двойки в пределах памяти"""
+    try:
+        n = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверное число: {text}")
+    if n < 2 or n & (n - 1):
+        raise argparse.ArgumentTypeError(f"N должно быть степенью двойки: {n}")
+    if kdf.scrypt_memory(n, kdf.DEFAULT_SCRYPT_R, kdf.DEFAULT_SCRYPT_P) > kdf.MAX_SCRYPT_MEMORY:
+        raise argparse.ArgumentTypeError(f"N={n} требует слишком много памяти")
+    return n
+
+
+def positive_int(text):
+    """Положительное целое число"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверное число: {text}")
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"число должно быть больше нуля: {value}")
+    return value
+
+
+def cmd_bench(args):
+    """Команда bench: замер производительности в JSON"""
+    def on_case(result):
+        print(f"{result['format']:>4} size={format_size(result['size'])} "
+              f"chunk={format_size(result['chunk_size'])} "
+              f"workers={result['workers']} iter={result['iterations']} "
+              f"io={result['io_mode']}: "
+              f"enc {result['encrypt_mbps']} МБ/с, dec {result['decrypt_mbps']} МБ/с",
+              file=sys.stderr)
+
+    report = bench.run_benchmark(args.sizes, args.formats, args.chunk_sizes,
+                                 args.workers, args.iterations, args.dir, on_case,
+                                 args.io_modes)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def add_password_argument(parser):
+    """Параметры файла с паролем и файла-ключа"""
+    parser.add_argument("--password-file",
+                        help=f"файл с паролем (иначе ${PASSWORD_ENV} или запрос)")
+    parser.add_argument("--keyfile",
+                        help="файл-ключ вместо пароля (важно содержимое, не имя)")
+
+
+def add_kdf_arguments(parser):
+    """Параметры пароля и KDF"""
+    add_password_argument(parser)
+    parser.add_argument("--iterations", type=iteration_count, default=core.DEFAULT_ITERATIONS,
+                        help="число итераций PBKDF2")
+    parser.add_argument("--kdf", choices=["pbkdf2", "scrypt"], default="pbkdf2",
+                        help="функция получения ключа при шифровании "
+                             "(scrypt - форматы seg, cbc и stream; aes - только pbkdf2)")
+    parser.add_argument("--scrypt-n", type=scrypt_cost, default=kdf.DEFAULT_SCRYPT_N,
+                        help="параметр стоимости scrypt N (степень двойки)")
+    parser.add_argument("--calibrate", type=positive_int, metavar="MS",
+                        help="подобрать стоимость KDF под время разблокировки в мс")
+
+
+def add_progress_arguments(parser):
+    """Параметры вывода прогресса"""
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="показывать прогресс (то же, что --progress bar)")
+    parser.add_argument("--progress", choices=sorted(PROGRESS_PRINTERS),
+                        help="вывод прогресса в stderr: bar или json (построчно)")
+
+
+def add_common_arguments(parser):
+    """Общие параметры для всех команд"""
+    add_kdf_arguments(parser)
+    parser.add_argument("--format", choices=core.FORMATS, default=core.DEFAULT_FORMAT,
+                        help="формат при шифровании: seg (сегменты AES-GCM, "
+                             "многопоточный, по умолчанию), cbc (AES-CBC с "
+                             "заголовком) или aes (старый формат AES!)")
+    parser.add_argument("--workers", type=int,
+                        help="число потоков для формата seg (по умолчанию - число ядер)")
+    parser.add_argument("--io", choices=mmapio.IO_MODES, default=mmapio.IO_AUTO,
+                        help="ввод-вывод для формата seg: mmap, buffered или auto "
+                             f"(mmap для файлов от {mmapio.MMAP_THRESHOLD // (1024 * 1024)} МБ)")
+    parser.add_argument("--compress", choices=compress.ALGORITHMS,
+                        help="сжимать перед шифрованием (форматы seg и stream); "
+                             "уже сжатые файлы (zip, mp4, jpg...) не сжимаются")
+    parser.add_argument("--in-place", action="store_true",
+                        help="заменить исходный файл (атомарно, с копией .backup)")
+    parser.add_argument("--no-backup", action="store_true",
+                        help="не сохранять копию .backup при замене на месте")
+    add_progress_arguments(parser)
+
+
+def build_parser():
+    """Построить парсер аргументов"""
+    parser = argparse.ArgumentParser(prog="file_encryptor",
+                                     description="Шифрование файлов AES-256")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="записать время по стадиям (KDF, шифр, чтение, запись) "
+                             "и счетчики; формат Prometheus, для .json - JSON")
+    parser.add_argument("--metrics-format", choices=metrics.METRIC_FORMATS,
+                        help="формат файла метрик (по умолчанию - по расширению)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="записать профиль cProfile (pstats) основного потока")
+    parser.add_argument("--trace-memory", metavar="PATH",
+                        help="записать пик памяти и крупнейшие выделения (tracemalloc)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("encrypt", "зашифровать файл"),
+                            ("decrypt", "расшифровать файл")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("input", help="входной файл (- для stdin)")
+        p.add_argument("-o", "--output", help="выходной файл (- для stdout)")
+        add_common_arguments(p)
+        if name == "encrypt":
+            p.add_argument("--resume", action="store_true",
+                           help="шифровать с контрольными точками (.part/.ckpt) и "
+                                "продолжить прерванную операцию (формат seg)")
+
+    p = sub.add_parser("batch", help="обработать несколько файлов")
+    p.add_argument("mode", choices=["encrypt", "decrypt"])
+    p.add_argument("inputs", nargs="+", help="файлы, каталоги или glob-шаблоны")
+    p.add_argument("-j", "--jobs", type=int,
+                   help="число файлов, обрабатываемых одновременно "
+                        "(по умолчанию - число ядер)")
+    p.add_argument("--processes", action="store_true",
+                   help="использовать пул процессов вместо пула потоков")
+    p.add_argument("--output-root",
+                   help="повторить структуру каталогов в указанном каталоге")
+    p.add_argument("--no-recursive", action="store_true",
+                   help="не обходить подкаталоги")
+    add_common_arguments(p)
+
+    p = sub.add_parser("archive", help="зашифрованный архив из нескольких файлов")
+    archive_sub = p.add_subparsers(dest="action", required=True)
+    p = archive_sub.add_parser("create", help="упаковать файлы в архив")
+    p.add_argument("output", help="файл архива")
+    p.add_argument("inputs", nargs="+", help="файлы, каталоги или glob-шаблоны")
+    p.add_argument("--no-recursive", action="store_true",
+                   help="не обходить подкаталоги")
+    p.add_argument("--workers", type=int,
+                   help="число потоков (по умолчанию - число ядер)")
+    add_kdf_arguments(p)
+    add_progress_arguments(p)
+    p = archive_sub.add_parser("list", help="показать список файлов архива")
+    p.add_argument("archive", help="файл архива")
+    add_password_argument(p)
+    p.add_argument("--json", action="store_true", help="вывести список в JSON")
+    p = archive_sub.add_parser("extract", help="извлечь файлы из архива")
+    p.add_argument("archive", help="файл архива")
+    p.add_argument("members", nargs="*", help="имена файлов (по умолчанию - все)")
+    p.add_argument("-C", "--directory", default=".", help="каталог для извлечения")
+    add_password_argument(p)
+    p.add_argument("--workers", type=int,
+                   help="число потоков (по умолчанию - число ядер)")
+    add_progress_arguments(p)
+
+    p = sub.add_parser("dedup", help="хранилище снимков с дедупликацией")
+    dedup_sub = p.add_subparsers(dest="action", required=True)
+    p = dedup_sub.add_parser("init", help="создать хранилище")
+    p.add_argument("store", help="каталог хранилища")
+    add_kdf_arguments(p)
+    p = dedup_sub.add_parser("backup", help="сохранить файлы как новый снимок")
+    p.add_argument("store", help="каталог хранилища")
+    p.add_argument("inputs", nargs="+", help="файлы, каталоги или glob-шаблоны")
+    p.add_argument("--name", help="имя снимка (по умолчанию - дата и время)")
+    p.add_argument("--no-recursive", action="store_true",
+                   help="не обходить подкаталоги")
+    p.add_argument("--workers", type=int,
+                   help="число потоков (по умолчанию - число ядер)")
+    add_password_argument(p)
+    add_progress_arguments(p)
+    p = dedup_sub.add_parser("list", help="список снимков или файлов снимка")
+    p.add_argument("store", help="каталог хранилища")
+    p.add_argument("snapshot", nargs="?", help="имя снимка")
+    add_password_argument(p)
+    p = dedup_sub.add_parser("restore", help="восстановить файлы снимка")
+    p.add_argument("store", help="каталог хранилища")
+    p.add_argument("snapshot", help="имя снимка")
+    p.add_argument("members", nargs="*", help="имена файлов (по умолчанию - все)")
+    p.add_argument("-C", "--directory", default=".", help="каталог для восстановления")
+    p.add_argument("--workers", type=int,
+                   help="число потоков (по умолчанию - число ядер)")
+    add_password_argument(p)
+    add_progress_arguments(p)
+
+    p = sub.add_parser("passwd", help="сменить пароль без перешифрования данных")
+    p.add_argument("input", help="зашифрованный файл или архив")
+    action = p.add_mutually_exclusive_group()
+    action.add_argument("--add", action="store_true",
+                        help="добавить пароль, сохранив текущий")
+    action.add_argument("--remove", action="store_true",
+                        help="удалить текущий пароль (должен остаться другой)")
+    p.add_argument("--new-password-file", help="файл с новым паролем")
+    p.add_argument("--new-keyfile", help="новый файл-ключ вместо пароля")
+    add_kdf_arguments(p)
+
+    p = sub.add_parser("update", help="зашифровать файл, перезаписав только "
+                                      "изменившиеся с прошлого раза сегменты")
+    p.add_argument("input", help="исходный файл")
+    p.add_argument("output", help="зашифрованный файл (создается, если его нет)")
+    p.add_argument("--in-place", action="store_true",
+                   help="менять сегменты прямо в файле без журнала (быстрее, но "
+                        "сбой во время обновления портит файл)")
+    p.add_argument("--workers", type=int,
+                   help="число потоков (по умолчанию - число ядер)")
+    add_kdf_arguments(p)
+    add_progress_arguments(p)
+
+    p = sub.add_parser("read", help="расшифровать диапазон байт (форматы seg и cbc)")
+    p.add_argument("input", help="зашифрованный файл")
+    p.add_argument("--offset", type=parse_size, default=0,
+                   help="начало диапазона в байтах (допускаются K/M/G)")
+    p.add_argument("--length", type=parse_size,
+                   help="длина диапазона (по умолчанию - до конца файла)")
+    p.add_argument("-o", "--output", help="выходной файл (по умолчанию - stdout)")
+    add_password_argument(p)
+
+    p = sub.add_parser("verify", help="проверить пароль и целостность файлов "
+                                      "без записи результата")
+    p.add_argument("inputs", nargs="+", help="файлы, каталоги или glob-шаблоны")
+    p.add_argument("-j", "--jobs", type=int,
+                   help="число файлов, проверяемых одновременно "
+                        "(по умолчанию - число ядер)")
+    p.add_argument("--no-recursive", action="store_true",
+                   help="не обходить подкаталоги")
+    p.add_argument("--iterations", type=iteration_count, default=core.DEFAULT_ITERATIONS,
+                   help="число итераций PBKDF2 (только для старого формата AES!)")
+    p.add_argument("-q", "--quiet", action="store_true",
+                   help="не выводить строку по каждому файлу")
+    p.add_argument("--report", help="записать отчет в JSON-файл")
+    add_password_argument(p)
+
+    p = sub.add_parser("watch", help="шифровать новые и измененные файлы каталога")
+    p.add_argument("directory", help="наблюдаемый каталог")
+    p.add_argument("-o", "--output-dir", required=True,
+                   help="каталог для зашифрованных файлов")
+    p.add_argument("--state",
+                   help=f"файл состояния (по умолчанию {watch.STATE_NAME} "
+                        "в выходном каталоге)")
+    p.add_argument("-j", "--jobs", type=int,
+                   help="число файлов, шифруемых одновременно "
+                        "(по умолчанию - число ядер)")
+    p.add_argument("--settle", type=float, default=watch.SETTLE_SECONDS,
+                   help="сколько секунд файл должен не меняться перед шифрованием")
+    p.add_argument("--interval", type=float, default=watch.POLL_INTERVAL,
+                   help="период опроса каталога, с")
+    p.add_argument("--poll", action="store_true",
+                   help="опрашивать каталог вместо inotify")
+    p.add_argument("--no-recursive", action="store_true",
+                   help="не обходить подкаталоги")
+    p.add_argument("--format", choices=core.FORMATS, default=core.DEFAULT_FORMAT,
+                   help="формат шифрования")
+    add_kdf_arguments(p)
+
+    p = sub.add_parser("info", help="показать заголовок зашифрованного файла")
+    p.add_argument("input", help="зашифрованный файл")
+
+    p = sub.add_parser("calibrate", help="подобрать стоимость KDF для этой машины")
+    p.add_argument("--target-ms", type=positive_int, default=kdf.DEFAULT_TARGET_MS,
+                   help="целевое время разблокировки, мс")
+
+    p = sub.add_parser("bench", help="замер производительности (JSON)")
+    p.add_argument("--sizes", type=size_list, default=[64 * 1024 ** 2],
+                   help="размеры синтетических файлов, например 16M,1G")
+    p.add_argument("--formats", type=format_list, default=list(core.FORMATS),
+                   help="форматы через запятую (aes,seg)")
+    p.add_argument("--chunk-sizes", type=size_list, default=[core.CHUNK_SIZE],
+                   help="размеры блока/сегмента, например 64K,1M,4M")
+    p.add_argument("--workers", type=int_list(positive_int), default=[1],
+                   help="число потоков для формата seg, например 1,4,16")
+    p.add_argument("--iterations", type=int_list(iteration_count), default=[10000],
+                   help="итерации PBKDF2, например 10000,100000,500000")
+    p.add_argument("--io-modes", type=io_mode_list, default=[mmapio.IO_AUTO],
+                   help="режимы ввода-вывода для формата seg, например buffered,mmap")
+    p.add_argument("--dir", help="каталог для временных файлов")
+    p.add_argument("-o", "--output", help="записать JSON в файл")
+
+    return parser
+
+
+def main(argv=None):
+    """Точка входа консольного интерфейса"""
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    try:
+        with metrics.Capture(args.profile, args.trace_memory):
+            return run_command(args)
+    finally:
+        collected = metrics.disable()
+        if collected is not None:
+            try:
+                collected.write(args.metrics, args.metrics_format)
+            except OSError as e:
+                print(f"Ошибка записи метрик: {e}", file=sys.stderr)
+
+
+def run_command(args):
+    """Выполнить команду; возвращает код завершения"""
+    try:
+        if args.command == "bench":
+            return cmd_bench(args)
+        if args.command == "calibrate":
+            return cmd_calibrate(args)
+        if args.command == "info":
+            return cmd_info(args)
+        if args.command == "archive":
+            return cmd_archive(args)
+        if args.command == "read":
+            return cmd_read(args)
+        if args.command == "update":
+            return cmd_update(args)
+        if args.command == "dedup":
+            return cmd_dedup(args)
+        if args.command == "passwd":
+            return cmd_passwd(args)
+        if args.command == "verify":
+            return cmd_verify(args)
+        if args.command == "watch":
+            return cmd_watch(args)
+        encrypt = args.command == "encrypt" or getattr(args, "mode", None) == "encrypt"
+        args.kdf_params = kdf_params_from_args(args) if encrypt else None
+        if args.command == "batch":
+            return cmd_batch(args)
+        return cmd_single(args, args.command == "encrypt")
+    except core.WrongPasswordError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    except (core.EncryptorError, OSError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
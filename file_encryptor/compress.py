@@ -0,0 +1,194 @@
+"""Сжатие данных перед шифрованием (zlib, lzma, bz2)
+
+Открытый текст сжимается по мере чтения, и сжатый вывод сразу шифруется
+кадрами потокового формата (pipe): ни открытый, ни сжатый текст не
+попадает во временные файлы. Алгоритм и длина исходных данных
+записываются в заголовок, при дешифровании данные распаковываются на
+лету. Первый блок файла проверяется заранее: если данные уже сжаты
+(архивы, видео, изображения), сжатие пропускается. Файлы ранних версий
+(сжатые данные в формате seg) по-прежнему читаются.
+
+Длина сжатых данных зависит от содержимого, поэтому сжатие стоит
+включать только для данных, длина которых не должна оставаться тайной
+вместе с известной злоумышленнику частью открытого текста.
+"""
+import bz2
+import lzma
+import zlib
+
+from .errors import EncryptorError, FormatError
+
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LZMA = "lzma"
+COMPRESSION_BZ2 = "bz2"
+ALGORITHMS = (COMPRESSION_ZLIB, COMPRESSION_LZMA, COMPRESSION_BZ2)
+
+# Размер проверяемого первого блока
+PROBE_SIZE = 64 * 1024
+# Сжатие пропускается, если пробный блок сжимается хуже этой доли
+PROBE_RATIO = 0.9
+# Размер блока чтения при сжатии и распаковке
+BLOCK_SIZE = 1024 * 1024
+
+# Сигнатуры уже сжатых форматов: (смещение, байты)
+COMPRESSED_SIGNATURES = (
+    (0, b"PK\x03\x04"),          # zip, docx, xlsx, jar, apk
+    (0, b"\x1f\x8b"),            # gzip
+    (0, b"BZh"),                 # bzip2
+    (0, b"\xfd7zXZ\x00"),        # xz
+    (0, b"(\xb5/\xfd"),          # zstd
+    (0, b"7z\xbc\xaf\x27\x1c"),  # 7z
+    (0, b"Rar!\x1a\x07"),        # rar
+    (0, b"\xff\xd8\xff"),        # jpeg
+    (0, b"\x89PNG\r\n\x1a\n"),   # png
+    (0, b"GIF8"),                # gif
+    (0, b"OggS"),                # ogg
+    (0, b"fLaC"),                # flac
+    (0, b"ID3"),                 # mp3
+    (4, b"ftyp"),                # mp4, mov, m4a, heic
+    (0, b"\x1aE\xdf\xa3"),       # mkv, webm
+    (0, b"FENC"),                # уже зашифровано
+    (0, b"AES!"),
+)
+
+
+def check_algorithm(name):
+    """Проверить имя алгоритма сжатия"""
+    if name not in ALGORITHMS:
+        raise EncryptorError(f"Неизвестный алгоритм сжатия: {name}")
+
+
+def compressor(name):
+    """Потоковый компрессор с методами compress/flush"""
+    check_algorithm(name)
+    if name == COMPRESSION_ZLIB:
+        return zlib.compressobj(6)
+    if name == COMPRESSION_LZMA:
+        return lzma.LZMACompressor()
+    return bz2.BZ2Compressor()
+
+
+def decompressor(name):
+    """Потоковый декомпрессор с методом decompress и признаком eof"""
+    if name == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    if name == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    return bz2.BZ2Decompressor()
+
+
+def looks_compressed(block):
+    """Первый блок похож на уже сжатые данные"""
+    for offset, signature in COMPRESSED_SIGNATURES:
+        if block[offset:offset + len(signature)] == signature:
+            return True
+    if len(block) < 256:
+        return False
+    # Быстрая пробная упаковка: случайные и сжатые данные не уменьшаются
+    return len(zlib.compress(block, 1)) > len(block) * PROBE_RATIO
+
+
+def probe(src):
+    """Стоит ли сжимать поток src; позиция потока не меняется"""
+    position = src.tell()
+    block = src.read(PROBE_SIZE)
+    src.seek(position)
+    return bool(block) and not looks_compressed(block)
+
+
+class CompressingReader:
+    """Поток сжатых данных src: read сжимает исходные данные по мере чтения
+
+    В памяти - не больше запрошенного размера и вывода компрессора для
+    одного блока. plain_length (если известна) сверяется в конце чтения.
+    """
+
+    def __init__(self, src, name, tracker, plain_length=None):
+        self._src = src
+        self._engine = compressor(name)
+        self._tracker = tracker
+        self._plain_length = plain_length
+        self._buffer = bytearray()
+        self._eof = False
+        self.length = 0
+
+    def read(self, size):
+        while len(self._buffer) < size and not self._eof:
+            block = self._src.read(BLOCK_SIZE)
+            if block:
+                self._buffer += self._engine.compress(block)
+                self.length += len(block)
+                self._tracker.advance(len(block))
+                continue
+            self._buffer += self._engine.flush()
+            self._eof = True
+            if self._plain_length is not None and self.length != self._plain_length:
+                raise EncryptorError("Файл изменился во время чтения")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def header_fields(name, length=None):
+    """Поля заголовка для сжатых данных; длина неизвестна при чтении из канала"""
+    fields = {"compression": name}
+    if length is not None:
+        fields["plain_length"] = length
+    return fields
+
+
+def check_fields(fields, length_required=True):
+    """Проверить поля сжатия в заголовке (если есть)"""
+    if "compression" not in fields:
+        return
+    plain_length = fields.get("plain_length")
+    if fields["compression"] not in ALGORITHMS:
+        raise FormatError(f"Неподдерживаемый алгоритм сжатия: {fields['compression']}")
+    if plain_length is None and not length_required:
+        return
+    if not isinstance(plain_length, int) or plain_length < 0:
+        raise FormatError("Файл поврежден: неверная длина исходных данных")
+
+
+class DecompressingWriter:
+    """Приемник, распаковывающий данные перед записью в dst"""
+
+    def __init__(self, dst, name, plain_length=None):
+        self.dst = dst
+        self.plain_length = plain_length
+        self.written = 0
+        self._engine = decompressor(name)
+        self.zlib_engine = name == COMPRESSION_ZLIB
+
+    def write(self, data):
+        # Выход ограничен BLOCK_SIZE за шаг, а общий объем - plain_length:
+        # "бомба" с огромной степенью сжатия не займет всю память
+        try:
+            out = self._engine.decompress(data, BLOCK_SIZE)
+            self._emit(out)
+            while self._pending(out):
+                tail = self._engine.unconsumed_tail if self.zlib_engine else b""
+                out = self._engine.decompress(tail, BLOCK_SIZE)
+                self._emit(out)
+        except (zlib.error, lzma.LZMAError, OSError, EOFError):
+            raise FormatError("Файл поврежден: сжатые данные не читаются")
+        return len(data)
+
+    def _pending(self, out):
+        """Остались ли данные после шага, ограниченного BLOCK_SIZE"""
+        if self.zlib_engine:
+            return bool(self._engine.unconsumed_tail) or len(out) == BLOCK_SIZE
+        return not self._engine.needs_input and not self._engine.eof
+
+    def _emit(self, out):
+        self.written += len(out)
+        if self.plain_length is not None and self.written > self.plain_length:
+            raise FormatError("Файл поврежден: длина данных не совпадает с заголовком")
+        self.dst.write(out)
+
+    def finish(self):
+        """Проверить, что поток распакован полностью"""
+        if not self._engine.eof or self._engine.unused_data:
+            raise FormatError("Файл поврежден: сжатые данные обрезаны")
+        if self.plain_length is not None and self.written != self.plain_length:
+            raise FormatError("Файл поврежден: длина данных не совпадает с заголовком")
@@ -0,0 +1,514 @@
+"""Ядро шифрования файлов без зависимости от графического интерфейса"""
+import os
+import shutil
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+from . import (compress, fsutil, header, incremental, keys, metrics, mmapio, pipe,
+               segmented)
+from .errors import EncryptorError, FormatError, TruncatedError, WrongPasswordError
+from .kdf import (DEFAULT_ITERATIONS, KDF_PBKDF2, SALT_SIZE, derive_key,
+                  pbkdf2_params)
+from .progress import STAGE_DATA, tracker_for
+
+# Исходный контейнер без версии: AES! + соль (16) + IV (16) + данные AES-256-CBC
+MAGIC = b'AES!'
+IV_SIZE = 16
+
+# Размер блока потоковой обработки (кратен размеру блока AES)
+CHUNK_SIZE = 1024 * 1024
+
+# Форматы шифрования:
+#   seg - FENC, сегменты AES-256-GCM (по умолчанию)
+#   cbc - FENC, потоковый AES-256-CBC
+#   aes - исходный AES! без заголовка (для совместимости со старыми версиями)
+#   stream - FENC, кадры AES-256-GCM за один проход (каналы, stdin/stdout)
+FORMAT_SEGMENTED = "seg"
+FORMAT_CBC = "cbc"
+FORMAT_LEGACY = "aes"
+FORMAT_STREAM = "stream"
+FORMATS = (FORMAT_SEGMENTED, FORMAT_CBC, FORMAT_LEGACY, FORMAT_STREAM)
+DEFAULT_FORMAT = FORMAT_SEGMENTED
+
+CIPHER_CBC = "aes-256-cbc"
+
+
+def _operation_size(src):
+    """Размер входного потока для метрик (0 - без метрик или для канала)"""
+    if metrics.current() is None:
+        return 0
+    return header.stream_length(src) or 0
+
+
+def encrypt_stream(src, dst, password, iterations=DEFAULT_ITERATIONS,
+                   progress=None, fmt=DEFAULT_FORMAT, workers=None,
+                   session=None, chunk_size=None, kdf_params=None, cancel=None,
+                   io_mode=mmapio.IO_AUTO, compression=None):
+    """Потоковое шифрование из src в dst в выбранном формате
+
+    session (keys.KeySession) позволяет не выполнять KDF для каждого файла
+    (форматы seg и cbc). chunk_size - размер блока чтения для aes/cbc или
+    размер сегмента для seg. kdf_params (kdf.scrypt_params и т.п.)
+    заменяют PBKDF2 с iterations; формат aes поддерживает только PBKDF2.
+    progress - обработчик событий progress.ProgressEvent или трекер,
+    cancel - threading.Event для кооперативной отмены (CancelledError).
+    io_mode (mmapio.IO_*) выбирает для формата seg отображение файлов в
+    память; в режиме auto - для файлов от mmapio.MMAP_THRESHOLD.
+    compression (compress.ALGORITHMS) включает сжатие перед шифрованием
+    (форматы seg и stream): сжатые данные шифруются кадрами формата stream,
+    уже сжатые данные не сжимаются повторно.
+    """
+    with metrics.operation("encrypt", _operation_size(src)):
+        src, dst = metrics.timed_stream(src), metrics.timed_stream(dst)
+        tracker = tracker_for(progress, cancel)
+        if compression is not None:
+            if fmt not in (FORMAT_SEGMENTED, FORMAT_STREAM):
+                raise EncryptorError("Сжатие поддерживается только форматами seg и stream")
+            compress.check_algorithm(compression)
+            # Поток без перемотки не проверить заранее - он сжимается всегда
+            if header.stream_length(src) is not None and not compress.probe(src):
+                compression = None
+        if compression is not None:
+            _encrypt_compressed(src, dst, password, iterations, tracker,
+                                chunk_size or segmented.SEGMENT_SIZE, workers, session,
+                                kdf_params, compression)
+        elif fmt == FORMAT_SEGMENTED:
+            _encrypt_segmented(src, dst, password, iterations, tracker,
+                               chunk_size or segmented.SEGMENT_SIZE, workers, session,
+                               kdf_params, io_mode)
+        elif fmt == FORMAT_CBC:
+            _encrypt_cbc(src, dst, password, iterations, tracker,
+                         _cbc_chunk_size(chunk_size), session, kdf_params)
+        elif fmt == FORMAT_STREAM:
+            pipe.encrypt_stream(src, dst, password, iterations, tracker,
+                                chunk_size or segmented.SEGMENT_SIZE, workers, session,
+                                kdf_params)
+        elif fmt == FORMAT_LEGACY:
+            if kdf_params is not None:
+                if kdf_params.get("name") != KDF_PBKDF2:
+                    raise EncryptorError("Формат aes поддерживает только PBKDF2; "
+                                         "используйте формат seg")
+                iterations = kdf_params["iterations"]
+            _encrypt_legacy(src, dst, password, iterations, tracker,
+                            _cbc_chunk_size(chunk_size))
+        else:
+            raise EncryptorError(f"Неизвестный формат: {fmt}")
+        if tracker is not progress:
+            tracker.finish("Шифрование завершено")
+
+
+def _encrypt_segmented(src, dst, password, iterations, tracker, segment_size,
+                       workers, session, kdf_params, io_mode):
+    """Шифрование в формат seg через mmap или буферизованный ввод-вывод"""
+    encrypt = segmented.encrypt_stream
+    if mmapio.use_mmap(io_mode, src, dst, header.stream_length(src)):
+        encrypt = mmapio.encrypt_stream
+    encrypt(src, dst, password, iterations, tracker, segment_size, workers,
+            session, kdf_params)
+
+
+def _encrypt_compressed(src, dst, password, iterations, tracker, segment_size,
+                        workers, session, kdf_params, compression):
+    """Сжатие и шифрование кадрами формата stream за один проход
+
+    Сжатый вывод сразу уходит в шифр, поэтому ни открытый, ни сжатый
+    текст не пишется во временные файлы.
+    """
+    workers = workers or segmented.default_workers()
+    length = header.stream_length(src)
+
+    tracker.stage("Генерация ключа...")
+    key, prefix, fields = pipe.new_header(password, iterations, segment_size, session,
+                                          kdf_params,
+                                          compress.header_fields(compression, length))
+    header.write_header(dst, fields)
+
+    tracker.start("Сжатие и шифрование данных...", length)
+    reader = compress.CompressingReader(src, compression, tracker, length)
+    for _ in pipe.encrypt_body(reader, dst, key, prefix, segment_size, workers):
+        pass
+
+
+def decrypt_stream(src, dst, password, iterations=DEFAULT_ITERATIONS,
+                   progress=None, workers=None, session=None, chunk_size=None,
+                   cancel=None, io_mode=mmapio.IO_AUTO):
+    """Потоковое дешифрование; формат определяется по сигнатуре
+
+    Для файлов FENC все параметры (KDF, шифр, размер сегмента) берутся
+    из заголовка; iterations используется только для файлов AES!.
+    """
+    with metrics.operation("decrypt", _operation_size(src)):
+        src, dst = metrics.timed_stream(src), metrics.timed_stream(dst)
+        tracker = tracker_for(progress, cancel)
+        magic = src.read(len(MAGIC))
+        if magic == header.MAGIC:
+            fields = read_fenc_header(src, magic)
+
+            tracker.stage("Восстановление ключа...")
+            file_key = keys.key_from_header(fields, password, session)
+
+            if fields.get("type") == header.TYPE_INCREMENTAL:
+                incremental.decrypt_body(src, dst, fields, file_key, tracker, workers)
+            elif fields.get("type") == header.TYPE_STREAM and "compression" in fields:
+                out = compress.DecompressingWriter(dst, fields["compression"],
+                                                   fields.get("plain_length"))
+                pipe.decrypt_body(src, out, fields, file_key, tracker, workers)
+                out.finish()
+            elif fields.get("type") == header.TYPE_STREAM:
+                pipe.decrypt_body(src, dst, fields, file_key, tracker, workers)
+            elif fields["cipher"] == segmented.CIPHER_NAME and "compression" in fields:
+                # Сжатые файлы ранних версий: сжатые данные в сегментах seg
+                out = compress.DecompressingWriter(dst, fields["compression"],
+                                                   fields["plain_length"])
+                segmented.decrypt_body(src, out, fields, file_key, tracker, workers)
+                out.finish()
+            elif fields["cipher"] == segmented.CIPHER_NAME:
+                decrypt = segmented.decrypt_body
+                if mmapio.use_mmap(io_mode, src, dst, fields["length"]):
+                    decrypt = mmapio.decrypt_body
+                decrypt(src, dst, fields, file_key, tracker, workers)
+            else:
+                _decrypt_cbc_body(src, dst, fields, file_key, tracker,
+                                  _cbc_chunk_size(chunk_size))
+        elif magic == MAGIC:
+            _decrypt_legacy(src, dst, password, iterations, tracker, session,
+                            _cbc_chunk_size(chunk_size))
+        else:
+            raise FormatError("Неверный формат файла")
+        if tracker is not progress:
+            tracker.finish("Дешифрование завершено")
+
+
+def read_fenc_header(src, magic=None):
+    """Прочитать и проверить заголовок FENC до запуска KDF
+
+    Проверяются поля заголовка и соответствие размера данных длине,
+    указанной в заголовке, так что поврежденный или обрезанный файл
+    отклоняется без затрат на получение ключа.
+    """
+    fields, _ = header.read_header(src, magic)
+    if fields.get("type") == header.TYPE_INCREMENTAL:
+        # Размер данных записан в зашифрованном индексе и проверяется при чтении
+        incremental.check_header(fields)
+        return fields
+    if fields.get("type") == header.TYPE_STREAM:
+        # Длина неизвестна: обрезка обнаруживается по отсутствию последнего кадра
+        pipe.check_header(fields)
+        return fields
+    expected = check_fenc_fields(fields)
+
+    available = header.stream_length(src)
+    if available is not None and available < expected:
+        raise TruncatedError("Файл поврежден: данные обрезаны")
+    if available is not None and available > expected:
+        raise FormatError("Файл поврежден: лишние данные в конце")
+    return fields
+
+
+def check_fenc_fields(fields):
+    """Проверить поля заголовка FENC; возвращает ожидаемый размер данных"""
+    if fields.get("type") == header.TYPE_ARCHIVE:
+        raise FormatError("Файл является архивом: используйте команду archive")
+    if fields.get("type") == header.TYPE_INCREMENTAL:
+        raise FormatError("Файл режима update читается только из файла с произвольным доступом")
+    if fields.get("type") == header.TYPE_STREAM:
+        raise FormatError("Потоковый файл читается только последовательно")
+    header.check_common(fields)
+    keys.check_key_fields(fields)
+
+    if fields["cipher"] == segmented.CIPHER_NAME:
+        segmented.check_header(fields)
+        compress.check_fields(fields)
+        return segmented.body_size(fields)
+    if fields["cipher"] == CIPHER_CBC:
+        check_cbc_header(fields)
+        return _cbc_body_size(fields["length"])
+    raise FormatError(f"Неподдерживаемый шифр: {fields['cipher']}")
+
+
+def read_file_info(path):
+    """Описание зашифрованного файла по заголовку, без пароля"""
+    fsutil.recover(path)
+    with open(path, 'rb') as src:
+        magic = src.read(len(MAGIC))
+        if magic == header.MAGIC:
+            fields, _ = header.read_header(src, magic)
+            if fields.get("type") in (header.TYPE_ARCHIVE, header.TYPE_INCREMENTAL,
+                                      header.TYPE_STREAM):
+                return _describe(fields, fields["type"])
+            src.seek(0)
+            fields = read_fenc_header(src)
+            fmt = FORMAT_SEGMENTED if fields["cipher"] == segmented.CIPHER_NAME else FORMAT_CBC
+            return _describe(fields, fmt)
+        if magic == MAGIC:
+            return {"format": FORMAT_LEGACY, "cipher": CIPHER_CBC,
+                    "kdf": {"name": KDF_PBKDF2, "iterations": None}}
+    raise FormatError("Неверный формат файла")
+
+
+def _describe(fields, fmt):
+    """Описание файла FENC по полям заголовка; слоты - только параметры KDF"""
+    info = {"format": fmt, "version": header.VERSION}
+    info.update(fields)
+    slots = header.key_slots(fields)
+    if slots is None:
+        info["kdf"] = header.kdf_params(fields)
+    else:
+        info["slots"] = [header.kdf_params(slot) for slot in slots]
+        info["kdf"] = info["slots"][0]
+    return info
+
+
+def _cbc_chunk_size(chunk_size):
+    """Размер блока для CBC: по умолчанию CHUNK_SIZE, кратен 16 байтам"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    if chunk_size <= 0 or chunk_size % AES.block_size:
+        raise EncryptorError(f"Размер блока должен быть кратен {AES.block_size}")
+    return chunk_size
+
+
+def _cbc_body_size(length):
+    """Размер шифртекста CBC с дополнением PKCS7"""
+    return (length // AES.block_size + 1) * AES.block_size
+
+
+def check_cbc_header(fields):
+    """Проверить поля заголовка CBC; возвращает IV"""
+    iv = header.b64decode(fields.get("iv", ""))
+    if len(iv) != IV_SIZE:
+        raise FormatError("Файл поврежден: неверный IV")
+    return iv
+
+
+def _cbc_encrypt_body(src, dst, cipher, chunk_size, tracker):
+    """Шифрование CBC блоками; дополняется только последний блок"""
+    chunk = src.read(chunk_size)
+    while True:
+        next_chunk = src.read(chunk_size)
+        if not next_chunk:
+            with metrics.timed("cipher", len(chunk)):
+                data = cipher.encrypt(pad(chunk, AES.block_size))
+            dst.write(data)
+            tracker.advance(len(chunk))
+            break
+        with metrics.timed("cipher", len(chunk)):
+            data = cipher.encrypt(chunk)
+        dst.write(data)
+        tracker.advance(len(chunk))
+        chunk = next_chunk
+
+
+def _cbc_decrypt_body(src, dst, cipher, chunk_size, tracker):
+    """Дешифрование CBC блоками; возвращает число байт открытого текста"""
+    # Последний блок придерживается до конца файла,
+    # чтобы снять дополнение только с него
+    written = 0
+    chunk = src.read(chunk_size)
+    if not chunk or len(chunk) % AES.block_size:
+        raise TruncatedError("Файл поврежден: неполный блок данных")
+    while True:
+        next_chunk = src.read(chunk_size)
+        if not next_chunk:
+            try:
+                with metrics.timed("cipher", len(chunk)):
+                    data = unpad(cipher.decrypt(chunk), AES.block_size)
+            except ValueError:
+                raise WrongPasswordError("Неверный пароль или поврежденный файл")
+            dst.write(data)
+            tracker.advance(len(data))
+            return written + len(data)
+        if len(next_chunk) % AES.block_size:
+            raise TruncatedError("Файл поврежден: неполный блок данных")
+        with metrics.timed("cipher", len(chunk)):
+            data = cipher.decrypt(chunk)
+        dst.write(data)
+        written += len(chunk)
+        tracker.advance(len(chunk))
+        chunk = next_chunk
+
+
+def _encrypt_cbc(src, dst, password, iterations, tracker, chunk_size,
+                 session=None, kdf_params=None):
+    """Потоковое шифрование AES-256-CBC в контейнер FENC"""
+    length = header.stream_length(src)
+    if length is None:
+        raise EncryptorError("Формат cbc требует поток с произвольным доступом")
+
+    tracker.stage("Генерация ключа...")
+    file_key, fields = keys.new_file_keys(password, iterations, kdf_params, session)
+    iv = get_random_bytes(IV_SIZE)
+    cipher = AES.new(keys.data_key(file_key), AES.MODE_CBC, iv)
+
+    fields.update({
+        "cipher": CIPHER_CBC,
+        "segment_size": chunk_size,
+        "length": length,
+        "iv": header.b64encode(iv),
+    })
+    header.write_header(dst, fields)
+
+    tracker.start("Шифрование данных...", length)
+    _cbc_encrypt_body(src, dst, cipher, chunk_size, tracker)
+
+
+def _decrypt_cbc_body(src, dst, fields, file_key, tracker, chunk_size):
+    """Дешифрование данных CBC после заголовка FENC"""
+    iv = check_cbc_header(fields)
+    cipher = AES.new(keys.data_key(file_key), AES.MODE_CBC, iv)
+
+    tracker.start("Дешифрование данных...", fields["length"])
+    try:
+        written = _cbc_decrypt_body(src, dst, cipher, chunk_size, tracker)
+    except WrongPasswordError:
+        # Пароль уже подтвержден проверочным значением - файл поврежден
+        if "check" in fields:
+            raise FormatError("Файл поврежден: неверное дополнение")
+        raise
+    if written != fields["length"]:
+        raise FormatError("Файл поврежден: длина данных не совпадает с заголовком")
+
+
+def _encrypt_legacy(src, dst, password, iterations, tracker,
+                    chunk_size=CHUNK_SIZE):
+    """Потоковое шифрование в исходный формат AES! (без заголовка)"""
+    tracker.stage("Генерация ключа...")
+
+    # Генерация ключа и соли
+    key, salt = derive_key(password, iterations=iterations)
+    iv = get_random_bytes(IV_SIZE)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+
+    tracker.start("Шифрование данных...", header.stream_length(src))
+
+    dst.write(MAGIC)
+    dst.write(salt)
+    dst.write(iv)
+    _cbc_encrypt_body(src, dst, cipher, chunk_size, tracker)
+
+
+def _decrypt_legacy(src, dst, password, iterations, tracker, session=None,
+                    chunk_size=CHUNK_SIZE):
+    """Потоковое дешифрование AES! (сигнатура уже прочитана)
+
+    Число итераций в этом формате не записано и берется из настроек.
+    """
+    salt = src.read(SALT_SIZE)
+    iv = src.read(IV_SIZE)
+    if len(salt) != SALT_SIZE or len(iv) != IV_SIZE:
+        raise TruncatedError("Файл поврежден: неполный заголовок")
+    available = header.stream_length(src)
+    if available is not None and (available == 0 or available % AES.block_size):
+        raise TruncatedError("Файл поврежден: неполный блок данных")
+
+    tracker.stage("Восстановление ключа...")
+
+    # Восстановление ключа
+    if session is not None:
+        key = session.derive(salt, pbkdf2_params(iterations))
+    else:
+        key, _ = derive_key(password, salt, iterations)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+
+    tracker.start("Дешифрование данных...", available)
+    _cbc_decrypt_body(src, dst, cipher, chunk_size, tracker)
+
+
+def encrypt_file(input_path, output_path, password,
+                 iterations=DEFAULT_ITERATIONS, progress=None,
+                 fmt=DEFAULT_FORMAT, workers=None, session=None,
+                 kdf_params=None, cancel=None, io_mode=mmapio.IO_AUTO,
+                 compression=None):
+    """Зашифровать файл input_path в output_path"""
+    try:
+        # w+b: выход можно отобразить в память (mmapio)
+        with open(input_path, 'rb') as src, open(output_path, 'w+b') as dst:
+            encrypt_stream(src, dst, password, iterations, progress,
+                           fmt, workers, session, kdf_params=kdf_params,
+                           cancel=cancel, io_mode=io_mode,
+                           compression=compression)
+    except BaseException:
+        fsutil.remove_quietly(output_path)
+        raise
+
+
+def decrypt_file(input_path, output_path, password,
+                 iterations=DEFAULT_ITERATIONS, progress=None, workers=None,
+                 session=None, cancel=None, io_mode=mmapio.IO_AUTO):
+    """Расшифровать файл input_path в output_path"""
+    fsutil.recover(input_path)
+    try:
+        with open(input_path, 'rb') as src, open(output_path, 'w+b') as dst:
+            decrypt_stream(src, dst, password, iterations, progress, workers,
+                           session, cancel=cancel, io_mode=io_mode)
+    except BaseException:
+        fsutil.remove_quietly(output_path)
+        raise
+
+
+def process_file(input_path, output_path, password, encrypt=True,
+                 iterations=DEFAULT_ITERATIONS, progress=None,
+                 fmt=DEFAULT_FORMAT, workers=None, session=None,
+                 kdf_params=None, cancel=None, io_mode=mmapio.IO_AUTO,
+                 compression=None):
+    """Зашифровать или расшифровать файл в зависимости от режима"""
+    if encrypt:
+        encrypt_file(input_path, output_path, password, iterations, progress,
+                     fmt, workers, session, kdf_params, cancel, io_mode,
+                     compression)
+    else:
+        decrypt_file(input_path, output_path, password, iterations, progress,
+                     workers, session, cancel, io_mode)
+
+
+def process_file_in_place(file_path, password, encrypt=True,
+                          iterations=DEFAULT_ITERATIONS, progress=None,
+                          fmt=DEFAULT_FORMAT, workers=None, session=None,
+                          kdf_params=None, backup=True, cancel=None,
+                          io_mode=mmapio.IO_AUTO, compression=None):
+    """Обработка файла на месте (замена исходного)
+
+    Результат пишется во временный файл в том же каталоге, сбрасывается на
+    диск и атомарно подменяет исходный через os.replace, так что при сбое
+    остается либо старый, либо новый файл целиком. Резервная копия
+    (необязательная) делается жесткой ссылкой или reflink без копирования
+    данных. Возвращает путь резервной копии или None.
+    """
+    tracker = tracker_for(progress, cancel)
+    if not encrypt:
+        fsutil.recover(file_path)
+    fd, temp_file = fsutil.temp_path_near(file_path)
+    try:
+        with os.fdopen(fd, 'w+b') as dst, open(file_path, 'rb') as src:
+            if encrypt:
+                encrypt_stream(src, dst, password, iterations, tracker, fmt,
+                               workers, session, kdf_params=kdf_params,
+                               io_mode=io_mode, compression=compression)
+            else:
+                decrypt_stream(src, dst, password, iterations, tracker,
+                               workers, session, io_mode=io_mode)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(file_path, temp_file)
+
+        tracker.stage("Замена файла...", STAGE_DATA)
+
+        backup_path = None
+        if backup:
+            backup_path = file_path + ".backup"
+            fsutil.make_backup(file_path, backup_path)
+
+        fsutil.replace_atomic(temp_file, file_path)
+    except BaseException:
+        fsutil.remove_quietly(temp_file)
+        raise
+    tracker.finish("Файл заменен")
+    return backup_path
+
+
+def default_output_path(input_path, encrypt=True):
+    """Путь копии по умолчанию: file_encrypted.ext / file_decrypted.ext"""
+    base, ext = os.path.splitext(input_path)
+    suffix = "_encrypted" if encrypt else "_decrypted"
+    return base + suffix + ext
@@ -0,0 +1,349 @@
+"""Хранилище с дедупликацией: повторяющиеся данные шифруются и хранятся один раз
+
+Структура каталога хранилища:
+    store.json - параметры KDF, соль, проверочное значение пароля и
+        параметры нарезки; мастер-ключ получается из пароля один раз
+    chunks/xx/<id> - уникальные фрагменты; id - HMAC-SHA256 открытого
+        текста под ключом хранилища, ключ фрагмента - HKDF от мастер-ключа
+        и id. Фрагмент: префикс nonce (8 байт) + шифртекст AES-GCM + тег
+    snapshots/<имя>.snap - зашифрованный манифест снимка: файлы и
+        списки их фрагментов
+
+Данные режутся на фрагменты по содержимому: граница ставится там, где
+последние BITS байт, переведенные секретной таблицей в биты, образуют
+заданный шаблон. Граница зависит только от соседних байт, поэтому вставка
+в начало файла не сдвигает остальные границы. Перевод и поиск шаблона
+выполняются bytes.translate и bytes.find без цикла по байтам в Python.
+Повторное резервное копирование почти не изменившегося каталога
+записывает только новые фрагменты.
+
+Одинаковые фрагменты дают одинаковые id, так что хранилище раскрывает
+совпадение данных между файлами и снимками (но не сами данные).
+"""
+import hmac
+import json
+import os
+import re
+import time
+
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+from Crypto.Random import get_random_bytes
+
+from . import archive, fsutil, header, keys, segmented
+from .errors import EncryptorError, FormatError, SegmentError
+from .kdf import (DEFAULT_ITERATIONS, KEY_SIZE, SALT_SIZE, derive_key_params,
+                  pbkdf2_params)
+from .progress import tracker_for
+
+STORE_VERSION = 1
+CONFIG_NAME = "store.json"
+CHUNKS_DIR = "chunks"
+SNAPSHOTS_DIR = "snapshots"
+SNAPSHOT_SUFFIX = ".snap"
+
+# Нарезка: фрагмент не короче MIN_CHUNK и не длиннее MAX_CHUNK, шаблон
+# из CHUNK_BITS бит встречается в среднем раз в 2 ** CHUNK_BITS байт
+MIN_CHUNK = 128 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+CHUNK_BITS = 19
+# Размер блока чтения при нарезке
+READ_SIZE = 8 * 1024 * 1024
+# Служебные данные фрагмента: префикс nonce и тег
+CHUNK_OVERHEAD = segmented.NONCE_PREFIX_SIZE + segmented.TAG_SIZE
+
+_SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+class BackupResult:
+    """Итог резервного копирования: всего и новых фрагментов и байт"""
+
+    def __init__(self, snapshot, files, chunks, new_chunks, size, new_size):
+        self.snapshot = snapshot
+        self.files = files
+        self.chunks = chunks
+        self.new_chunks = new_chunks
+        self.size = size
+        self.new_size = new_size
+
+    def __repr__(self):
+        return (f"BackupResult({self.snapshot!r}, chunks={self.chunks}, "
+                f"new_chunks={self.new_chunks})")
+
+
+def chunk_table(key):
+    """Секретная таблица перевода байт в биты (ровно 128 единиц)"""
+    order = sorted(range(256), key=lambda value: hmac.new(key, bytes([value]),
+                                                          'sha256').digest())
+    table = bytearray(256)
+    for value in order[:128]:
+        table[value] = 1
+    return bytes(table)
+
+
+def split_chunks(src, table, min_size=MIN_CHUNK, max_size=MAX_CHUNK, bits=CHUNK_BITS):
+    """Нарезать поток src на фрагменты по содержимому (генератор bytes)"""
+    pattern = b"\x01" + b"\x00" * (bits - 1)
+    rest = b""
+    while True:
+        block = src.read(READ_SIZE)
+        data = rest + block
+        marks = data.translate(table)
+        position = 0
+        # Пока данных меньше max_size, граница может оказаться в следующем блоке
+        while len(data) - position >= max_size or (not block and position < len(data)):
+            found = marks.find(pattern, position + min_size - bits, position + max_size)
+            end = found + bits if found >= 0 else min(position + max_size, len(data))
+            yield data[position:end]
+            position = end
+        rest = data[position:]
+        if not block:
+            return
+
+
+def _subkey(master, context, salt=b""):
+    """Производный ключ хранилища"""
+    return HKDF(bytes(master), KEY_SIZE, salt, SHA256, context=context)
+
+
+def check_snapshot_name(name):
+    """Имя снимка: латиница, цифры, точка, дефис и подчеркивание"""
+    if not isinstance(name, str) or not _SNAPSHOT_NAME.match(name):
+        raise EncryptorError(f"Недопустимое имя снимка: {name}")
+
+
+def init_store(path, password, iterations=DEFAULT_ITERATIONS, kdf_params=None):
+    """Создать пустое хранилище в каталоге path"""
+    config_path = os.path.join(path, CONFIG_NAME)
+    if os.path.exists(config_path):
+        raise EncryptorError(f"Хранилище уже существует: {path}")
+    kdf_params = kdf_params or pbkdf2_params(iterations)
+    salt = get_random_bytes(SALT_SIZE)
+    master = derive_key_params(password, salt, kdf_params)
+    config = {
+        "version": STORE_VERSION,
+        "kdf": dict(kdf_params, salt=header.b64encode(salt)),
+        "check": header.b64encode(keys.key_check(master)),
+        "chunker": {"min": MIN_CHUNK, "max": MAX_CHUNK, "bits": CHUNK_BITS},
+    }
+    for name in (CHUNKS_DIR, SNAPSHOTS_DIR):
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+    _write_atomic(config_path, json.dumps(config, indent=2).encode('utf-8'))
+
+
+def _write_atomic(path, data):
+    """Записать файл целиком через временный файл и os.replace"""
+    fd, temp_file = fsutil.temp_path_near(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        fsutil.replace_atomic(temp_file, path)
+    except BaseException:
+        fsutil.remove_quietly(temp_file)
+        raise
+
+
+def _seal(key, data):
+    """Зашифровать блок со случайным префиксом nonce"""
+    prefix = get_random_bytes(segmented.NONCE_PREFIX_SIZE)
+    return prefix + segmented.encrypt_segment(key, prefix, 0, True, data)
+
+
+def _open(key, data):
+    """Расшифровать блок, записанный _seal"""
+    return segmented.decrypt_segment(key, data[:segmented.NONCE_PREFIX_SIZE], 0, True,
+                                     data[segmented.NONCE_PREFIX_SIZE:])
+
+
+class DedupStore:
+    """Открытое хранилище с дедупликацией"""
+
+    def __init__(self, path, password, session=None):
+        self.path = path
+        try:
+            with open(os.path.join(path, CONFIG_NAME), 'rb') as f:
+                config = json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            raise EncryptorError(f"Хранилище не найдено: {path}")
+        except ValueError:
+            raise FormatError("Хранилище повреждено: неверный store.json")
+        if not isinstance(config, dict) or config.get("version") != STORE_VERSION:
+            raise FormatError("Неподдерживаемая версия хранилища")
+        header.check_kdf(config)
+        keys.check_key_fields(config)
+        chunker = config.get("chunker") or {}
+        self.min_size = chunker.get("min")
+        self.max_size = chunker.get("max")
+        self.bits = chunker.get("bits")
+        if not (isinstance(self.bits, int) and isinstance(self.min_size, int)
+                and isinstance(self.max_size, int)
+                and 8 <= self.bits < self.min_size <= self.max_size <= header.MAX_SEGMENT_SIZE):
+            raise FormatError("Хранилище повреждено: неверные параметры нарезки")
+
+        salt = header.kdf_salt(config)
+        params = header.kdf_params(config)
+        if session is not None:
+            master = session.derive(salt, params)
+        else:
+            master = derive_key_params(password, salt, params)
+        if "check" not in config:
+            raise FormatError("Хранилище повреждено: нет проверочного значения")
+        keys.verify_key(config, master)
+        self._master = master
+        self._id_key = _subkey(master, b"file-encryptor chunk id")
+        self._manifest_key = _subkey(master, b"file-encryptor manifest key")
+        self._table = chunk_table(_subkey(master, b"file-encryptor chunker"))
+
+    def chunk_path(self, chunk_id):
+        """Путь файла фрагмента"""
+        return os.path.join(self.path, CHUNKS_DIR, chunk_id[:2], chunk_id)
+
+    def snapshot_path(self, name):
+        """Путь манифеста снимка"""
+        check_snapshot_name(name)
+        return os.path.join(self.path, SNAPSHOTS_DIR, name + SNAPSHOT_SUFFIX)
+
+    def _chunk_key(self, chunk_id):
+        """Ключ фрагмента: HKDF от мастер-ключа и id фрагмента"""
+        return _subkey(self._master, b"file-encryptor chunk key", bytes.fromhex(chunk_id))
+
+    def _store_chunk(self, data):
+        """Записать фрагмент, если его еще нет; возвращает (id, размер, новый)"""
+        chunk_id = hmac.new(self._id_key, data, 'sha256').hexdigest()
+        path = self.chunk_path(chunk_id)
+        try:
+            stored = os.path.getsize(path)
+        except OSError:
+            stored = None
+        if stored == len(data) + CHUNK_OVERHEAD:
+            return chunk_id, len(data), False
+        # Нет фрагмента или он обрезан (например, сбой без сброса на
+        # диск): записать заново
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, _seal(self._chunk_key(chunk_id), data))
+        return chunk_id, len(data), True
+
+    def _load_chunk(self, chunk_id, size):
+        """Прочитать и расшифровать фрагмент"""
+        try:
+            with open(self.chunk_path(chunk_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FormatError(f"Хранилище повреждено: нет фрагмента {chunk_id}")
+        try:
+            plain = _open(self._chunk_key(chunk_id), data)
+        except SegmentError:
+            raise FormatError(f"Хранилище повреждено: фрагмент {chunk_id} не прошел проверку")
+        if len(plain) != size:
+            raise FormatError(f"Хранилище повреждено: размер фрагмента {chunk_id}")
+        return plain
+
+    def backup(self, files, name=None, progress=None, workers=None, cancel=None):
+        """Сохранить файлы как снимок name; files - список (путь, имя в снимке)
+
+        Возвращает BackupResult. Существующие фрагменты не записываются.
+        """
+        name = name or time.strftime("%Y%m%d-%H%M%S")
+        snapshot_path = self.snapshot_path(name)
+        if os.path.exists(snapshot_path):
+            raise EncryptorError(f"Снимок уже существует: {name}")
+        for _, member in files:
+            archive.safe_path(".", member)
+        tracker = tracker_for(progress, cancel)
+        workers = workers or segmented.default_workers()
+
+        entries = []
+        chunks = new_chunks = new_size = 0
+        tracker.start("Резервное копирование...", sum(os.path.getsize(p) for p, _ in files))
+        for path, member in files:
+            with open(path, 'rb') as src:
+                stat = os.fstat(src.fileno())
+                items = ((data,) for data in split_chunks(src, self._table, self.min_size,
+                                                          self.max_size, self.bits))
+                file_chunks = []
+                for chunk_id, size, is_new in segmented.ordered_map(self._store_chunk,
+                                                                    items, workers):
+                    file_chunks.append([chunk_id, size])
+                    chunks += 1
+                    if is_new:
+                        new_chunks += 1
+                        new_size += size
+                    tracker.advance(size)
+            entries.append({"name": member, "size": sum(size for _, size in file_chunks),
+                            "mtime": stat.st_mtime, "mode": stat.st_mode & 0o777,
+                            "chunks": file_chunks})
+
+        manifest = {"version": STORE_VERSION, "created": time.time(), "files": entries}
+        data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        _write_atomic(snapshot_path, _seal(self._manifest_key, data))
+        if tracker is not progress:
+            tracker.finish("Снимок сохранен")
+        return BackupResult(name, len(entries), chunks, new_chunks,
+                            sum(entry["size"] for entry in entries), new_size)
+
+    def snapshots(self):
+        """Имена снимков по алфавиту"""
+        names = []
+        for filename in os.listdir(os.path.join(self.path, SNAPSHOTS_DIR)):
+            if filename.endswith(SNAPSHOT_SUFFIX):
+                names.append(filename[:-len(SNAPSHOT_SUFFIX)])
+        return sorted(names)
+
+    def manifest(self, name):
+        """Расшифрованный манифест снимка"""
+        try:
+            with open(self.snapshot_path(name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise EncryptorError(f"Снимок не найден: {name}")
+        try:
+            manifest = json.loads(_open(self._manifest_key, data).decode('utf-8'))
+            manifest["files"]
+        except SegmentError:
+            raise FormatError(f"Снимок поврежден: {name}")
+        except (ValueError, KeyError, TypeError):
+            raise FormatError(f"Снимок поврежден: манифест не читается ({name})")
+        return manifest
+
+    def restore(self, name, dest_dir=".", members=None, progress=None, workers=None,
+                cancel=None):
+        """Восстановить файлы снимка (все или members) в dest_dir"""
+        entries = self.manifest(name)["files"]
+        if members:
+            known = {entry["name"] for entry in entries}
+            missing = [member for member in members if member not in known]
+            if missing:
+                raise EncryptorError(f"Файл не найден в снимке: {missing[0]}")
+            entries = [entry for entry in entries if entry["name"] in members]
+        tracker = tracker_for(progress, cancel)
+        workers = workers or segmented.default_workers()
+
+        restored = []
+        tracker.start("Восстановление...", sum(entry["size"] for entry in entries))
+        for entry in entries:
+            output_path = archive.safe_path(dest_dir, entry["name"])
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            try:
+                with open(output_path, 'wb') as dst:
+                    for block in segmented.ordered_map(self._load_chunk, entry["chunks"],
+                                                       workers):
+                        dst.write(block)
+                        tracker.advance(len(block))
+            except BaseException:
+                fsutil.remove_quietly(output_path)
+                raise
+            if entry.get("mode") is not None:
+                os.chmod(output_path, entry["mode"])
+            if entry.get("mtime") is not None:
+                os.utime(output_path, (entry["mtime"], entry["mtime"]))
+            restored.append(output_path)
+        if tracker is not progress:
+            tracker.finish("Восстановление завершено")
+        return restored
+
+
+def open_store(path, password, session=None):
+    """Открыть хранилище (проверяет пароль)"""
+    return DedupStore(path, password, session)
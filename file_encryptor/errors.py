@@ -0,0 +1,29 @@
+"""Исключения шифратора"""
+
+
+class EncryptorError(Exception):
+    """Базовая ошибка шифратора"""
+
+
+class FormatError(EncryptorError):
+    """Файл не является зашифрованным контейнером или поврежден"""
+
+
+class TruncatedError(FormatError):
+    """Файл обрезан: данных меньше, чем указано в заголовке"""
+
+
+class WrongPasswordError(EncryptorError):
+    """Неверный пароль или поврежденный файл"""
+
+
+class SegmentError(FormatError):
+    """Сегмент не прошел проверку подлинности"""
+
+    def __init__(self, message, index):
+        super().__init__(message)
+        self.index = index
+
+
+class CancelledError(EncryptorError):
+    """Операция отменена пользователем"""
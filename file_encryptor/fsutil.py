@@ -0,0 +1,251 @@
+"""Файловые операции для безопасной замены файла на месте
+
+Правки внутри файла (новый заголовок, измененные сегменты) идут через
+журнал повтора: записи сначала целиком пишутся в файл журнала рядом с
+файлом, журнал сбрасывается на диск и атомарно появляется под именем
+.<имя>.redo, и только затем записи переносятся в сам файл. Журнал,
+оставшийся после сбоя, доигрывается при следующем открытии (recover),
+так что файл получает либо все правки, либо ни одной.
+"""
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+from .errors import FormatError
+
+REDO_MAGIC = b'FRDO'
+# Запись журнала: смещение и длина данных; длина END завершает журнал
+_RECORD = struct.Struct(">QQ")
+END = 2 ** 64 - 1
+# Смещение завершающей записи, если размер файла не меняется
+NO_SIZE = 2 ** 64 - 1
+DIGEST_SIZE = 32
+
+# ioctl FICLONE (Linux): reflink-копия на Btrfs/XFS без копирования данных
+FICLONE = 0x40049409
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def fsync_dir(path):
+    """Сбросить на диск запись каталога (после переименования)"""
+    if sys.platform == "win32":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _reflink(src_fd, dst_fd):
+    """Попытка reflink-копии; False, если не поддерживается"""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    """Копирование в ядре через copy_file_range; False, если недоступно"""
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            count = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if count == 0:
+                break
+            copied += count
+    except OSError:
+        if copied:
+            raise
+        return False
+    return True
+
+
+def fast_copy(src_path, dst_path):
+    """Копия файла: reflink, затем copy_file_range, затем обычное копирование"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        if not (_reflink(src.fileno(), dst.fileno())
+                or _copy_file_range(src.fileno(), dst.fileno(), size)):
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    shutil.copystat(src_path, dst_path)
+
+
+def make_backup(path, backup_path):
+    """Резервная копия без копирования данных, если это возможно
+
+    Жесткая ссылка сохраняет исходный inode: после os.replace он остается
+    доступен по backup_path без единой записи данных. Если ссылки не
+    поддерживаются, используется fast_copy.
+    """
+    if os.path.lexists(backup_path):
+        os.remove(backup_path)
+    try:
+        os.link(path, backup_path)
+    except (OSError, AttributeError):
+        fast_copy(path, backup_path)
+
+
+def remove_quietly(path):
+    """Удалить файл, если он есть (например, недописанный после ошибки)"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def temp_path_near(path):
+    """Создать временный файл в каталоге path; возвращает (fd, путь)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    return tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                            dir=directory)
+
+
+def replace_atomic(temp_path, path):
+    """Атомарно заменить path готовым temp_path и сбросить каталог на диск"""
+    os.replace(temp_path, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def redo_path(path):
+    """Путь журнала повтора для path"""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.redo")
+
+
+class PatchJournal:
+    """Правки файла через журнал повтора
+
+    Ведет себя как файл, открытый для записи: seek, tell, write и
+    truncate копятся в журнале, а файл не меняется до commit. Как
+    контекстный менеджер вызывает commit при выходе без ошибки и abort
+    при ошибке.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd, self._temp = temp_path_near(path)
+        self._journal = os.fdopen(fd, 'wb')
+        self._journal.write(REDO_MAGIC)
+        self._digest = hashlib.sha256(REDO_MAGIC)
+        self._position = 0
+        self._size = NO_SIZE
+
+    def seek(self, position):
+        self._position = position
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        record = _RECORD.pack(self._position, len(data))
+        for part in (record, data):
+            self._journal.write(part)
+            self._digest.update(part)
+        self._position += len(data)
+        # Запись после конца файла отменяет прежнее усечение
+        if self._size != NO_SIZE:
+            self._size = max(self._size, self._position)
+        return len(data)
+
+    def truncate(self):
+        self._size = self._position
+
+    def commit(self):
+        """Сбросить журнал на диск, перенести правки в файл и удалить журнал"""
+        redo = redo_path(self.path)
+        try:
+            end = _RECORD.pack(self._size, END)
+            self._journal.write(end)
+            self._digest.update(end)
+            self._journal.write(self._digest.digest())
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            replace_atomic(self._temp, redo)
+        except BaseException:
+            self.abort()
+            raise
+        _replay(redo, self.path)
+
+    def abort(self):
+        """Отказаться от правок: файл не менялся"""
+        self._journal.close()
+        remove_quietly(self._temp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def _check_journal(journal):
+    """Сверить контрольную сумму журнала (SHA-256 всего, что перед ней)"""
+    size = os.fstat(journal.fileno()).st_size - DIGEST_SIZE
+    if size < len(REDO_MAGIC):
+        raise FormatError("Журнал повтора поврежден")
+    digest = hashlib.sha256()
+    remaining = size
+    while remaining:
+        block = journal.read(min(remaining, 1024 * 1024))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    if remaining or journal.read() != digest.digest():
+        raise FormatError("Журнал повтора поврежден")
+    journal.seek(0)
+
+
+def _read_journal(journal):
+    """Записи журнала (смещение, данные), затем (размер, None)"""
+    if journal.read(len(REDO_MAGIC)) != REDO_MAGIC:
+        raise FormatError("Журнал повтора поврежден")
+    while True:
+        offset, length = _RECORD.unpack(journal.read(_RECORD.size))
+        if length == END:
+            yield offset, None
+            return
+        yield offset, journal.read(length)
+
+
+def _replay(redo, path):
+    """Перенести записи журнала в файл (повторный перенос безвреден)"""
+    with open(redo, 'rb') as journal, open(path, 'r+b') as dst:
+        _check_journal(journal)
+        for offset, data in _read_journal(journal):
+            if data is None:
+                if offset != NO_SIZE:
+                    dst.truncate(offset)
+                break
+            dst.seek(offset)
+            dst.write(data)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.remove(redo)
+    fsync_dir(os.path.dirname(redo))
+
+
+def recover(path):
+    """Доиграть журнал повтора, оставшийся после сбоя; True, если он был"""
+    redo = redo_path(path)
+    if not os.path.exists(redo):
+        return False
+    _replay(redo, path)
+    return True
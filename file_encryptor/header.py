@@ -0,0 +1,171 @@
+"""Версионированный заголовок контейнера FENC
+
+Структура: FENC (4) + версия (1) + длина заголовка (4, big-endian)
++ заголовок в JSON. Двоичные поля хранятся в base64.
+"""
+import base64
+import json
+import os
+import struct
+
+from .errors import FormatError, TruncatedError
+from .kdf import SALT_SIZE, check_params
+
+MAGIC = b'FENC'
+VERSION = 1
+
+_PREFIX = struct.Struct(">4sBI")
+PREFIX_SIZE = _PREFIX.size
+# Защита от чтения огромного "заголовка" из поврежденного файла
+MAX_HEADER_SIZE = 64 * 1024
+MAX_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Запас в заголовке новых файлов: добавление или смена пароля
+# переписывает заголовок на месте, не сдвигая данные
+HEADER_RESERVE = 1024
+# Не более стольких слотов ключа (паролей) в одном файле
+MAX_KEY_SLOTS = 16
+
+# Поле type: отсутствует у одиночных файлов, "archive" - у архивов,
+# "incremental" - у файлов с инкрементальным обновлением, "stream" - у
+# потокового формата для каналов (без длины, данные кадрами)
+TYPE_ARCHIVE = "archive"
+TYPE_INCREMENTAL = "incremental"
+TYPE_STREAM = "stream"
+
+
+def b64encode(data):
+    """Двоичные данные в строку для JSON"""
+    return base64.b64encode(data).decode('ascii')
+
+
+def b64decode(text):
+    """Строка из JSON в двоичные данные"""
+    try:
+        return base64.b64decode(text.encode('ascii'), validate=True)
+    except (ValueError, AttributeError):
+        raise FormatError("Файл поврежден: неверное поле заголовка")
+
+
+def pack_header(fields, size=None):
+    """Сериализовать заголовок в байты
+
+    JSON дополняется пробелами: до size байт всего заголовка, если size
+    задан, иначе на HEADER_RESERVE байт. Если заголовок не помещается в
+    size, возвращается None.
+    """
+    body = json.dumps(fields, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    target = len(body) + HEADER_RESERVE if size is None else size - _PREFIX.size
+    if target < len(body):
+        return None
+    if target > MAX_HEADER_SIZE:
+        raise FormatError("Заголовок слишком большой")
+    body += b" " * (target - len(body))
+    return _PREFIX.pack(MAGIC, VERSION, len(body)) + body
+
+
+def write_header(dst, fields):
+    """Записать заголовок; возвращает его размер в байтах"""
+    data = pack_header(fields)
+    dst.write(data)
+    return len(data)
+
+
+def parse_prefix(data):
+    """Проверить первые PREFIX_SIZE байт; возвращает размер JSON заголовка"""
+    if len(data) != _PREFIX.size or not data.startswith(MAGIC):
+        raise FormatError("Неверный формат файла")
+    _, version, size = _PREFIX.unpack(data)
+    if version != VERSION:
+        raise FormatError(f"Неподдерживаемая версия формата: {version}")
+    if size > MAX_HEADER_SIZE:
+        raise FormatError("Файл поврежден: неверный размер заголовка")
+    return size
+
+
+def parse_body(body):
+    """Разобрать JSON заголовка"""
+    try:
+        fields = json.loads(body.decode('utf-8'))
+    except ValueError:
+        raise FormatError("Файл поврежден: заголовок не читается")
+    if not isinstance(fields, dict):
+        raise FormatError("Файл поврежден: заголовок не читается")
+    return fields
+
+
+def read_header(src, magic=None):
+    """Прочитать заголовок; magic - уже прочитанные первые 4 байта"""
+    if magic is None:
+        magic = src.read(len(MAGIC))
+    size = parse_prefix(magic + src.read(_PREFIX.size - len(MAGIC)))
+
+    body = src.read(size)
+    if len(body) != size:
+        raise TruncatedError("Файл поврежден: неполный заголовок")
+    return parse_body(body), _PREFIX.size + size
+
+
+def stream_length(stream):
+    """Оставшийся размер потока или None, если поток без произвольного доступа"""
+    try:
+        if not stream.seekable():
+            return None
+        position = stream.tell()
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def kdf_params(fields):
+    """Параметры KDF из заголовка без соли"""
+    return {name: value for name, value in fields["kdf"].items() if name != "salt"}
+
+
+def kdf_salt(fields):
+    """Соль KDF из заголовка"""
+    salt = b64decode(fields["kdf"].get("salt", ""))
+    if len(salt) != SALT_SIZE:
+        raise FormatError("Файл поврежден: неверная соль")
+    return salt
+
+
+def check_common(fields):
+    """Проверить общие поля заголовка до запуска KDF"""
+    cipher = fields.get("cipher")
+    length = fields.get("length")
+    segment_size = fields.get("segment_size")
+    if not isinstance(cipher, str):
+        raise FormatError("Файл поврежден: не указан шифр")
+    if not isinstance(length, int) or length < 0:
+        raise FormatError("Файл поврежден: неверная длина данных")
+    if not isinstance(segment_size, int) or not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise FormatError("Файл поврежден: неверный размер сегмента")
+    check_kdf(fields)
+
+
+def key_slots(fields):
+    """Слоты ключа заголовка (None у файлов без слотов)"""
+    slots = fields.get("slots")
+    if slots is None:
+        return None
+    if not isinstance(slots, list) or not 0 < len(slots) <= MAX_KEY_SLOTS:
+        raise FormatError("Файл поврежден: неверные слоты ключа")
+    return slots
+
+
+def check_kdf(fields):
+    """Проверить параметры KDF и соль в заголовке (или в каждом слоте ключа)"""
+    slots = key_slots(fields)
+    if slots is not None:
+        for slot in slots:
+            if not isinstance(slot, dict):
+                raise FormatError("Файл поврежден: неверные слоты ключа")
+            check_kdf(slot)
+        return
+    if not isinstance(fields.get("kdf"), dict):
+        raise FormatError("Файл поврежден: неверные параметры KDF")
+    check_params(kdf_params(fields))
+    kdf_salt(fields)
@@ -0,0 +1,324 @@
+"""Инкрементальное перешифрование: перезаписываются только измененные сегменты
+
+Структура файла (type=incremental):
+    заголовок FENC (KDF, соль, проверочное значение, размер сегмента) -
+        не зависит от длины данных и не меняется при обновлении
+    сегменты - префикс nonce (8 байт) + шифртекст AES-256-GCM + тег;
+        префикс случайный при каждой записи сегмента, так что nonce
+        измененного сегмента не повторяется
+    индекс - длина данных и отпечатки сегментов (HMAC-SHA256 открытого
+        текста под отдельным ключом, 16 байт), зашифрованные AES-GCM
+    окончание (24 байта): FINC + смещение индекса + размер индекса
+
+При обновлении новый открытый текст читается целиком, но отпечатки
+сравниваются с индексом, и записываются только сегменты, которые
+изменились (и последний сегмент, если сменилась длина). Запись и чтение
+шифртекста пропорциональны объему изменений. При дешифровании каждый
+сегмент сверяется с отпечатком индекса, поэтому подмена сегмента старой
+версией или прерванное обновление обнаруживаются.
+"""
+import hmac
+import os
+import struct
+
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+from Crypto.Random import get_random_bytes
+
+from . import fsutil, header, keys, segmented
+from .errors import EncryptorError, FormatError, SegmentError, TruncatedError
+from .kdf import DEFAULT_ITERATIONS, KEY_SIZE
+from .progress import tracker_for
+
+FINGERPRINT_NAME = "hmac-sha256-128"
+FINGERPRINT_SIZE = 16
+TRAILER_MAGIC = b'FINC'
+_TRAILER = struct.Struct(">4sQQ")
+TRAILER_SIZE = _TRAILER.size
+_LENGTH = struct.Struct(">Q")
+_INDEX = struct.Struct(">Q")
+
+# Служебные данные сегмента: префикс nonce и тег
+SEGMENT_OVERHEAD = segmented.NONCE_PREFIX_SIZE + segmented.TAG_SIZE
+
+
+class UpdateResult:
+    """Итог обновления: сколько сегментов перезаписано из скольких"""
+
+    def __init__(self, changed, total, length):
+        self.changed = changed
+        self.total = total
+        self.length = length
+
+    def __repr__(self):
+        return f"UpdateResult(changed={self.changed}, total={self.total})"
+
+
+def _subkey(file_key, context):
+    """Подключ файла для индекса или отпечатков"""
+    return HKDF(bytes(file_key), KEY_SIZE, b"", SHA256, context=context)
+
+
+def index_key(file_key):
+    """Ключ шифрования индекса"""
+    return _subkey(file_key, b"file-encryptor index key")
+
+
+def fingerprint_key(file_key):
+    """Ключ отпечатков сегментов"""
+    return _subkey(file_key, b"file-encryptor fingerprint key")
+
+
+def fingerprint(key, index, data):
+    """Отпечаток открытого текста сегмента (номер входит в отпечаток)"""
+    return hmac.new(key, _INDEX.pack(index) + data, 'sha256').digest()[:FINGERPRINT_SIZE]
+
+
+def body_size(length, segment_size):
+    """Размер сегментов после заголовка"""
+    count = segmented.segment_count(length, segment_size)
+    return length + count * SEGMENT_OVERHEAD
+
+
+def check_header(fields):
+    """Проверить поля заголовка до запуска KDF"""
+    segment_size = fields.get("segment_size")
+    if fields.get("cipher") != segmented.CIPHER_NAME:
+        raise FormatError(f"Неподдерживаемый шифр: {fields.get('cipher')}")
+    if not isinstance(segment_size, int) or not 0 < segment_size <= header.MAX_SEGMENT_SIZE:
+        raise FormatError("Файл поврежден: неверный размер сегмента")
+    if fields.get("fingerprint") != FINGERPRINT_NAME:
+        raise FormatError(f"Неподдерживаемый отпечаток: {fields.get('fingerprint')}")
+    header.check_kdf(fields)
+    keys.check_key_fields(fields)
+    if "check" not in fields:
+        raise FormatError("Файл поврежден: нет проверочного значения")
+
+
+def read_index(src, data_offset, fields, file_key):
+    """Прочитать окончание и индекс; возвращает (длина, список отпечатков)"""
+    segment_size = fields["segment_size"]
+    file_size = os.fstat(src.fileno()).st_size
+    if file_size < data_offset + TRAILER_SIZE:
+        raise TruncatedError("Файл поврежден: нет индекса")
+    src.seek(file_size - TRAILER_SIZE)
+    magic, index_offset, index_size = _TRAILER.unpack(src.read(TRAILER_SIZE))
+    if magic != TRAILER_MAGIC or index_offset + index_size != file_size - TRAILER_SIZE:
+        raise FormatError("Файл поврежден: неверное окончание")
+    if index_size < SEGMENT_OVERHEAD + _LENGTH.size or index_offset < data_offset:
+        raise FormatError("Файл поврежден: неверный индекс")
+
+    src.seek(index_offset)
+    block = src.read(index_size)
+    try:
+        plain = segmented.decrypt_segment(index_key(file_key),
+                                          block[:segmented.NONCE_PREFIX_SIZE], 0, True,
+                                          block[segmented.NONCE_PREFIX_SIZE:])
+    except SegmentError:
+        raise FormatError("Файл поврежден: индекс не прошел проверку")
+    length, = _LENGTH.unpack_from(plain)
+    count = segmented.segment_count(length, segment_size)
+    table = plain[_LENGTH.size:]
+    if (len(table) != count * FINGERPRINT_SIZE
+            or index_offset != data_offset + body_size(length, segment_size)):
+        raise FormatError("Файл поврежден: индекс не совпадает с данными")
+    prints = [table[i:i + FINGERPRINT_SIZE] for i in range(0, len(table), FINGERPRINT_SIZE)]
+    return length, prints
+
+
+def write_index(dst, file_key, length, prints):
+    """Записать индекс и окончание в текущую позицию dst"""
+    plain = _LENGTH.pack(length) + b"".join(prints)
+    prefix = get_random_bytes(segmented.NONCE_PREFIX_SIZE)
+    block = prefix + segmented.encrypt_segment(index_key(file_key), prefix, 0, True, plain)
+    index_offset = dst.tell()
+    dst.write(block)
+    dst.write(_TRAILER.pack(TRAILER_MAGIC, index_offset, len(block)))
+
+
+def _decrypt_segment(key, fp_key, index, final, data, expected):
+    """Расшифровать сегмент и сверить его с отпечатком индекса"""
+    prefix = data[:segmented.NONCE_PREFIX_SIZE]
+    plain = segmented.decrypt_segment(key, prefix, index, final,
+                                      data[segmented.NONCE_PREFIX_SIZE:])
+    if not hmac.compare_digest(fingerprint(fp_key, index, plain), expected):
+        raise SegmentError(f"Файл поврежден: сегмент {index} не совпадает с индексом",
+                           index)
+    return plain
+
+
+def decrypt_body(src, dst, fields, file_key, tracker=None, workers=None):
+    """Дешифрование после заголовка (src стоит на начале сегментов)"""
+    tracker = tracker_for(tracker)
+    workers = workers or segmented.default_workers()
+    data_offset = src.tell()
+    length, prints = read_index(src, data_offset, fields, file_key)
+    segment_size = fields["segment_size"]
+    count = len(prints)
+    key = keys.data_key(file_key)
+    fp_key = fingerprint_key(file_key)
+
+    def segments():
+        src.seek(data_offset)
+        for index in range(count):
+            size = min(segment_size, length - index * segment_size) + SEGMENT_OVERHEAD
+            data = src.read(size)
+            if len(data) != size:
+                raise TruncatedError("Файл поврежден: данные обрезаны")
+            yield key, fp_key, index, index == count - 1, data, prints[index]
+
+    tracker.start("Дешифрование данных...", length)
+    for block in segmented.ordered_map(_decrypt_segment, segments(), workers):
+        dst.write(block)
+        tracker.advance(len(block))
+
+
+def _update_segment(key, fp_key, index, final, data, old):
+    """Отпечаток сегмента и новый шифртекст, если сегмент изменился"""
+    current = fingerprint(fp_key, index, data)
+    if old is not None and hmac.compare_digest(current, old):
+        return current, None
+    prefix = get_random_bytes(segmented.NONCE_PREFIX_SIZE)
+    return current, prefix + segmented.encrypt_segment(key, prefix, index, final, data)
+
+
+def _write_segments(src, dst, data_offset, file_key, length, segment_size, old,
+                    tracker, workers):
+    """Записать измененные сегменты; возвращает (отпечатки, число записанных)
+
+    old - отпечатки прежней версии, где None означает "переписать".
+    """
+    count = segmented.segment_count(length, segment_size)
+    stride = segment_size + SEGMENT_OVERHEAD
+    key = keys.data_key(file_key)
+    fp_key = fingerprint_key(file_key)
+
+    def segments():
+        for index in range(count):
+            data = src.read(segment_size)
+            if len(data) != min(segment_size, length - index * segment_size):
+                raise EncryptorError("Файл изменился во время чтения")
+            previous = old[index] if index < len(old) else None
+            yield key, fp_key, index, index == count - 1, data, previous
+
+    prints = []
+    changed = 0
+    for index, (current, block) in enumerate(
+            segmented.ordered_map(_update_segment, segments(), workers)):
+        prints.append(current)
+        if block is not None:
+            dst.seek(data_offset + index * stride)
+            dst.write(block)
+            changed += 1
+        tracker.advance(min(segment_size, length - index * segment_size))
+    return prints, changed
+
+
+def _old_prints(prints, new_count):
+    """Отпечатки прежней версии с пометкой сегментов, которые надо переписать
+
+    Признак последнего сегмента входит в AAD: при смене числа сегментов
+    прежний и новый последние сегменты переписываются.
+    """
+    old = list(prints)
+    if len(old) != new_count:
+        for index in (len(old) - 1, new_count - 1):
+            if 0 <= index < len(old):
+                old[index] = None
+    return old
+
+
+def update_file(input_path, output_path, password, iterations=DEFAULT_ITERATIONS,
+                progress=None, workers=None, session=None, kdf_params=None,
+                segment_size=segmented.SEGMENT_SIZE, cancel=None, atomic=True):
+    """Зашифровать input_path в output_path, перезаписав только изменения
+
+    Если output_path нет, файл создается целиком. Иначе заголовок и
+    индекс читаются с паролем, и перезаписываются только сегменты с
+    другим отпечатком. По умолчанию (atomic) измененные сегменты и новый
+    индекс сначала пишутся в журнал повтора (fsutil.PatchJournal), а
+    затем на место в файле: при сбое остается прежняя версия, а
+    записанный журнал доигрывается при следующем открытии. Измененные
+    сегменты записываются дважды, но файл не копируется. С atomic=False
+    сегменты меняются прямо в файле: сбой во время обновления оставит
+    файл, который не расшифровывается (отпечатки не сойдутся), а при
+    росте файла новые сегменты затирают старый индекс. Возвращает
+    UpdateResult.
+    """
+    tracker = tracker_for(progress, cancel)
+    workers = workers or segmented.default_workers()
+    if not os.path.exists(output_path):
+        return _create(input_path, output_path, password, iterations, tracker,
+                       workers, session, kdf_params, segment_size, progress)
+
+    fsutil.recover(output_path)
+    journal = None
+    mode = 'rb' if atomic else 'r+b'
+    try:
+        with open(input_path, 'rb') as src, open(output_path, mode) as dst:
+            fields, data_offset = header.read_header(dst)
+            if fields.get("type") != header.TYPE_INCREMENTAL:
+                raise EncryptorError("Выходной файл не создан в режиме обновления")
+            check_header(fields)
+            tracker.stage("Восстановление ключа...")
+            file_key = keys.key_from_header(fields, password, session)
+            _, prints = read_index(dst, data_offset, fields, file_key)
+
+            segment_size = fields["segment_size"]
+            length = os.fstat(src.fileno()).st_size
+            old = _old_prints(prints, segmented.segment_count(length, segment_size))
+            out = dst
+            if atomic:
+                journal = out = fsutil.PatchJournal(output_path)
+            tracker.start("Сравнение и шифрование...", length)
+            prints, changed = _write_segments(src, out, data_offset, file_key, length,
+                                              segment_size, old, tracker, workers)
+            if not atomic:
+                dst.flush()
+                os.fsync(dst.fileno())
+            # Индекс пишется после сегментов: при сбое до этого момента
+            # старый индекс не совпадет с новыми сегментами
+            out.seek(data_offset + body_size(length, segment_size))
+            write_index(out, file_key, length, prints)
+            out.truncate()
+            if not atomic:
+                dst.flush()
+                os.fsync(dst.fileno())
+    except BaseException:
+        if journal is not None:
+            journal.abort()
+        raise
+    if journal is not None:
+        journal.commit()
+    if tracker is not progress:
+        tracker.finish("Обновление завершено")
+    return UpdateResult(changed, len(prints), length)
+
+
+def _create(input_path, output_path, password, iterations, tracker, workers,
+            session, kdf_params, segment_size, progress):
+    """Создать файл в режиме обновления (все сегменты записываются)"""
+    if not 0 < segment_size <= header.MAX_SEGMENT_SIZE:
+        raise EncryptorError("Недопустимый размер сегмента")
+    tracker.stage("Генерация ключа...")
+    file_key, fields = keys.new_file_keys(password, iterations, kdf_params, session)
+    fields.update({
+        "type": header.TYPE_INCREMENTAL,
+        "cipher": segmented.CIPHER_NAME,
+        "segment_size": segment_size,
+        "fingerprint": FINGERPRINT_NAME,
+    })
+    try:
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            data_offset = header.write_header(dst, fields)
+            length = os.fstat(src.fileno()).st_size
+            tracker.start("Шифрование данных...", length)
+            prints, changed = _write_segments(src, dst, data_offset, file_key, length,
+                                              segment_size, [], tracker, workers)
+            write_index(dst, file_key, length, prints)
+    except BaseException:
+        fsutil.remove_quietly(output_path)
+        raise
+    if tracker is not progress:
+        tracker.finish("Шифрование завершено")
+    return UpdateResult(changed, len(prints), length)
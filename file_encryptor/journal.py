@@ -0,0 +1,108 @@
+"""Журнал операций: кольцевой буфер в памяти и файл JSON-lines с ротацией
+
+Записи добавляются из любого потока и ничего не стоят интерфейсу: они
+копятся в кольцевом буфере фиксированного размера, а интерфейс раз в
+период опроса забирает новые записи пачкой (take_pending). Файл журнала
+пишет фоновый поток (logging.handlers.QueueListener) через ограниченную
+очередь: при переполнении записи отбрасываются, а не задерживают
+вызывающий поток. Файл ротируется по размеру (RotatingFileHandler).
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import deque
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+# Записей в очереди фонового потока, после которых новые отбрасываются
+FILE_QUEUE_SIZE = 10000
+
+
+class LogEntry:
+    """Запись журнала"""
+
+    __slots__ = ("time", "level", "message")
+
+    def __init__(self, time, level, message):
+        self.time = time
+        self.level = level
+        self.message = message
+
+    def to_dict(self):
+        return {"time": round(self.time, 3), "level": self.level,
+                "message": self.message}
+
+    def __repr__(self):
+        return f"LogEntry({self.level}, {self.message!r})"
+
+
+class Journal:
+    """Журнал с ограниченным буфером и необязательным файлом JSON-lines"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        # Записи, еще не забранные интерфейсом; при отставании старые
+        # вытесняются, как и в основном буфере
+        self._pending = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._listener = None
+        self.dropped = 0
+
+    def add(self, message, level="INFO"):
+        """Добавить запись (из любого потока); возвращает LogEntry"""
+        entry = LogEntry(time.time(), level, message)
+        with self._lock:
+            self._entries.append(entry)
+            self._pending.append(entry)
+        file_queue = self._queue
+        if file_queue is not None:
+            line = json.dumps(entry.to_dict(), ensure_ascii=False)
+            try:
+                file_queue.put_nowait(logging.makeLogRecord({"msg": line}))
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+        return entry
+
+    def entries(self):
+        """Все записи буфера, от старых к новым"""
+        with self._lock:
+            return list(self._entries)
+
+    def take_pending(self):
+        """Забрать записи, добавленные после предыдущего вызова"""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        return pending
+
+    def clear(self):
+        """Очистить буфер (файл журнала не меняется)"""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+    def open_file(self, path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        """Писать записи в файл JSON-lines с ротацией (фоновым потоком)"""
+        self.close_file()
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue = queue.Queue(FILE_QUEUE_SIZE)
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def close_file(self):
+        """Дописать очередь и закрыть файл журнала"""
+        if self._listener is None:
+            return
+        listener, self._listener, self._queue = self._listener, None, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
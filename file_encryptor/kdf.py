@@ -0,0 +1,153 @@
+"""Получение ключей из пароля: PBKDF2-SHA256 и scrypt, калибровка стоимости"""
+import hashlib
+import time
+
+from Crypto.Random import get_random_bytes
+
+from . import metrics
+from .errors import FormatError
+
+SALT_SIZE = 16
+KEY_SIZE = 32  # AES-256 требует 32 байта
+
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_SCRYPT = "scrypt"
+KDF_NAMES = (KDF_PBKDF2, KDF_SCRYPT)
+
+DEFAULT_ITERATIONS = 100000
+MIN_ITERATIONS = 10000
+MAX_ITERATIONS = 500000
+# Верхняя граница для калибровки и для значений из заголовка
+MAX_CALIBRATED_ITERATIONS = 10000000
+
+DEFAULT_SCRYPT_N = 2 ** 15
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+MAX_SCRYPT_MEMORY = 1024 * 1024 * 1024
+
+# Целевое время разблокировки для калибровки, мс
+DEFAULT_TARGET_MS = 250
+
+
+def derive_key(password, salt=None, iterations=DEFAULT_ITERATIONS):
+    """Создание ключа из пароля с использованием PBKDF2"""
+    if salt is None:
+        salt = get_random_bytes(SALT_SIZE)
+
+    with metrics.timed("kdf"):
+        key = hashlib.pbkdf2_hmac(
+            'sha256',
+            password.encode('utf-8'),
+            salt,
+            iterations,
+            dklen=KEY_SIZE
+        )
+    return key, salt
+
+
+def pbkdf2_params(iterations=DEFAULT_ITERATIONS):
+    """Параметры PBKDF2 для заголовка"""
+    return {"name": KDF_PBKDF2, "iterations": iterations}
+
+
+def scrypt_params(n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P):
+    """Параметры scrypt для заголовка"""
+    return {"name": KDF_SCRYPT, "n": n, "r": r, "p": p}
+
+
+def scrypt_memory(n, r, p):
+    """Память, требуемая scrypt, в байтах"""
+    return 128 * r * (n + p + 2)
+
+
+def check_params(params):
+    """Проверить параметры KDF (например, из заголовка) до запуска KDF"""
+    if not isinstance(params, dict):
+        raise FormatError("Файл поврежден: неверные параметры KDF")
+    name = params.get("name")
+    if name == KDF_PBKDF2:
+        iterations = params.get("iterations")
+        if not isinstance(iterations, int) or not 0 < iterations <= MAX_CALIBRATED_ITERATIONS:
+            raise FormatError("Файл поврежден: неверное число итераций")
+    elif name == KDF_SCRYPT:
+        n, r, p = params.get("n"), params.get("r"), params.get("p")
+        if not all(isinstance(value, int) and value > 0 for value in (n, r, p)):
+            raise FormatError("Файл поврежден: неверные параметры scrypt")
+        if n < 2 or n & (n - 1):
+            raise FormatError("Файл поврежден: параметр scrypt N не степень двойки")
+        if scrypt_memory(n, r, p) > MAX_SCRYPT_MEMORY:
+            raise FormatError("Параметры scrypt требуют слишком много памяти")
+    else:
+        raise FormatError(f"Неподдерживаемый алгоритм получения ключа: {name}")
+
+
+def derive_key_params(password, salt, params):
+    """Ключ из пароля по параметрам KDF (PBKDF2 или scrypt)"""
+    check_params(params)
+    if params["name"] == KDF_PBKDF2:
+        return derive_key(password, salt, params["iterations"])[0]
+    n, r, p = params["n"], params["r"], params["p"]
+    with metrics.timed("kdf"):
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=scrypt_memory(n, r, p) + 1024 * 1024,
+                              dklen=KEY_SIZE)
+
+
+def params_key(params):
+    """Хешируемое представление параметров KDF (для кэша ключей)"""
+    return tuple(sorted(params.items()))
+
+
+def _measure(params, repeat=3):
+    """Лучшее из repeat время одного получения ключа, в секундах"""
+    salt = get_random_bytes(SALT_SIZE)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        derive_key_params("calibration", salt, params)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def pbkdf2_rate():
+    """Скорость PBKDF2 на этой машине, итераций в секунду"""
+    iterations = MIN_ITERATIONS
+    # Увеличиваем выборку, пока замер не станет достаточно длинным
+    while True:
+        elapsed = _measure(pbkdf2_params(iterations))
+        if elapsed >= 0.05 or iterations >= MAX_CALIBRATED_ITERATIONS:
+            return iterations / elapsed
+        iterations *= 2
+
+
+def calibrate_iterations(target_ms=DEFAULT_TARGET_MS, rate=None):
+    """Число итераций PBKDF2, дающее время разблокировки target_ms"""
+    rate = rate or pbkdf2_rate()
+    iterations = int(rate * target_ms / 1000)
+    # Округление до тысяч для читаемости
+    iterations = round(iterations, -3)
+    return max(MIN_ITERATIONS, min(MAX_CALIBRATED_ITERATIONS, iterations))
+
+
+def calibrate_scrypt(target_ms=DEFAULT_TARGET_MS, r=DEFAULT_SCRYPT_R,
+                     p=DEFAULT_SCRYPT_P, max_memory=MAX_SCRYPT_MEMORY):
+    """Параметры scrypt: наибольшее N, укладывающееся во время и память"""
+    n = 2 ** 12
+    while True:
+        next_n = n * 2
+        if scrypt_memory(next_n, r, p) > max_memory:
+            break
+        elapsed = _measure(scrypt_params(n, r, p), repeat=1)
+        # Время scrypt растет линейно по N
+        if elapsed * 2 * 1000 > target_ms:
+            break
+        n = next_n
+    return scrypt_params(n, r, p)
+
+
+def estimate_seconds(params, rate=None):
+    """Оценка времени получения ключа; для PBKDF2 по измеренной скорости"""
+    if params["name"] == KDF_PBKDF2:
+        return params["iterations"] / (rate or pbkdf2_rate())
+    return _measure(params, repeat=1)
@@ -0,0 +1,276 @@
+"""Ключи файлов: конвертное шифрование и сессия с одним KDF на пароль
+
+Данные файла шифруются случайным ключом файла, а в заголовке хранятся
+слоты: ключ файла, зашифрованный (AES-GCM) ключом, полученным из пароля.
+Слотов может быть несколько (несколько паролей или файлов-ключей), и
+смена пароля переписывает только слот, а не данные.
+
+В сессии ключ пароля получается из пароля и соли сессии один раз, и
+все слоты новых файлов используют его без повторного KDF. Для
+расшифровки многих файлов с общей солью ключи хранятся в ограниченном
+LRU-кэше только в памяти. При закрытии сессии ключевой материал затирается.
+
+Файлы ранних версий без слотов (ключ файла получается из пароля
+напрямую или через HKDF от мастер-ключа сессии) по-прежнему читаются.
+"""
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+from Crypto.Random import get_random_bytes
+
+from . import header
+from .errors import EncryptorError, FormatError, WrongPasswordError
+from .kdf import (DEFAULT_ITERATIONS, KEY_SIZE, SALT_SIZE, derive_key_params,
+                  params_key, pbkdf2_params)
+
+# Способ получения ключа файла, записываемый в заголовок
+HKDF_MODE = "hkdf-sha256"
+FILE_NONCE_SIZE = 16
+DEFAULT_CACHE_SIZE = 64
+
+# Размер зашифрованного ключа в слоте: префикс nonce + ключ + тег GCM
+WRAPPED_SIZE = 8 + KEY_SIZE + 16
+
+# Константа, HMAC которой под производным ключом служит проверочным значением
+KEY_CHECK_CONSTANT = b"file-encryptor key check v1"
+
+
+def file_key(master_key, nonce):
+    """Ключ файла из мастер-ключа сессии и nonce файла"""
+    return HKDF(bytes(master_key), KEY_SIZE, nonce, SHA256,
+                context=b"file-encryptor file key")
+
+
+def data_key(file_key):
+    """Ключ шифрования данных, производный от ключа файла"""
+    return HKDF(bytes(file_key), KEY_SIZE, b"", SHA256,
+                context=b"file-encryptor segment key")
+
+
+def key_check(file_key):
+    """Проверочное значение ключа: HMAC константы под отдельным подключом"""
+    check_key = HKDF(bytes(file_key), KEY_SIZE, b"", SHA256,
+                     context=b"file-encryptor key check")
+    return hmac.new(check_key, KEY_CHECK_CONSTANT, 'sha256').digest()
+
+
+def verify_key(fields, file_key):
+    """Сверить ключ с проверочным значением заголовка (если оно есть)"""
+    if "check" not in fields:
+        return False
+    expected = header.b64decode(fields["check"])
+    if not hmac.compare_digest(expected, key_check(file_key)):
+        raise WrongPasswordError("Неверный пароль")
+    return True
+
+
+def keyfile_password(path):
+    """Пароль из файла-ключа: SHA-256 его содержимого"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return "keyfile:" + digest.hexdigest()
+
+
+def _wrap_key(password_key):
+    """Ключ шифрования слота из ключа пароля"""
+    return HKDF(bytes(password_key), KEY_SIZE, b"", SHA256,
+                context=b"file-encryptor key wrap")
+
+
+def new_slot(file_key, password, iterations=DEFAULT_ITERATIONS, kdf_params=None,
+             session=None):
+    """Слот заголовка: ключ файла, зашифрованный ключом пароля
+
+    С сессией KDF не выполняется заново: используется ключ пароля сессии.
+    """
+    if session is not None:
+        salt, kdf_params = session.salt, session.kdf_params
+        password_key = session.master_key()
+    else:
+        kdf_params = kdf_params or pbkdf2_params(iterations)
+        salt = get_random_bytes(SALT_SIZE)
+        password_key = derive_key_params(password, salt, kdf_params)
+    prefix = get_random_bytes(8)
+    cipher = AES.new(_wrap_key(password_key), AES.MODE_GCM, nonce=prefix, mac_len=16)
+    wrapped, tag = cipher.encrypt_and_digest(bytes(file_key))
+    return {"kdf": dict(kdf_params, salt=header.b64encode(salt)),
+            "wrapped": header.b64encode(prefix + wrapped + tag)}
+
+
+def _unwrap(slot, password_key):
+    """Ключ файла из слота или None, если ключ пароля не подходит"""
+    data = header.b64decode(slot["wrapped"])
+    cipher = AES.new(_wrap_key(password_key), AES.MODE_GCM, nonce=data[:8], mac_len=16)
+    try:
+        return cipher.decrypt_and_verify(data[8:-16], data[-16:])
+    except ValueError:
+        return None
+
+
+def new_file_keys(password, iterations=DEFAULT_ITERATIONS, kdf_params=None,
+                  session=None):
+    """Случайный ключ нового файла и поля заголовка slots/check"""
+    key = get_random_bytes(KEY_SIZE)
+    fields = {"slots": [new_slot(key, password, iterations, kdf_params, session)],
+              "check": header.b64encode(key_check(key))}
+    return key, fields
+
+
+def unlock(fields, password, session=None):
+    """Ключ файла по паролю; возвращает (ключ, номер слота или None)
+
+    У файлов без слотов ключ получается из пароля напрямую.
+    """
+    nonce = check_key_fields(fields)
+    slots = header.key_slots(fields)
+    if slots is None:
+        key = _password_key(fields, password, session)
+        if nonce is not None:
+            key = file_key(key, nonce)
+        verify_key(fields, key)
+        return key, None
+    for index, slot in enumerate(slots):
+        key = _unwrap(slot, _password_key(slot, password, session))
+        if key is not None:
+            verify_key(fields, key)
+            return key, index
+    raise WrongPasswordError("Неверный пароль")
+
+
+def _password_key(fields, password, session):
+    """Ключ пароля по параметрам KDF заголовка или слота"""
+    salt = header.kdf_salt(fields)
+    params = header.kdf_params(fields)
+    if session is not None:
+        return session.derive(salt, params)
+    return derive_key_params(password, salt, params)
+
+
+def check_key_fields(fields):
+    """Проверить поля key/check/slots заголовка; возвращает nonce файла или None"""
+    if "check" in fields and len(header.b64decode(fields["check"])) != SHA256.digest_size:
+        raise FormatError("Файл поврежден: неверное проверочное значение")
+    slots = header.key_slots(fields)
+    if slots is not None:
+        if "check" not in fields or "key" in fields:
+            raise FormatError("Файл поврежден: неверные слоты ключа")
+        for slot in slots:
+            if (not isinstance(slot, dict)
+                    or len(header.b64decode(slot.get("wrapped", ""))) != WRAPPED_SIZE):
+                raise FormatError("Файл поврежден: неверные слоты ключа")
+        return None
+    key_info = fields.get("key")
+    if key_info is None:
+        return None
+    if not isinstance(key_info, dict) or key_info.get("mode") != HKDF_MODE:
+        raise FormatError("Неподдерживаемый способ получения ключа файла")
+    nonce = header.b64decode(key_info.get("nonce", ""))
+    if len(nonce) != FILE_NONCE_SIZE:
+        raise FormatError("Файл поврежден: неверный nonce ключа")
+    return nonce
+
+
+def key_from_header(fields, password, session=None):
+    """Ключ файла по заголовку: параметры KDF берутся из файла
+
+    Если в заголовке есть слоты или проверочное значение, неверный
+    пароль обнаруживается сразу после KDF (WrongPasswordError).
+    """
+    return unlock(fields, password, session)[0]
+
+
+def wipe(buffer):
+    """Затереть содержимое bytearray нулями"""
+    buffer[:] = bytes(len(buffer))
+
+
+class KeySession:
+    """Сессия с одним паролем: мастер-ключ и LRU-кэш производных ключей"""
+
+    def __init__(self, password, iterations=DEFAULT_ITERATIONS,
+                 cache_size=DEFAULT_CACHE_SIZE, kdf_params=None):
+        # Параметры KDF мастер-ключа: PBKDF2 с iterations или заданные явно
+        self.kdf_params = kdf_params or pbkdf2_params(iterations)
+        self.salt = get_random_bytes(SALT_SIZE)
+        self._password = password
+        self._cache_size = max(1, cache_size)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Блокировки по ключу кэша: один PBKDF2 на соль даже при гонке потоков
+        self._pending = {}
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lookup(self, cache_key):
+        """Копия ключа из кэша или None (вызывается под self._lock)
+
+        Возвращается неизменяемая копия bytes: ее нельзя затереть, и close()
+        затирает только кэш. Копия живет, пока на нее ссылается вызывающий
+        код (объект шифра pycryptodome), и освобождается сборщиком мусора.
+        """
+        if self._closed:
+            raise EncryptorError("Сессия ключей закрыта")
+        key = self._cache.get(cache_key)
+        if key is None:
+            return None
+        self._cache.move_to_end(cache_key)
+        return bytes(key)
+
+    def derive(self, salt, params):
+        """Ключ пароля для соли и параметров KDF, с кэшированием"""
+        cache_key = (bytes(salt), params_key(params))
+        with self._lock:
+            key = self._lookup(cache_key)
+            if key is not None:
+                return key
+            key_lock = self._pending.setdefault(cache_key, threading.Lock())
+
+        with key_lock:
+            try:
+                with self._lock:
+                    key = self._lookup(cache_key)
+                    if key is not None:
+                        return key
+                key = derive_key_params(self._password, salt, params)
+                with self._lock:
+                    self._cache[cache_key] = bytearray(key)
+                    while len(self._cache) > self._cache_size:
+                        _, old = self._cache.popitem(last=False)
+                        wipe(old)
+            finally:
+                # И при ошибке KDF: блокировка не должна остаться в _pending
+                with self._lock:
+                    if self._pending.get(cache_key) is key_lock:
+                        del self._pending[cache_key]
+        return key
+
+    def master_key(self):
+        """Мастер-ключ сессии (PBKDF2 выполняется один раз)"""
+        return self.derive(self.salt, self.kdf_params)
+
+    def new_file_key(self):
+        """Новый ключ файла; возвращает (ключ, nonce для заголовка)"""
+        nonce = get_random_bytes(FILE_NONCE_SIZE)
+        return file_key(self.master_key(), nonce), nonce
+
+    def close(self):
+        """Затереть все ключи и пароль сессии"""
+        with self._lock:
+            for key in self._cache.values():
+                wipe(key)
+            self._cache.clear()
+            self._pending.clear()
+            self._password = None
+            self._closed = True
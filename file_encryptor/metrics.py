@@ -0,0 +1,273 @@
+"""Необязательные метрики: время по стадиям, байты и счетчики
+
+По умолчанию выключены: timed() возвращает общий пустой контекст, и
+горячий путь платит один вызов функции на сегмент. После enable()
+записываются:
+    kdf    - получение ключа из пароля (PBKDF2, scrypt);
+    cipher - вызовы AES (сегменты GCM, блоки CBC; в режиме mmap сюда же
+             входит чтение страниц файла);
+    read, write - чтение и запись потоков шифрования/дешифрования;
+    encrypt, decrypt - операции целиком;
+и счетчики files, failures, wrong_passwords. Время стадий суммируется по
+всем потокам, поэтому при нескольких потоках может превышать общее.
+Снимок доступен через current().snapshot(), выгрузка - write() в
+текстовом формате Prometheus или JSON.
+
+Capture включает для одного запуска cProfile и/или tracemalloc.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from . import fsutil
+from .errors import WrongPasswordError
+
+PREFIX = "file_encryptor"
+FORMAT_PROMETHEUS = "prometheus"
+FORMAT_JSON = "json"
+METRIC_FORMATS = (FORMAT_PROMETHEUS, FORMAT_JSON)
+COUNTERS = ("files", "failures", "wrong_passwords")
+# Строк в отчете tracemalloc
+MEMORY_TOP = 25
+# Модули профилирования, строки которых не входят в отчет tracemalloc
+PROFILER_FILES = (cProfile.__file__, tracemalloc.__file__)
+
+_active = None
+
+
+class Metrics:
+    """Накопитель метрик, общий для всех потоков"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {name: 0 for name in COUNTERS}
+        self.started = time.time()
+
+    def add_time(self, stage, seconds, size=0):
+        """Учесть вызов стадии: время и обработанные байты"""
+        with self._lock:
+            totals = self._stages.get(stage)
+            if totals is None:
+                totals = self._stages[stage] = [0.0, 0, 0]
+            totals[0] += seconds
+            totals[1] += size
+            totals[2] += 1
+
+    def count(self, name, n=1):
+        """Увеличить счетчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Текущие значения в виде словаря"""
+        with self._lock:
+            stages = {stage: {"seconds": round(seconds, 6), "bytes": size, "calls": calls}
+                      for stage, (seconds, size, calls) in sorted(self._stages.items())}
+            counters = dict(self._counters)
+        return {"started": round(self.started, 3),
+                "elapsed": round(time.time() - self.started, 6),
+                "stages": stages, "counters": counters}
+
+    def to_prometheus(self):
+        """Текстовый формат экспозиции Prometheus"""
+        data = self.snapshot()
+        lines = []
+        for name, field, help_text in (
+                ("stage_seconds_total", "seconds", "Время по стадиям, с"),
+                ("stage_bytes_total", "bytes", "Байт обработано стадией"),
+                ("stage_calls_total", "calls", "Число вызовов стадии")):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for stage, values in data["stages"].items():
+                lines.append(f'{PREFIX}_{name}{{stage="{stage}"}} {values[field]}')
+        for counter, value in data["counters"].items():
+            lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+            lines.append(f"{PREFIX}_{counter}_total {value}")
+        lines.append(f"# TYPE {PREFIX}_elapsed_seconds gauge")
+        lines.append(f"{PREFIX}_elapsed_seconds {data['elapsed']}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        """Снимок в JSON"""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def write(self, path, fmt=None):
+        """Атомарно записать метрики в файл; формат по умолчанию - по расширению"""
+        if fmt is None:
+            fmt = FORMAT_JSON if path.endswith(".json") else FORMAT_PROMETHEUS
+        text = self.to_json() + "\n" if fmt == FORMAT_JSON else self.to_prometheus()
+        # Сборщик textfile не должен увидеть наполовину записанный файл
+        fd, temp_file = fsutil.temp_path_near(path)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            fsutil.replace_atomic(temp_file, path)
+        except BaseException:
+            fsutil.remove_quietly(temp_file)
+            raise
+
+
+def enable():
+    """Включить сбор метрик; возвращает новый накопитель"""
+    global _active
+    _active = Metrics()
+    return _active
+
+
+def disable():
+    """Выключить сбор метрик; возвращает накопитель (или None)"""
+    global _active
+    metrics, _active = _active, None
+    return metrics
+
+
+def current():
+    """Включенный накопитель или None"""
+    return _active
+
+
+class _NoTimer:
+    """Пустой контекст для выключенных метрик"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class _Timer:
+    """Замер одного вызова стадии"""
+
+    __slots__ = ("metrics", "stage", "size", "started")
+
+    def __init__(self, metrics, stage, size):
+        self.metrics = metrics
+        self.stage = stage
+        self.size = size
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.started, self.size)
+        return False
+
+
+def timed(stage, size=0):
+    """Контекст замера стадии: with metrics.timed("cipher", len(data)): ..."""
+    metrics = _active
+    if metrics is None:
+        return _NO_TIMER
+    return _Timer(metrics, stage, size)
+
+
+class _Operation(_Timer):
+    """Замер операции целиком со счетчиками файлов и ошибок"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        self.metrics.count("files")
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            wrong = issubclass(exc_type, WrongPasswordError)
+            self.metrics.count("wrong_passwords" if wrong else "failures")
+        return super().__exit__(exc_type, exc, tb)
+
+
+def operation(name, size=0):
+    """Контекст операции шифрования или дешифрования потока размера size"""
+    metrics = _active
+    if metrics is None:
+        return _NO_TIMER
+    return _Operation(metrics, name, size)
+
+
+class TimedStream:
+    """Поток, у которого замеряются read/readinto/write; остальное - как у оригинала"""
+
+    def __init__(self, stream, metrics):
+        self._stream = stream
+        self._metrics = metrics
+
+    def read(self, *args):
+        started = time.perf_counter()
+        data = self._stream.read(*args)
+        self._metrics.add_time("read", time.perf_counter() - started, len(data))
+        return data
+
+    def readinto(self, buffer):
+        started = time.perf_counter()
+        count = self._stream.readinto(buffer)
+        self._metrics.add_time("read", time.perf_counter() - started, count or 0)
+        return count
+
+    def write(self, data):
+        started = time.perf_counter()
+        result = self._stream.write(data)
+        self._metrics.add_time("write", time.perf_counter() - started, len(data))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def timed_stream(stream):
+    """Обернуть поток для замера ввода-вывода (без метрик - вернуть как есть)"""
+    metrics = _active
+    if metrics is None or isinstance(stream, TimedStream):
+        return stream
+    return TimedStream(stream, metrics)
+
+
+class Capture:
+    """Профилирование одного запуска: cProfile и/или tracemalloc
+
+    cProfile видит только поток, в котором вызван __enter__; чтобы в
+    профиль попала работа сегментов, используйте один рабочий поток.
+    tracemalloc запускается после профилировщика и останавливается до
+    него, а строки модулей профилирования исключаются из отчета; память
+    самого _lsprof, выделенная во время вызовов, может попасть в пик.
+    """
+
+    def __init__(self, profile_path=None, memory_path=None, top=MEMORY_TOP):
+        self.profile_path = profile_path
+        self.memory_path = memory_path
+        self.top = top
+        self._profiler = None
+
+    def __enter__(self):
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if self.memory_path:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.memory_path:
+            # Снимок до остановки профилировщика: выгрузка статистики
+            # cProfile не должна попасть в отчет о памяти
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, path) for path in PROFILER_FILES])
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(self.memory_path, 'w', encoding='utf-8') as f:
+                f.write(f"current {current} peak {peak}\n")
+                for stat in snapshot.statistics('lineno')[:self.top]:
+                    f.write(f"{stat}\n")
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        return False
@@ -0,0 +1,177 @@
+"""Ввод-вывод через mmap для больших локальных файлов формата seg
+
+Исходный файл отображается в память, выходной заранее расширяется до
+итогового размера и тоже отображается. Сегменты шифруются из срезов
+memoryview входа прямо в срезы выхода (параметр output шифра), без
+промежуточных объектов bytes на чтение, шифртекст и запись. Каждый
+сегмент пишет в свою область выхода, поэтому порядок завершения задач
+пула не важен.
+
+Отображение применяется только к обычным файлам, открытым на чтение и
+запись; для остальных потоков используется обычный буферизованный путь.
+Исходный файл не должен укорачиваться во время работы: обращение к
+отображению за концом файла завершает процесс сигналом SIGBUS.
+"""
+import mmap
+import os
+import stat
+
+from . import header, metrics, segmented
+from .errors import EncryptorError, FormatError, SegmentError
+from .keys import data_key
+
+IO_AUTO = "auto"
+IO_MMAP = "mmap"
+IO_BUFFERED = "buffered"
+IO_MODES = (IO_AUTO, IO_MMAP, IO_BUFFERED)
+
+# Начиная с этого размера режим auto выбирает mmap (см. bench --io-modes);
+# на меньших файлах время определяется KDF, а выигрыш mmap незаметен
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+def _is_file(stream, writable=False):
+    """Поток - обычный файл, пригодный для отображения"""
+    try:
+        if not stream.readable() or (writable and not stream.writable()):
+            return False
+        return stat.S_ISREG(os.fstat(stream.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def use_mmap(io_mode, src, dst, length):
+    """Выбрать mmap для потоков src/dst с length байтами данных"""
+    if io_mode == IO_BUFFERED or not length:
+        return False
+    if not (_is_file(src) and _is_file(dst, writable=True)):
+        return False
+    return io_mode == IO_MMAP or length >= MMAP_THRESHOLD
+
+
+def _map(stream, size, write=False):
+    """Отобразить первые size байт файла"""
+    access = mmap.ACCESS_WRITE if write else mmap.ACCESS_READ
+    return mmap.mmap(stream.fileno(), size, access=access)
+
+
+def _run(task, count, tracker, workers):
+    """Выполнить task(index) для всех сегментов пулом потоков"""
+    items = ((index,) for index in range(count))
+    results = segmented.ordered_map(task, items, workers)
+    try:
+        for size in results:
+            tracker.advance(size)
+    finally:
+        # Дождаться запущенных задач до закрытия отображений (например,
+        # при отмене): они пишут в память выходного файла
+        results.close()
+
+
+def encrypt_body(src, dst, key, prefix, length, segment_size, tracker, workers):
+    """Шифрование сегментов из отображения src в отображение dst
+
+    src стоит на начале данных, dst - сразу после заголовка.
+    """
+    count = segmented.segment_count(length, segment_size)
+    src_offset = src.tell()
+    dst_offset = dst.tell()
+    dst.flush()
+    body = segmented.body_size({"length": length, "segment_size": segment_size})
+    dst.truncate(dst_offset + body)
+
+    in_map = _map(src, src_offset + length)
+    out_map = _map(dst, dst_offset + body, write=True)
+    in_view = memoryview(in_map)
+    out_view = memoryview(out_map)
+    try:
+        def task(index):
+            start = index * segment_size
+            size = min(segment_size, length - start)
+            position = dst_offset + index * (segment_size + segmented.TAG_SIZE)
+            cipher = segmented.segment_cipher(key, prefix, index, index == count - 1)
+            with metrics.timed("cipher", size):
+                cipher.encrypt(in_view[src_offset + start:src_offset + start + size],
+                               output=out_view[position:position + size])
+                out_view[position + size:position + size + segmented.TAG_SIZE] = cipher.digest()
+            return size
+
+        _run(task, count, tracker, workers)
+    finally:
+        in_view.release()
+        out_view.release()
+        in_map.close()
+        out_map.close()
+    if os.fstat(src.fileno()).st_size != src_offset + length:
+        raise EncryptorError("Файл изменился во время чтения")
+    src.seek(src_offset + length)
+    dst.seek(dst_offset + body)
+
+
+def encrypt_stream(src, dst, password, iterations, tracker, segment_size,
+                   workers, session=None, kdf_params=None):
+    """Шифрование файла в формат seg через mmap"""
+    length = header.stream_length(src)
+    tracker.stage("Генерация ключа...")
+    key, prefix, fields = segmented.new_header(password, length, iterations,
+                                               segment_size, session, kdf_params)
+    header.write_header(dst, fields)
+
+    tracker.start("Шифрование данных...", length)
+    encrypt_body(src, dst, key, prefix, length, segment_size, tracker,
+                 workers or segmented.default_workers())
+
+
+def decrypt_body(src, dst, fields, file_key, tracker, workers=None):
+    """Дешифрование сегментов после заголовка через mmap
+
+    Размер данных уже проверен по заголовку (core.read_fenc_header).
+    """
+    prefix = segmented.check_header(fields)
+    key = data_key(file_key)
+    segment_size = fields["segment_size"]
+    length = fields["length"]
+    count = segmented.segment_count(length, segment_size)
+    src_offset = src.tell()
+    dst_offset = dst.tell()
+    body = segmented.body_size(fields)
+    if os.fstat(src.fileno()).st_size != src_offset + body:
+        raise FormatError("Файл поврежден: размер данных не совпадает с заголовком")
+    dst.flush()
+    dst.truncate(dst_offset + length)
+
+    in_map = _map(src, src_offset + body)
+    out_map = _map(dst, dst_offset + length, write=True)
+    in_view = memoryview(in_map)
+    out_view = memoryview(out_map)
+    try:
+        def task(index):
+            start = index * segment_size
+            size = min(segment_size, length - start)
+            position = src_offset + index * (segment_size + segmented.TAG_SIZE)
+            cipher = segmented.segment_cipher(key, prefix, index, index == count - 1)
+            with metrics.timed("cipher", size):
+                cipher.decrypt(in_view[position:position + size],
+                               output=out_view[dst_offset + start:dst_offset + start + size])
+            # Тег копируется: срез отображения в трассировке исключения
+            # не дал бы закрыть mmap
+            tag = bytes(in_view[position + size:position + size + segmented.TAG_SIZE])
+            try:
+                cipher.verify(tag)
+            except ValueError:
+                raise SegmentError(f"Файл поврежден: сегмент {index} не прошел проверку",
+                                   index)
+            return size
+
+        tracker.start("Дешифрование данных...", length)
+        try:
+            _run(task, count, tracker, workers or segmented.default_workers())
+        except SegmentError as e:
+            raise segmented.segment_failure(e, fields)
+    finally:
+        in_view.release()
+        out_view.release()
+        in_map.close()
+        out_map.close()
+    src.seek(src_offset + body)
+    dst.seek(dst_offset + length)
@@ -0,0 +1,166 @@
+"""Потоковый формат для каналов: запись и чтение за один проход вперед
+
+Для stdin/stdout длина данных заранее неизвестна, а перемотка
+невозможна, поэтому заголовок FENC (type=stream) не содержит длины, а
+данные идут кадрами:
+    слово (4 байта): длина открытого текста кадра, старший бит - признак
+        последнего кадра
+    шифртекст AES-256-GCM + тег
+Кадр шифруется как сегмент формата seg: nonce - префикс файла + номер
+кадра, номер и признак последнего кадра входят в AAD. Все кадры, кроме
+последнего, имеют полный размер сегмента. Поток без последнего кадра
+считается обрезанным (TruncatedError), даже если обрыв пришелся на
+границу кадров. В памяти - не больше 2 * workers кадров.
+
+Расшифрованные кадры отдаются по мере проверки, поэтому при обрыве
+получатель уже увидит начало данных: результат можно использовать только
+после успешного завершения (код возврата 0).
+
+Тем же форматом шифруются сжатые данные (модуль compress): их длина
+становится известна только после сжатия, а кадры позволяют шифровать
+сжатый вывод сразу, не сохраняя его во временный файл.
+"""
+import struct
+
+from . import compress, header, keys, segmented
+from .errors import EncryptorError, FormatError, SegmentError, TruncatedError
+from .kdf import DEFAULT_ITERATIONS
+from .progress import tracker_for
+
+_FRAME = struct.Struct(">I")
+FINAL_FLAG = 0x80000000
+# Номер кадра занимает 4 байта nonce
+MAX_FRAMES = 2 ** 32
+
+
+def read_full(src, size):
+    """Прочитать size байт (меньше - только в конце потока)"""
+    data = src.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    left = size - len(data)
+    while left:
+        data = src.read(left)
+        if not data:
+            break
+        parts.append(data)
+        left -= len(data)
+    return b"".join(parts)
+
+
+def check_header(fields):
+    """Проверить поля заголовка до запуска KDF; возвращает префикс nonce"""
+    segment_size = fields.get("segment_size")
+    if fields.get("cipher") != segmented.CIPHER_NAME:
+        raise FormatError(f"Неподдерживаемый шифр: {fields.get('cipher')}")
+    if not isinstance(segment_size, int) or not 0 < segment_size <= header.MAX_SEGMENT_SIZE:
+        raise FormatError("Файл поврежден: неверный размер сегмента")
+    header.check_kdf(fields)
+    keys.check_key_fields(fields)
+    compress.check_fields(fields, length_required=False)
+    return segmented.check_header(fields)
+
+
+def _chunks(src, segment_size):
+    """Блоки открытого текста с признаком последнего (чтение на блок вперед)"""
+    chunk = read_full(src, segment_size)
+    index = 0
+    while True:
+        if index >= MAX_FRAMES:
+            raise EncryptorError("Слишком длинный поток")
+        if len(chunk) < segment_size:
+            yield index, True, chunk
+            return
+        next_chunk = read_full(src, segment_size)
+        if not next_chunk:
+            yield index, True, chunk
+            return
+        yield index, False, chunk
+        chunk = next_chunk
+        index += 1
+
+
+def _encrypt_frame(key, prefix, index, final, data):
+    """Кадр: слово длины с признаком последнего кадра и шифртекст с тегом"""
+    word = len(data) | (FINAL_FLAG if final else 0)
+    return _FRAME.pack(word) + segmented.encrypt_segment(key, prefix, index, final, data)
+
+
+def new_header(password, iterations=DEFAULT_ITERATIONS, segment_size=segmented.SEGMENT_SIZE,
+               session=None, kdf_params=None, extra=None):
+    """Новый ключ и поля заголовка без длины; возвращает (ключ данных, префикс, поля)"""
+    key, prefix, fields = segmented.new_header(password, None, iterations, segment_size,
+                                               session, kdf_params, extra)
+    del fields["length"]
+    fields["type"] = header.TYPE_STREAM
+    return key, prefix, fields
+
+
+def encrypt_body(src, dst, key, prefix, segment_size, workers):
+    """Шифрование кадров до конца src
+
+    Генератор: после записи каждого кадра возвращает длину его открытого текста.
+    """
+    items = ((key, prefix, index, final, data)
+             for index, final, data in _chunks(src, segment_size))
+    for frame in segmented.ordered_map(_encrypt_frame, items, workers):
+        dst.write(frame)
+        yield len(frame) - _FRAME.size - segmented.TAG_SIZE
+
+
+def encrypt_stream(src, dst, password, iterations=DEFAULT_ITERATIONS, tracker=None,
+                   segment_size=segmented.SEGMENT_SIZE, workers=None, session=None,
+                   kdf_params=None):
+    """Шифрование из потока без перемотки и известной длины"""
+    tracker = tracker_for(tracker)
+    workers = workers or segmented.default_workers()
+
+    tracker.stage("Генерация ключа...")
+    key, prefix, fields = new_header(password, iterations, segment_size, session, kdf_params)
+    header.write_header(dst, fields)
+
+    tracker.start("Шифрование данных...")
+    for size in encrypt_body(src, dst, key, prefix, segment_size, workers):
+        tracker.advance(size)
+
+
+def _frames(src, key, prefix, segment_size):
+    """Аргументы decrypt_segment для кадров потока до последнего"""
+    index = 0
+    while True:
+        word = read_full(src, _FRAME.size)
+        if len(word) != _FRAME.size:
+            raise TruncatedError("Поток обрезан: нет последнего кадра")
+        word, = _FRAME.unpack(word)
+        final = bool(word & FINAL_FLAG)
+        size = word & ~FINAL_FLAG
+        if size > segment_size or (not final and size != segment_size):
+            raise FormatError(f"Поток поврежден: неверная длина кадра {index}")
+        data = read_full(src, size + segmented.TAG_SIZE)
+        if len(data) != size + segmented.TAG_SIZE:
+            raise TruncatedError("Поток обрезан: неполный кадр")
+        yield key, prefix, index, final, data
+        if final:
+            return
+        index += 1
+        if index >= MAX_FRAMES:
+            raise FormatError("Поток поврежден: слишком много кадров")
+
+
+def decrypt_body(src, dst, fields, file_key, tracker=None, workers=None):
+    """Дешифрование кадров после заголовка за один проход"""
+    tracker = tracker_for(tracker)
+    workers = workers or segmented.default_workers()
+    prefix = check_header(fields)
+    frames = _frames(src, keys.data_key(file_key), prefix, fields["segment_size"])
+
+    tracker.start("Дешифрование данных...")
+    try:
+        for block in segmented.ordered_map(segmented.decrypt_segment, frames, workers):
+            dst.write(block)
+            tracker.advance(len(block))
+    except SegmentError as e:
+        raise FormatError(f"Поток поврежден: кадр {e.index} не прошел проверку")
+    if src.read(1):
+        raise FormatError("Поток поврежден: лишние данные после последнего кадра")
@@ -0,0 +1,141 @@
+"""Поток событий прогресса: обработанные байты, скорость и оставшееся время
+
+Движок шифрования сообщает о каждом обработанном блоке трекеру, а трекер
+передает обработчику события ProgressEvent не чаще заданного интервала.
+Обработчик вызывается в рабочем потоке: графический интерфейс должен
+передавать события в свой поток сам (через очередь).
+
+Трекер также служит точкой кооперативной отмены: если передан флаг
+cancel (threading.Event), каждый этап и каждый обработанный блок
+проверяют его и прерывают операцию исключением CancelledError.
+"""
+import time
+
+from .errors import CancelledError
+
+STAGE_KDF = "kdf"
+STAGE_DATA = "data"
+STAGE_DONE = "done"
+
+# Минимальный интервал между событиями обработки данных, с
+DEFAULT_INTERVAL = 0.1
+# Единица скорости в отчетах (МБ/с): мебибайт, как в cli.format_size
+MB = 1024 * 1024
+
+
+def format_eta(seconds):
+    """Оставшееся время в виде ЧЧ:ММ:СС"""
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressEvent:
+    """Снимок прогресса операции"""
+
+    __slots__ = ("stage", "status", "done", "total", "rate", "eta")
+
+    def __init__(self, stage, status, done=0, total=None, rate=None, eta=None):
+        self.stage = stage
+        self.status = status
+        self.done = done
+        self.total = total
+        self.rate = rate  # байт/с
+        self.eta = eta  # с
+
+    @property
+    def percent(self):
+        """Процент выполнения (0, если общий объем неизвестен)"""
+        if self.stage == STAGE_DONE:
+            return 100.0
+        if not self.total:
+            return 0.0
+        return min(100.0, self.done * 100.0 / self.total)
+
+    def to_dict(self):
+        """Представление для JSON"""
+        return {
+            "stage": self.stage,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "percent": round(self.percent, 2),
+            "rate": round(self.rate) if self.rate is not None else None,
+            "eta": round(self.eta, 1) if self.eta is not None else None,
+        }
+
+    def __repr__(self):
+        return f"ProgressEvent({self.stage!r}, {self.done}/{self.total})"
+
+
+class ProgressTracker:
+    """Учет обработанных байт с ограничением частоты событий"""
+
+    def __init__(self, callback=None, total=None, interval=DEFAULT_INTERVAL,
+                 cancel=None):
+        self.callback = callback
+        self.total = total
+        self.interval = interval
+        self.cancel = cancel
+        self.done = 0
+        self._base = 0
+        self._started = None
+        self._last_emit = 0.0
+
+    def _emit(self, stage, status):
+        rate = eta = None
+        if self._started is not None:
+            elapsed = time.perf_counter() - self._started
+            if elapsed > 0 and self.done > self._base:
+                rate = (self.done - self._base) / elapsed
+                if self.total:
+                    eta = max(0.0, (self.total - self.done) / rate)
+        self.callback(ProgressEvent(stage, status, self.done, self.total, rate, eta))
+
+    def check_cancel(self):
+        """Прервать операцию, если запрошена отмена"""
+        if self.cancel is not None and self.cancel.is_set():
+            raise CancelledError("Операция отменена")
+
+    def stage(self, status, stage=STAGE_KDF):
+        """Сообщить о начале этапа без обработки данных"""
+        self.check_cancel()
+        self.status = status
+        if self.callback is not None:
+            self._emit(stage, status)
+
+    def start(self, status, total=None, done=0):
+        """Начать этап обработки данных; done - объем, готовый заранее"""
+        self.check_cancel()
+        if total is not None:
+            self.total = total
+        self.done = self._base = done
+        self.status = status
+        self._started = time.perf_counter()
+        self._last_emit = self._started
+        if self.callback is not None:
+            self._emit(STAGE_DATA, status)
+
+    def advance(self, count):
+        """Учесть count обработанных байт"""
+        self.done += count
+        self.check_cancel()
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_emit >= self.interval:
+            self._last_emit = now
+            self._emit(STAGE_DATA, self.status)
+
+    def finish(self, status="Готово"):
+        """Сообщить о завершении операции"""
+        if self.callback is not None:
+            self._emit(STAGE_DONE, status)
+
+
+def tracker_for(progress, cancel=None):
+    """Трекер из обработчика или готового трекера"""
+    if isinstance(progress, ProgressTracker):
+        return progress
+    return ProgressTracker(progress, cancel=cancel)
@@ -0,0 +1,212 @@
+"""Чтение диапазонов байт из зашифрованного файла без полного дешифрования
+
+open_encrypted(path, password) возвращает файловый объект только для
+чтения с seek/tell/read. Расшифровываются только блоки, покрывающие
+запрошенный диапазон:
+    seg - сегменты AES-GCM (каждый проверяется тегом);
+    cbc - блоки AES-CBC: блок расшифровывается по предыдущему блоку
+          шифртекста, поэтому начало файла читать не нужно.
+Большие диапазоны расшифровываются порциями не больше CHUNK_BYTES:
+iter_range и copy_range держат в памяти одну порцию.
+Сжатые файлы и старый формат AES! произвольного доступа не поддерживают.
+"""
+import io
+import os
+
+from Crypto.Cipher import AES
+
+from . import core, fsutil, header, keys, segmented
+from .errors import FormatError, SegmentError, TruncatedError
+
+# Сегменты дешифруются пулом потоков, если их в запросе больше этого числа
+PARALLEL_SEGMENTS = 4
+# Открытого текста за одно чтение и дешифрование (округляется до сегментов)
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class EncryptedFile(io.RawIOBase):
+    """Зашифрованный файл, открытый для чтения с произвольным доступом"""
+
+    def __init__(self, path, password, session=None, workers=None):
+        super().__init__()
+        self.path = path
+        fsutil.recover(path)
+        self._file = open(path, 'rb')
+        try:
+            self._load(password, session)
+        except BaseException:
+            self._file.close()
+            raise
+        self._position = 0
+        self._workers = workers or segmented.default_workers()
+        # Последний расшифрованный сегмент: последовательное чтение
+        # маленькими порциями не дешифрует сегмент повторно
+        self._cached_index = None
+        self._cached = b""
+
+    def _load(self, password, session):
+        """Прочитать заголовок и получить ключ данных"""
+        src = self._file
+        if src.read(len(header.MAGIC)) != header.MAGIC:
+            raise FormatError("Произвольный доступ поддерживается только для формата FENC")
+        src.seek(0)
+        fields = core.read_fenc_header(src)
+        if fields.get("type") == header.TYPE_INCREMENTAL:
+            raise FormatError("Произвольный доступ к файлу режима update не поддерживается")
+        if fields.get("type") == header.TYPE_STREAM:
+            raise FormatError("Произвольный доступ к потоковому файлу не поддерживается")
+        if "compression" in fields:
+            raise FormatError("Произвольный доступ к сжатому файлу не поддерживается")
+        self._fields = fields
+        self._data_offset = src.tell()
+        self.length = fields["length"]
+        self.cipher = fields["cipher"]
+        if self.cipher == segmented.CIPHER_NAME:
+            self._prefix = segmented.check_header(fields)
+            self.segment_size = fields["segment_size"]
+            self._count = segmented.segment_count(self.length, self.segment_size)
+        else:
+            self._iv = core.check_cbc_header(fields)
+        file_key = keys.key_from_header(fields, password, session)
+        self._key = keys.data_key(file_key)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self.length + offset
+        else:
+            raise ValueError(f"Неверное значение whence: {whence}")
+        if position < 0:
+            raise ValueError("Отрицательная позиция")
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        done = 0
+        for chunk in self.iter_range(self._position, len(view)):
+            view[done:done + len(chunk)] = chunk
+            done += len(chunk)
+        self._position += done
+        return done
+
+    def readall(self):
+        data = self.read_range(self._position, max(0, self.length - self._position))
+        self._position += len(data)
+        return data
+
+    def read_range(self, offset, size):
+        """Расшифровать size байт с позиции offset (меньше - у конца файла)"""
+        data = bytearray()
+        for chunk in self.iter_range(offset, size):
+            if not data and len(chunk) >= size:
+                return chunk
+            data += chunk
+        return bytes(data)
+
+    def iter_range(self, offset, size):
+        """Расшифровывать диапазон порциями не больше CHUNK_BYTES"""
+        if self.closed:
+            raise ValueError("Файл закрыт")
+        if offset < 0 or size < 0:
+            raise ValueError("Отрицательная позиция или размер")
+        end = offset + max(0, min(size, self.length - offset))
+        if self.cipher == segmented.CIPHER_NAME:
+            # Порции по целым сегментам: сегмент на границе не дешифруется дважды
+            step = max(1, CHUNK_BYTES // self.segment_size) * self.segment_size
+            read = self._read_segments
+        else:
+            step, read = CHUNK_BYTES, self._read_cbc
+        while offset < end:
+            chunk_end = min(end, (offset // step + 1) * step)
+            yield read(offset, chunk_end - offset)
+            offset = chunk_end
+
+    def copy_range(self, offset, size, dst):
+        """Записать расшифрованный диапазон в поток dst; возвращает число байт"""
+        written = 0
+        for chunk in self.iter_range(offset, size):
+            dst.write(chunk)
+            written += len(chunk)
+        return written
+
+    def _read_segments(self, offset, size):
+        """Диапазон формата seg: расшифровать покрывающие его сегменты"""
+        first = offset // self.segment_size
+        last = (offset + size - 1) // self.segment_size
+        if first == last == self._cached_index:
+            blocks = [self._cached]
+        else:
+            blocks = self._decrypt_segments(first, last)
+            self._cached_index, self._cached = last, blocks[-1]
+        start = offset - first * self.segment_size
+        return b"".join(blocks)[start:start + size]
+
+    def _decrypt_segments(self, first, last):
+        """Расшифровать сегменты first..last одним чтением"""
+        stride = self.segment_size + segmented.TAG_SIZE
+        self._file.seek(self._data_offset + first * stride)
+        items = []
+        for index in range(first, last + 1):
+            stored = min(self.segment_size, self.length - index * self.segment_size)
+            data = self._file.read(stored + segmented.TAG_SIZE)
+            if len(data) != stored + segmented.TAG_SIZE:
+                raise TruncatedError("Файл поврежден: данные обрезаны")
+            items.append((self._key, self._prefix, index, index == self._count - 1, data))
+        try:
+            if len(items) > PARALLEL_SEGMENTS:
+                return list(segmented.ordered_map(segmented.decrypt_segment, items,
+                                                  self._workers))
+            return [segmented.decrypt_segment(*item) for item in items]
+        except SegmentError as e:
+            raise segmented.segment_failure(e, self._fields)
+
+    def _read_cbc(self, offset, size):
+        """Диапазон формата cbc: IV блока - предыдущий блок шифртекста"""
+        block = AES.block_size
+        first = offset // block
+        last = (offset + size - 1) // block
+        if first:
+            self._file.seek(self._data_offset + (first - 1) * block)
+            iv = self._file.read(block)
+        else:
+            self._file.seek(self._data_offset)
+            iv = self._iv
+        data = self._file.read((last - first + 1) * block)
+        if len(iv) != block or len(data) != (last - first + 1) * block:
+            raise TruncatedError("Файл поврежден: данные обрезаны")
+        plain = AES.new(self._key, AES.MODE_CBC, iv).decrypt(data)
+        start = offset - first * block
+        return plain[start:start + size]
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def open_encrypted(path, password, session=None, workers=None):
+    """Открыть зашифрованный файл для чтения диапазонов (seek/read)
+
+    Ключ получается один раз при открытии; каждый read расшифровывает
+    только нужные блоки.
+    """
+    return EncryptedFile(path, password, session, workers)
+
+
+def read_range(path, password, offset, size, session=None):
+    """Расшифровать size байт с позиции offset"""
+    with open_encrypted(path, password, session) as f:
+        return f.read_range(offset, size)
@@ -0,0 +1,117 @@
+"""Смена, добавление и удаление паролей без перешифрования данных
+
+Данные зашифрованы ключом файла, а пароль открывает только слот
+заголовка с этим ключом. Поэтому смена пароля переписывает несколько
+сотен байт заголовка: новый заголовок дополняется пробелами до размера
+прежнего (в новых файлах заложен запас header.HEADER_RESERVE) и пишется
+на место старого через журнал повтора (fsutil.PatchJournal): сбой
+посреди записи не оставит файл с поврежденным заголовком, а данные не
+копируются. Если заголовок не помещается (файлы ранних версий), данные
+одиночного файла копируются в новый файл без расшифровки и атомарно
+подменяют старый; у архивов и файлов режима update смещения данных
+записаны внутри файла, поэтому для них это невозможно.
+"""
+import os
+import shutil
+
+from . import fsutil, header, keys
+from .errors import EncryptorError, FormatError
+from .kdf import DEFAULT_ITERATIONS
+
+
+def _read(path):
+    """Заголовок файла FENC; возвращает (поля, размер заголовка)"""
+    fsutil.recover(path)
+    with open(path, 'rb') as src:
+        if src.read(len(header.MAGIC)) != header.MAGIC:
+            raise FormatError("Смена пароля поддерживается только для файлов FENC")
+        fields, size = header.read_header(src, header.MAGIC)
+    header.check_kdf(fields)
+    keys.check_key_fields(fields)
+    if "check" not in fields:
+        # Без проверочного значения неверный пароль не обнаружить, а его
+        # ключ в новом слоте сделал бы файл нечитаемым
+        raise EncryptorError("Файл ранней версии без проверочного значения: "
+                             "расшифруйте и зашифруйте его заново")
+    return fields, size
+
+
+def _slots(fields):
+    """Слоты файла; у файлов без слотов - пустой список (ключ станет слотом)"""
+    slots = header.key_slots(fields)
+    return list(slots) if slots is not None else []
+
+
+def _write(path, fields, size):
+    """Записать новый заголовок на место старого или переписать файл"""
+    data = header.pack_header(fields, size)
+    if data is not None:
+        with fsutil.PatchJournal(path) as journal:
+            journal.write(data)
+        return
+    if fields.get("type") is not None:
+        raise EncryptorError("В заголовке нет места для нового слота ключа")
+
+    fd, temp_file = fsutil.temp_path_near(path)
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(path, 'rb') as src:
+            header.write_header(dst, fields)
+            src.seek(size)
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(path, temp_file)
+        fsutil.replace_atomic(temp_file, path)
+    except BaseException:
+        fsutil.remove_quietly(temp_file)
+        raise
+
+
+def _new_fields(fields, slots, file_key):
+    """Поля заголовка с новым списком слотов"""
+    new = {name: value for name, value in fields.items() if name not in ("kdf", "key")}
+    new["slots"] = slots
+    new["check"] = header.b64encode(keys.key_check(file_key))
+    return new
+
+
+def change_password(path, password, new_password, iterations=DEFAULT_ITERATIONS,
+                    kdf_params=None):
+    """Заменить пароль password на new_password (остальные слоты сохраняются)"""
+    fields, size = _read(path)
+    file_key, index = keys.unlock(fields, password)
+    slots = _slots(fields)
+    slot = keys.new_slot(file_key, new_password, iterations, kdf_params)
+    if index is None:
+        slots = [slot]
+    else:
+        slots[index] = slot
+    _write(path, _new_fields(fields, slots, file_key), size)
+
+
+def add_password(path, password, new_password, iterations=DEFAULT_ITERATIONS,
+                 kdf_params=None):
+    """Добавить пароль new_password; password - любой действующий пароль"""
+    fields, size = _read(path)
+    file_key, index = keys.unlock(fields, password)
+    slots = _slots(fields)
+    if index is None:
+        # Ключ файла ранней версии сохраняется слотом со старым паролем
+        slots = [keys.new_slot(file_key, password, kdf_params=header.kdf_params(fields))]
+    if len(slots) >= header.MAX_KEY_SLOTS:
+        raise EncryptorError(f"Не более {header.MAX_KEY_SLOTS} паролей на файл")
+    slots.append(keys.new_slot(file_key, new_password, iterations, kdf_params))
+    _write(path, _new_fields(fields, slots, file_key), size)
+    return len(slots)
+
+
+def remove_password(path, password):
+    """Удалить слот, который открывает password; последний слот не удаляется"""
+    fields, size = _read(path)
+    file_key, index = keys.unlock(fields, password)
+    slots = _slots(fields)
+    if len(slots) < 2:
+        raise EncryptorError("Нельзя удалить единственный пароль файла")
+    del slots[index]
+    _write(path, _new_fields(fields, slots, file_key), size)
+    return len(slots)
@@ -0,0 +1,244 @@
+"""Возобновляемое шифрование больших файлов с контрольными точками
+
+Шифрование идет в сегментированном формате во временный файл
+<выход>.part. Каждые CHECKPOINT_BYTES данные сбрасываются на диск, и
+в файл-спутник <выход>.ckpt атомарно записывается число готовых
+сегментов. После отмены или сбоя повторный запуск с тем же паролем
+проверяет готовую часть и продолжает с места остановки; по завершении
+.part переименовывается в выходной файл, а .ckpt удаляется.
+
+Продолжение использует ключ и префикс nonce из заголовка .part, поэтому
+сегменты после контрольной точки шифруются теми же nonce, что и до
+сбоя. Повторное шифрование под тем же nonce безопасно, только если
+открытый текст не изменился: при проверке каждый сегмент исходного
+файла заново шифруется и сравнивается с записанным шифртекстом,
+включая недописанные после контрольной точки сегменты. При любом
+расхождении шифрование начинается заново с новым ключом.
+"""
+import json
+import os
+
+from . import fsutil, header, keys, segmented
+from .errors import EncryptorError, FormatError
+from .kdf import DEFAULT_ITERATIONS
+from .progress import tracker_for
+
+PART_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".ckpt"
+CHECKPOINT_VERSION = 1
+
+# Объем данных между контрольными точками (fsync + запись .ckpt)
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+
+
+def part_path(output_path):
+    """Путь недописанного выходного файла"""
+    return output_path + PART_SUFFIX
+
+
+def checkpoint_path(output_path):
+    """Путь файла контрольной точки"""
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def _source_info(input_path):
+    """Отпечаток исходного файла: изменение файла делает точку недействительной"""
+    stat = os.stat(input_path)
+    return {"path": os.path.abspath(input_path), "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+
+def load_checkpoint(output_path):
+    """Прочитать контрольную точку; None, если ее нет или она повреждена"""
+    try:
+        with open(checkpoint_path(output_path), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        return None
+    return state
+
+
+def save_checkpoint(output_path, state):
+    """Атомарно записать контрольную точку"""
+    path = checkpoint_path(output_path)
+    fd, temp_file = fsutil.temp_path_near(path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        fsutil.replace_atomic(temp_file, path)
+    except BaseException:
+        fsutil.remove_quietly(temp_file)
+        raise
+
+
+def discard(output_path):
+    """Удалить недописанный файл и контрольную точку"""
+    for path in (part_path(output_path), checkpoint_path(output_path)):
+        fsutil.remove_quietly(path)
+    # Удаление сбрасывается на диск, как и запись точки
+    fsutil.fsync_dir(os.path.dirname(os.path.abspath(output_path)))
+
+
+def _body_fields(state):
+    """Поля заголовка, от которых зависит размер сегментов"""
+    return {"length": state["source"]["size"], "segment_size": state["segment_size"]}
+
+
+def _segments_written(dst, state):
+    """Число полностью записанных сегментов по текущей позиции файла"""
+    written = dst.tell() - state["header_size"]
+    fields = _body_fields(state)
+    if written >= segmented.body_size(fields):
+        return segmented.segment_count(fields["length"], fields["segment_size"])
+    return max(0, written) // (state["segment_size"] + segmented.TAG_SIZE)
+
+
+def _segments_end(state, count):
+    """Смещение конца первых count сегментов в выходном файле"""
+    written = count * (state["segment_size"] + segmented.TAG_SIZE)
+    return state["header_size"] + min(written, segmented.body_size(_body_fields(state)))
+
+
+def _same_ciphertext(key, prefix, index, final, data, stored):
+    """Совпадает ли записанный шифртекст (возможно, обрезанный) с шифрованием data"""
+    return segmented.encrypt_segment(key, prefix, index, final, data)[:len(stored)] == stored
+
+
+def _stored_and_source(part, src, key, prefix, length, segment_size):
+    """Аргументы _same_ciphertext для всех сегментов, начатых в .part"""
+    count = segmented.segment_count(length, segment_size)
+    for index in range(count):
+        stored = part.read(segment_size + segmented.TAG_SIZE)
+        if not stored:
+            return
+        yield key, prefix, index, index == count - 1, src.read(segment_size), stored
+
+
+def _resume_state(output_path, source, password, session, tracker, workers):
+    """Проверить готовую часть; возвращает (состояние, ключ данных, префикс) или None
+
+    Все записанные в .part сегменты, в том числе после контрольной точки,
+    должны совпадать с шифрованием текущего содержимого исходного файла
+    (а значит, и проходить проверку тегов).
+    """
+    state = load_checkpoint(output_path)
+    if state is None or state.get("source") != source:
+        return None
+    try:
+        with open(part_path(output_path), 'rb') as src:
+            fields, header_size = header.read_header(src)
+            header.check_common(fields)
+            keys.check_key_fields(fields)
+            prefix = segmented.check_header(fields)
+            if (fields["cipher"] != segmented.CIPHER_NAME
+                    or header_size != state["header_size"]
+                    or fields["length"] != source["size"]
+                    or fields["segment_size"] != state["segment_size"]):
+                return None
+
+            tracker.stage("Восстановление ключа...")
+            key = keys.data_key(keys.key_from_header(fields, password, session))
+
+            done = state["segments"]
+            tracker.start("Проверка готовой части...",
+                          min(source["size"], done * state["segment_size"]))
+            with open(source["path"], 'rb') as plain:
+                items = _stored_and_source(src, plain, key, prefix, source["size"],
+                                           state["segment_size"])
+                checked = 0
+                for same in segmented.ordered_map(_same_ciphertext, items, workers):
+                    if not same:
+                        # Исходный файл изменился или .part поврежден: тот же
+                        # nonce нельзя использовать для другого текста
+                        return None
+                    if checked < done:
+                        tracker.advance(min(state["segment_size"],
+                                            source["size"] - checked * state["segment_size"]))
+                    checked += 1
+            if checked < done:
+                return None
+    except (OSError, FormatError):
+        # Недописанный файл поврежден - начать заново
+        return None
+    return state, key, prefix
+
+
+def encrypt_file_resumable(input_path, output_path, password,
+                           iterations=DEFAULT_ITERATIONS, progress=None,
+                           workers=None, session=None, kdf_params=None,
+                           segment_size=segmented.SEGMENT_SIZE, cancel=None,
+                           checkpoint_bytes=CHECKPOINT_BYTES):
+    """Зашифровать файл с контрольными точками (только формат seg)
+
+    Если для output_path есть действительная контрольная точка (тот же
+    исходный файл по пути, размеру и времени изменения) и записанные
+    сегменты совпадают с шифрованием текущего содержимого, шифрование
+    продолжается с первого неподтвержденного сегмента. При неверном пароле возникает WrongPasswordError, а
+    недописанный файл сохраняется. Возвращает номер сегмента, с которого
+    продолжена работа (0 - с начала).
+    """
+    tracker = tracker_for(progress, cancel)
+    workers = workers or segmented.default_workers()
+    source = _source_info(input_path)
+    part = part_path(output_path)
+
+    resumed = _resume_state(output_path, source, password, session, tracker, workers)
+    if resumed is None:
+        discard(output_path)
+        tracker.stage("Генерация ключа...")
+        key, prefix, fields = segmented.new_header(
+            password, source["size"], iterations, segment_size, session, kdf_params)
+        with open(part, 'wb') as dst:
+            header_size = header.write_header(dst, fields)
+            dst.flush()
+            os.fsync(dst.fileno())
+        state = {"version": CHECKPOINT_VERSION, "source": source,
+                 "segment_size": segment_size, "header_size": header_size,
+                 "segments": 0}
+        save_checkpoint(output_path, state)
+    else:
+        state, key, prefix = resumed
+        segment_size = state["segment_size"]
+
+    start = state["segments"]
+    length = source["size"]
+    every = max(1, checkpoint_bytes // segment_size)
+
+    def checkpoint(dst):
+        dst.flush()
+        os.fsync(dst.fileno())
+        state["segments"] = _segments_written(dst, state)
+        save_checkpoint(output_path, state)
+
+    with open(input_path, 'rb') as src, open(part, 'r+b') as dst:
+        # Все, что записано после контрольной точки, не подтверждено
+        dst.truncate(_segments_end(state, start))
+        dst.seek(0, os.SEEK_END)
+        src.seek(start * segment_size)
+
+        tracker.start("Шифрование данных...", length, min(length, start * segment_size))
+        try:
+            for index in segmented.encrypt_body(src, dst, key, prefix, length,
+                                                segment_size, tracker, workers,
+                                                start):
+                if (index + 1) % every == 0:
+                    checkpoint(dst)
+        except BaseException:
+            checkpoint(dst)
+            raise
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    if _source_info(input_path) != source:
+        discard(output_path)
+        raise EncryptorError("Файл изменился во время шифрования")
+
+    fsutil.replace_atomic(part, output_path)
+    discard(output_path)
+    if tracker is not progress:
+        tracker.finish("Шифрование завершено")
+    return start
@@ -0,0 +1,222 @@
+"""Сегментированный формат FENC: независимые сегменты AES-256-GCM
+
+Каждый сегмент шифруется со своим nonce (префикс файла + номер сегмента)
+и имеет собственный тег, поэтому сегменты можно шифровать и расшифровывать
+параллельно. Номер сегмента и признак последнего сегмента входят в AAD,
+так что перестановка, удаление или обрезка сегментов обнаруживаются.
+"""
+import os
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from . import header, keys, metrics
+from .errors import (EncryptorError, FormatError, SegmentError, TruncatedError,
+                     WrongPasswordError)
+from .header import MAX_SEGMENT_SIZE
+from .kdf import DEFAULT_ITERATIONS
+from .progress import tracker_for
+
+CIPHER_NAME = "aes-256-gcm"
+
+SEGMENT_SIZE = 1024 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 8
+
+_NONCE_INDEX = struct.Struct(">I")
+_AAD = struct.Struct(">QB")
+
+
+def default_workers():
+    """Число потоков по умолчанию - по числу ядер"""
+    return os.cpu_count() or 1
+
+
+def segment_count(length, segment_size):
+    """Число сегментов для данных длины length (пустой файл - один сегмент)"""
+    return max(1, -(-length // segment_size))
+
+
+def segment_cipher(key, prefix, index, final):
+    """Экземпляр AES-GCM для сегмента index"""
+    cipher = AES.new(key, AES.MODE_GCM,
+                     nonce=prefix + _NONCE_INDEX.pack(index), mac_len=TAG_SIZE)
+    cipher.update(_AAD.pack(index, final))
+    return cipher
+
+
+def encrypt_segment(key, prefix, index, final, data):
+    """Зашифровать сегмент; возвращает шифртекст с тегом"""
+    with metrics.timed("cipher", len(data)):
+        ciphertext, tag = segment_cipher(key, prefix, index, final).encrypt_and_digest(data)
+    return ciphertext + tag
+
+
+def decrypt_segment(key, prefix, index, final, data):
+    """Расшифровать и проверить сегмент"""
+    if len(data) < TAG_SIZE:
+        raise SegmentError(f"Файл поврежден: сегмент {index} обрезан", index)
+    try:
+        with metrics.timed("cipher", len(data) - TAG_SIZE):
+            return segment_cipher(key, prefix, index, final).decrypt_and_verify(
+                data[:-TAG_SIZE], data[-TAG_SIZE:])
+    except ValueError:
+        raise SegmentError(f"Файл поврежден: сегмент {index} не прошел проверку", index)
+
+
+def ordered_map(func, items, workers):
+    """Параллельный map с сохранением порядка и ограниченным окном задач"""
+    if workers <= 1:
+        for item in items:
+            yield func(*item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, *item))
+            # Не более 2 * workers сегментов в памяти одновременно
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def new_header(password, length, iterations=DEFAULT_ITERATIONS,
+               segment_size=SEGMENT_SIZE, session=None, kdf_params=None,
+               extra=None):
+    """Новый ключ и поля заголовка; возвращает (ключ данных, префикс, поля)
+
+    extra - дополнительные поля заголовка (например, параметры сжатия).
+    """
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise EncryptorError("Недопустимый размер сегмента")
+    file_key, fields = keys.new_file_keys(password, iterations, kdf_params, session)
+    prefix = get_random_bytes(NONCE_PREFIX_SIZE)
+    fields.update({
+        "cipher": CIPHER_NAME,
+        "segment_size": segment_size,
+        "length": length,
+        "nonce": header.b64encode(prefix),
+    })
+    fields.update(extra or {})
+    return keys.data_key(file_key), prefix, fields
+
+
+def encrypt_body(src, dst, key, prefix, length, segment_size, tracker,
+                 workers, start=0):
+    """Шифрование сегментов начиная с номера start
+
+    src должен стоять на начале сегмента start. Генератор: после записи
+    каждого сегмента возвращает его номер, что позволяет вызывающему
+    коду сохранять контрольные точки.
+    """
+    count = segment_count(length, segment_size)
+
+    def segments():
+        for index in range(start, count):
+            data = src.read(segment_size)
+            expected = min(segment_size, length - index * segment_size)
+            if len(data) != expected:
+                raise EncryptorError("Файл изменился во время чтения")
+            yield key, prefix, index, index == count - 1, data
+
+    index = start
+    for block in ordered_map(encrypt_segment, segments(), workers):
+        dst.write(block)
+        tracker.advance(len(block) - TAG_SIZE)
+        yield index
+        index += 1
+
+
+def encrypt_stream(src, dst, password, iterations=DEFAULT_ITERATIONS,
+                   tracker=None, segment_size=SEGMENT_SIZE, workers=None,
+                   session=None, kdf_params=None):
+    """Шифрование в сегментированный формат с пулом потоков
+
+    С сессией ключей (keys.KeySession) KDF не выполняется заново:
+    ключ файла получается через HKDF от мастер-ключа сессии. Параметры
+    KDF (PBKDF2 или scrypt) записываются в заголовок.
+    """
+    tracker = tracker_for(tracker)
+    workers = workers or default_workers()
+    length = header.stream_length(src)
+    if length is None:
+        raise EncryptorError("Сегментированный формат требует поток с произвольным доступом")
+
+    tracker.stage("Генерация ключа...")
+    key, prefix, fields = new_header(password, length, iterations, segment_size,
+                                     session, kdf_params)
+    header.write_header(dst, fields)
+
+    tracker.start("Шифрование данных...", length)
+    for _ in encrypt_body(src, dst, key, prefix, length, segment_size,
+                          tracker, workers):
+        pass
+
+
+def check_header(fields):
+    """Проверить поля заголовка, специфичные для формата; возвращает префикс nonce"""
+    prefix = header.b64decode(fields.get("nonce", ""))
+    if len(prefix) != NONCE_PREFIX_SIZE:
+        raise FormatError("Файл поврежден: неверный nonce")
+    return prefix
+
+
+def body_size(fields):
+    """Ожидаемый размер данных после заголовка"""
+    count = segment_count(fields["length"], fields["segment_size"])
+    return fields["length"] + count * TAG_SIZE
+
+
+def _stored_segments(src, fields, key):
+    """Аргументы decrypt_segment для всех сегментов файла"""
+    prefix = check_header(fields)
+    segment_size = fields["segment_size"]
+    length = fields["length"]
+    count = segment_count(length, segment_size)
+    for index in range(count):
+        size = min(segment_size, length - index * segment_size) + TAG_SIZE
+        data = src.read(size)
+        if len(data) != size:
+            raise TruncatedError("Файл поврежден: данные обрезаны")
+        yield key, prefix, index, index == count - 1, data
+
+
+def segment_failure(error, fields, key_verified=False):
+    """Исключение для ошибки проверки сегмента при дешифровании
+
+    Без проверочного значения ключа (файлы ранних версий) ошибка первого
+    сегмента неотличима от неверного пароля. key_verified - ключ уже
+    проверен иначе (например, индексом архива).
+    """
+    if error.index == 0 and not key_verified and "check" not in fields:
+        return WrongPasswordError("Неверный пароль или поврежденный файл")
+    return error
+
+
+def decrypt_body(src, dst, fields, file_key, tracker=None, workers=None,
+                 check_end=True, key_verified=False):
+    """Дешифрование сегментов после заголовка с пулом потоков
+
+    check_end=False - данные продолжаются после сегментов (файл в архиве);
+    key_verified - см. segment_failure.
+    """
+    tracker = tracker_for(tracker)
+    workers = workers or default_workers()
+    segments = _stored_segments(src, fields, keys.data_key(file_key))
+
+    tracker.start("Дешифрование данных...", fields["length"])
+    try:
+        for block in ordered_map(decrypt_segment, segments, workers):
+            dst.write(block)
+            tracker.advance(len(block))
+    except SegmentError as e:
+        raise segment_failure(e, fields, key_verified)
+
+    if check_end and src.read(1):
+        raise FormatError("Файл поврежден: лишние данные в конце")
+
@@ -0,0 +1,165 @@
+"""Проверка зашифрованных файлов без записи результата
+
+Каждый файл расшифровывается потоково в NullWriter: проверяются
+заголовок, пароль и целостность всех данных (теги GCM, отпечатки
+индекса, дополнение CBC), но ничего не записывается на диск. Файлы
+проверяются пулом потоков с общей сессией ключей, итог сводится в отчет
+по статусам с общей скоростью.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import archive, core, fsutil, header, mmapio
+from .errors import (EncryptorError, FormatError, TruncatedError,
+                     WrongPasswordError)
+from .kdf import DEFAULT_ITERATIONS
+from .keys import KeySession
+from .progress import MB
+
+STATUS_OK = "ok"
+STATUS_WRONG_PASSWORD = "wrong_password"
+STATUS_CORRUPT = "corrupt"
+STATUS_TRUNCATED = "truncated"
+STATUS_ERROR = "error"
+STATUSES = (STATUS_OK, STATUS_WRONG_PASSWORD, STATUS_CORRUPT,
+            STATUS_TRUNCATED, STATUS_ERROR)
+
+
+class NullWriter:
+    """Поток-приемник, который отбрасывает данные"""
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class VerifyResult:
+    """Результат проверки одного файла"""
+
+    def __init__(self, path, status, size, seconds, error=None):
+        self.path = path
+        self.status = status
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == STATUS_OK
+
+    @property
+    def mbps(self):
+        return self.size / self.seconds / MB if self.seconds > 0 else 0.0
+
+    def to_dict(self):
+        return {"path": self.path, "status": self.status, "size": self.size,
+                "seconds": round(self.seconds, 3), "error": self.error}
+
+    def __repr__(self):
+        return f"VerifyResult({self.path!r}, {self.status})"
+
+
+def _check(path, password, iterations, session, workers, cancel):
+    """Расшифровать файл в NullWriter; архив - все файлы по очереди"""
+    fsutil.recover(path)
+    with open(path, 'rb') as src:
+        magic = src.read(len(header.MAGIC))
+        is_archive = (magic == header.MAGIC and
+                      header.read_header(src, magic)[0].get("type") == header.TYPE_ARCHIVE)
+        if not is_archive:
+            src.seek(0)
+            core.decrypt_stream(src, NullWriter(), password, iterations,
+                                workers=workers, session=session, cancel=cancel,
+                                io_mode=mmapio.IO_BUFFERED)
+            return
+    with archive.open_archive(path, password, session) as arc:
+        for name in arc.names():
+            arc.extract_to(name, NullWriter(), workers=workers, cancel=cancel)
+
+
+def verify_file(path, password, iterations=DEFAULT_ITERATIONS, session=None,
+                workers=None, cancel=None):
+    """Проверить один файл; ошибки не выбрасываются, а попадают в статус"""
+    size = 0
+    started = time.perf_counter()
+    status, error = STATUS_OK, None
+    try:
+        size = os.path.getsize(path)
+        _check(path, password, iterations, session, workers, cancel)
+    except WrongPasswordError as e:
+        status, error = STATUS_WRONG_PASSWORD, str(e)
+    except TruncatedError as e:
+        status, error = STATUS_TRUNCATED, str(e)
+    except FormatError as e:
+        status, error = STATUS_CORRUPT, str(e)
+    except (EncryptorError, OSError) as e:
+        status, error = STATUS_ERROR, str(e)
+    return VerifyResult(path, status, size, time.perf_counter() - started, error)
+
+
+def verify_files(files, password, iterations=DEFAULT_ITERATIONS, jobs=None,
+                 progress=None, session=None, cancel=None):
+    """Проверить список путей параллельно
+
+    progress(done, total, result) вызывается после каждого файла с числом
+    проверенных и общим числом байт. Общая сессия ключей выполняет PBKDF2
+    один раз на каждую соль. После установки cancel новые файлы не
+    запускаются. Возвращает список VerifyResult в порядке завершения.
+    """
+    if session is None:
+        with KeySession(password, iterations) as own_session:
+            return verify_files(files, password, iterations, jobs, progress,
+                                own_session, cancel)
+
+    jobs = jobs or os.cpu_count() or 1
+    total = 0
+    for path in files:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+
+    results = []
+    done_bytes = 0
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Ограниченное окно задач, как в batch.run_batch
+        queue = iter(files)
+        pending = set()
+        while True:
+            for path in queue:
+                if cancel is not None and cancel.is_set():
+                    break
+                # Внутри файла - один поток, параллелизм обеспечивает пул
+                pending.add(pool.submit(verify_file, path, password, iterations,
+                                        session, 1, cancel))
+                if len(pending) >= jobs * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                results.append(result)
+                done_bytes += result.size
+                if progress is not None:
+                    progress(done_bytes, total, result)
+    return results
+
+
+def summarize(results, seconds):
+    """Сводный отчет: число файлов по статусам, объем, скорость и ошибки"""
+    counts = {status: 0 for status in STATUSES}
+    for result in results:
+        counts[result.status] += 1
+    size = sum(result.size for result in results)
+    return {
+        "files": len(results),
+        "counts": counts,
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "mbps": round(size / seconds / MB, 1) if seconds > 0 else 0.0,
+        "failures": [result.to_dict() for result in results if not result.ok],
+    }
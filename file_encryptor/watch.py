@@ -0,0 +1,417 @@
+"""Наблюдение за каталогом: новые и измененные файлы шифруются автоматически
+
+Изменения обнаруживаются через inotify (Linux, через ctypes) или, где он
+недоступен, периодическим обходом каталога (os.scandir, без чтения
+файлов). Файл берется в работу, когда его размер и время изменения не
+меняются SETTLE_SECONDS: так недописанные файлы не шифруются. Готовые
+файлы ставятся в ограниченную очередь пула потоков и шифруются во
+временный файл рядом с выходным, который затем атомарно подменяет
+выходной. Выходной путь повторяет путь относительно наблюдаемого
+каталога (как batch --output-root).
+
+Размер и время изменения зашифрованных файлов сохраняются в файле
+состояния (JSON, атомарная запись), поэтому после перезапуска уже
+зашифрованные файлы не обрабатываются повторно, а измененные -
+шифруются заново. Скрытые файлы (имя начинается с точки) пропускаются:
+их принято использовать для недокачанных данных. Шифруются только
+обычные файлы: символические ссылки, каналы и устройства пропускаются.
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . import batch, core, fsutil
+from .errors import EncryptorError
+from .kdf import DEFAULT_ITERATIONS
+from .keys import KeySession
+
+STATE_NAME = ".file_encryptor_watch.json"
+STATE_VERSION = 1
+# Сколько секунд размер и время изменения файла должны не меняться
+SETTLE_SECONDS = 2.0
+# Период обхода каталога без inotify и проверки ожидающих файлов, с
+POLL_INTERVAL = 1.0
+
+# Флаги inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class WatchResult:
+    """Результат шифрования одного файла"""
+
+    def __init__(self, path, output, size, error=None):
+        self.path = path
+        self.output = output
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"WatchResult({self.path!r}, {status})"
+
+
+def _signature(stat):
+    """Отпечаток версии файла: размер и время изменения"""
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class PollWatcher:
+    """Обнаружение изменений обходом каталога"""
+
+    def __init__(self, directory, recursive=True):
+        self.directory = directory
+        self.recursive = recursive
+
+    def wait(self, timeout):
+        """Подождать timeout; None - нужен полный обход каталога"""
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Обнаружение изменений через inotify (только Linux)"""
+
+    def __init__(self, directory, recursive=True):
+        self.directory = directory
+        self.recursive = recursive
+        self._libc = _libc()
+        if self._libc is None:
+            raise EncryptorError("inotify недоступен")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise EncryptorError(f"inotify недоступен: {os.strerror(ctypes.get_errno())}")
+        self._dirs = {}
+        self._add_tree(directory)
+
+    def _add(self, path):
+        """Добавить каталог под наблюдение"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def _add_tree(self, path):
+        """Добавить каталог и (при recursive) все подкаталоги"""
+        self._add(path)
+        if self.recursive:
+            for dirpath, dirnames, _ in os.walk(path):
+                for name in dirnames:
+                    self._add(os.path.join(dirpath, name))
+
+    def wait(self, timeout):
+        """Пути измененных файлов за timeout; None - нужен полный обход"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        rescan = False
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, size = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + size].rstrip(b"\0")
+                offset += _EVENT.size + size
+                if mask & IN_Q_OVERFLOW:
+                    rescan = True
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    # Новый каталог: файлы в нем могли появиться до
+                    # установки наблюдения, поэтому нужен полный обход
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_tree(path)
+                        rescan = True
+                else:
+                    changed.add(path)
+        return None if rescan else changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _libc():
+    """libc с функциями inotify или None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def open_watcher(directory, recursive=True, use_inotify=True):
+    """inotify, если доступен, иначе обход каталога"""
+    if use_inotify:
+        try:
+            return InotifyWatcher(directory, recursive)
+        except EncryptorError:
+            pass
+    return PollWatcher(directory, recursive)
+
+
+def load_state(path):
+    """Прочитать состояние: {относительный путь: [размер, mtime_ns]}"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        raise EncryptorError(f"Файл состояния поврежден: {path}")
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        raise EncryptorError(f"Неподдерживаемый файл состояния: {path}")
+    return state.get("files", {})
+
+
+def save_state(path, files):
+    """Атомарно записать состояние"""
+    fd, temp_file = fsutil.temp_path_near(path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"version": STATE_VERSION, "files": files}, f,
+                      ensure_ascii=False, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        fsutil.replace_atomic(temp_file, path)
+    except BaseException:
+        fsutil.remove_quietly(temp_file)
+        raise
+
+
+def _encrypt_one(path, output, password, options, session):
+    """Зашифровать файл во временный файл и атомарно подменить выходной"""
+    size = 0
+    try:
+        size = os.path.getsize(path)
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        fd, temp_file = fsutil.temp_path_near(output)
+        os.close(fd)
+        try:
+            core.encrypt_file(path, temp_file, password, session=session, **options)
+            fsutil.replace_atomic(temp_file, output)
+        except BaseException:
+            fsutil.remove_quietly(temp_file)
+            raise
+    except (EncryptorError, OSError) as e:
+        return WatchResult(path, output, size, str(e))
+    return WatchResult(path, output, size)
+
+
+class FolderWatcher:
+    """Наблюдение за каталогом с шифрованием новых файлов в output_dir"""
+
+    def __init__(self, directory, output_dir, password, iterations=DEFAULT_ITERATIONS,
+                 fmt=core.DEFAULT_FORMAT, kdf_params=None, jobs=None,
+                 settle=SETTLE_SECONDS, interval=POLL_INTERVAL, state_path=None,
+                 recursive=True, use_inotify=True, on_result=None):
+        self.directory = directory
+        self.output_dir = output_dir
+        self.password = password
+        self.iterations = iterations
+        self.kdf_params = kdf_params
+        self.jobs = jobs or os.cpu_count() or 1
+        self.settle = settle
+        self.interval = interval
+        self.state_path = state_path or os.path.join(output_dir, STATE_NAME)
+        self.recursive = recursive
+        self.use_inotify = use_inotify
+        self.on_result = on_result
+        # Внутри файла - один поток, параллелизм обеспечивает пул
+        self._options = {"iterations": iterations, "fmt": fmt, "workers": 1,
+                         "kdf_params": kdf_params}
+        self._excluded = {os.path.abspath(output_dir), os.path.abspath(self.state_path)}
+        self._done = {}
+        self._failed = {}
+        # Ожидают стабилизации: путь -> (отпечаток, время последнего изменения)
+        self._settling = {}
+        # Готовы к шифрованию, но пул занят: путь -> отпечаток
+        self._ready = {}
+        # Задачи пула: future -> (путь, отпечаток на момент запуска)
+        self._running = {}
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.directory)
+
+    def _skipped(self, path):
+        """Скрытые файлы, выходной каталог и файл состояния не шифруются"""
+        if os.path.basename(path).startswith("."):
+            return True
+        absolute = os.path.abspath(path)
+        return any(absolute == item or absolute.startswith(item + os.sep)
+                   for item in self._excluded)
+
+    def _scan(self):
+        """Полный обход: {путь: отпечаток} всех подходящих файлов"""
+        found = {}
+        stack = [self.directory]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if self._skipped(entry.path):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        found[entry.path] = _signature(entry.stat(follow_symlinks=False))
+                except OSError:
+                    continue
+        return found
+
+    def _observe(self, path, signature, now):
+        """Учесть версию файла: новая или измененная ждет стабилизации"""
+        relative = self._relative(path)
+        if self._done.get(relative) == signature or self._failed.get(path) == signature:
+            return
+        if (path, signature) in self._running.values():
+            return
+        if path in self._ready:
+            if self._ready[path] == signature:
+                return
+            del self._ready[path]
+        previous = self._settling.get(path)
+        if previous is None or previous[0] != signature:
+            self._settling[path] = (signature, now)
+
+    def _stat(self, path):
+        """Отпечаток обычного файла или None (нет файла, ссылка, канал...)
+
+        Как и в _scan, символические ссылки не разыменовываются: ссылка
+        наружу не должна шифроваться, а чтение FIFO заблокирует поток.
+        """
+        try:
+            info = os.lstat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        return _signature(info)
+
+    def _running_paths(self):
+        return {path for path, _ in self._running.values()}
+
+    def _promote(self, now):
+        """Файлы, не менявшиеся settle секунд, перевести в очередь"""
+        for path, (signature, since) in list(self._settling.items()):
+            current = self._stat(path)
+            if current is None:
+                del self._settling[path]
+            elif current != signature:
+                self._settling[path] = (current, now)
+            elif now - since >= self.settle and path not in self._running_paths():
+                del self._settling[path]
+                self._ready[path] = signature
+
+    def _submit(self, pool, session):
+        """Отправить готовые файлы в пул, не больше jobs * 2 задач"""
+        while self._ready and len(self._running) < self.jobs * 2:
+            path = next(iter(self._ready))
+            signature = self._ready.pop(path)
+            output = batch.output_path_for(path, self.directory, True, self.output_dir)
+            future = pool.submit(_encrypt_one, path, output, self.password,
+                                 self._options, session)
+            self._running[future] = (path, signature)
+
+    def _collect(self, finished, now):
+        """Учесть завершенные задачи; возвращает True, если состояние изменилось"""
+        changed = False
+        for future in finished:
+            path, signature = self._running.pop(future)
+            result = future.result()
+            if not result.ok:
+                self._failed[path] = signature
+            elif self._stat(path) == signature:
+                self._done[self._relative(path)] = signature
+                self._failed.pop(path, None)
+                changed = True
+            else:
+                # Файл менялся во время шифрования: зашифровать новую версию
+                self._observe(path, self._stat(path) or signature, now)
+            if self.on_result is not None:
+                self.on_result(result)
+        return changed
+
+    def run(self, stop=None):
+        """Наблюдать до установки stop (threading.Event); KeyboardInterrupt тоже завершает
+
+        Запущенные задачи дорабатывают, состояние сохраняется.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._done = load_state(self.state_path)
+        watcher = open_watcher(self.directory, self.recursive, self.use_inotify)
+        with KeySession(self.password, self.iterations, kdf_params=self.kdf_params) as session, \
+                ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            try:
+                self._loop(watcher, pool, session, stop)
+            finally:
+                watcher.close()
+                if self._running:
+                    finished, _ = wait(list(self._running))
+                    self._collect(finished, time.monotonic())
+                save_state(self.state_path, self._done)
+
+    def _loop(self, watcher, pool, session, stop):
+        """Основной цикл: изменения, стабилизация, очередь, итоги"""
+        changed = None
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            if changed is None:
+                found = self._scan()
+                for path, signature in found.items():
+                    self._observe(path, signature, now)
+                # Удаленные исходные файлы больше не отслеживаются
+                present = {self._relative(path) for path in found}
+                for relative in [item for item in self._done if item not in present]:
+                    del self._done[relative]
+            else:
+                for path in changed:
+                    signature = self._stat(path)
+                    if signature is not None and not self._skipped(path):
+                        self._observe(path, signature, now)
+            self._promote(now)
+            self._submit(pool, session)
+
+            if self._running:
+                finished, _ = wait(list(self._running), timeout=0)
+                if finished and self._collect(finished, now):
+                    save_state(self.state_path, self._done)
+            busy = self._settling or self._ready or self._running
+            timeout = min(self.interval, self.settle) if busy else self.interval
+            changed = watcher.wait(timeout)
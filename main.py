@@ -3,14 +3,50 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
 import sys
-import hashlib
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-from Crypto.Random import get_random_bytes
 import json
-import tempfile
-import shutil
+import queue
+from file_encryptor import batch, compress, core, journal, kdf, resume
+from file_encryptor.errors import CancelledError
+from file_encryptor.progress import STAGE_DATA, format_eta
+
+# Период опроса очереди событий интерфейса, мс
+UI_REFRESH_MS = 100
+
+NO_COMPRESSION = "нет"
+
+# Строк журнала в окне; старые строки удаляются
+LOG_LINES = journal.DEFAULT_CAPACITY
+# Файл журнала JSON-lines с ротацией (если переменная задана)
+LOG_FILE_ENV = "FILE_ENCRYPTOR_LOG"
+
+# Иконки и цвета уровней журнала
+LOG_LEVELS = {
+    "INFO": ("[ℹ]", "black"),
+    "SUCCESS": ("[✓]", "green"),
+    "ERROR": ("[✗]", "red"),
+    "WARNING": ("[⚠]", "orange"),
+    "DEBUG": ("[🐛]", "gray")
+}
+
+
+class ProcessOptions:
+    """Параметры операции, прочитанные из виджетов в потоке Tk
+
+    Рабочий поток пользуется только этим объектом и не читает переменные Tk.
+    """
+
+    def __init__(self, input_path, password, encrypt, replace, iterations,
+                 keep_backup, compression, resumable):
+        self.input_path = input_path
+        self.password = password
+        self.encrypt = encrypt
+        self.replace = replace
+        self.iterations = iterations
+        self.keep_backup = keep_backup
+        # Алгоритм сжатия или None (без сжатия и при дешифровании)
+        self.compression = compression if encrypt and compression != NO_COMPRESSION else None
+        self.resumable = resumable
 
 
 class FileEncryptorApp:
@@ -28,6 +64,21 @@ class FileEncryptorApp:
         self.output_file = ""
         self.is_processing = False
         self.replace_mode = tk.BooleanVar(value=False)  # Режим замены файла
+        self.keep_backup = tk.BooleanVar(value=True)  # Копия .backup при замене
+        self.resumable = tk.BooleanVar(value=False)  # Шифрование с контрольными точками
+        self.cancel_event = threading.Event()  # Кооперативная отмена операции
+
+        # Рабочий поток не трогает виджеты: вызовы идут через очередь,
+        # прогресс схлопывается до последнего значения
+        self.ui_queue = queue.Queue()
+        self.pending_progress = None
+        self.progress_lock = threading.Lock()
+
+        # Журнал: записи из любого потока копятся в кольцевом буфере и
+        # выводятся в окно пачкой при опросе очереди
+        self.journal = journal.Journal(LOG_LINES)
+        if os.environ.get(LOG_FILE_ENV):
+            self.journal.open_file(os.environ[LOG_FILE_ENV])
 
         # Создание интерфейса
         self.create_widgets()
@@ -109,6 +160,10 @@ class FileEncryptorApp:
         ttk.Button(input_frame, text="Выбрать...",
                    command=self.select_input_file, width=12).grid(row=0, column=1)
 
+        ttk.Button(input_frame, text="Папка...",
+                   command=self.select_input_folder, width=10).grid(
+            row=0, column=2, padx=(5, 0))
+
         # Чекбокс режима замены
         self.replace_checkbox = ttk.Checkbutton(frame,
                                                 text="Заменить исходный файл",
@@ -116,6 +171,12 @@ class FileEncryptorApp:
                                                 command=self.on_replace_mode_change)
         self.replace_checkbox.grid(row=2, column=0, sticky='w', pady=(10, 0))
 
+        ttk.Checkbutton(frame, text="Сохранять резервную копию (.backup)",
+                        variable=self.keep_backup).grid(row=3, column=0, sticky='w')
+
+        ttk.Checkbutton(frame, text="Возобновляемое шифрование копии (контрольные точки)",
+                        variable=self.resumable).grid(row=4, column=0, sticky='w')
+
     def create_settings_section(self, parent):
         """Создание секции настроек"""
         frame = ttk.LabelFrame(parent, text="⚙️ Настройки", padding=15)
@@ -147,6 +208,15 @@ class FileEncryptorApp:
         ttk.Button(frame, text="?", command=self.show_padding_info,
                    width=2).grid(row=1, column=2, padx=(5, 0), pady=(15, 0))
 
+        # Сжатие перед шифрованием (уже сжатые файлы пропускаются)
+        ttk.Label(frame, text="Сжатие:", style='Header.TLabel').grid(
+            row=2, column=0, sticky='w', padx=(0, 20), pady=(15, 0))
+
+        self.compression_var = tk.StringVar(value=NO_COMPRESSION)
+        ttk.Combobox(frame, textvariable=self.compression_var,
+                     values=[NO_COMPRESSION] + list(compress.ALGORITHMS),
+                     state="readonly", width=15).grid(row=2, column=1, sticky='w', pady=(15, 0))
+
     def create_password_section(self, parent):
         """Создание секции пароля"""
         frame = ttk.LabelFrame(parent, text="🔑 Безопасность", padding=15)
@@ -178,7 +248,8 @@ class FileEncryptorApp:
             row=0, column=2, sticky='w', padx=(20, 0), pady=(0, 5))
 
         self.iterations_var = tk.IntVar(value=100000)
-        ttk.Scale(frame, from_=10000, to=500000, variable=self.iterations_var,
+        ttk.Scale(frame, from_=kdf.MIN_ITERATIONS, to=kdf.MAX_ITERATIONS,
+                  variable=self.iterations_var,
                   length=150, orient='horizontal').grid(
             row=1, column=2, padx=(20, 0))
 
@@ -186,6 +257,14 @@ class FileEncryptorApp:
                                           text=f"Итераций: {self.iterations_var.get():,}")
         self.iterations_label.grid(row=2, column=2, padx=(20, 0))
 
+        ttk.Button(frame, text="⏱ Калибровать", command=self.calibrate_iterations,
+                   width=14).grid(row=3, column=2, padx=(20, 0))
+
+        # Скорость PBKDF2 на этой машине (итераций/с), измеряется после запуска
+        self.kdf_rate = None
+        self.kdf_measuring = False
+        self.after_kdf_rate = []
+
         self.iterations_var.trace('w', self.update_iterations_label)
 
     def create_action_button_section(self, parent):
@@ -199,6 +278,12 @@ class FileEncryptorApp:
                                         width=20)
         self.action_button.pack(side='left', padx=(0, 10))
 
+        # Кнопка отмены (активна только во время обработки)
+        self.cancel_button = ttk.Button(frame, text="⏹ Отмена",
+                                        command=self.cancel_processing, style='Custom.TButton',
+                                        width=12, state="disabled")
+        self.cancel_button.pack(side='left', padx=(0, 10))
+
         # Кнопка очистки
         ttk.Button(frame, text="🧹 Очистить",
                    command=self.clear_all, style='Custom.TButton',
@@ -233,6 +318,10 @@ class FileEncryptorApp:
                                                   font=('Consolas', 9),
                                                   wrap='word')
         self.log_text.pack(fill='both', expand=True)
+        for level, (icon, color) in LOG_LEVELS.items():
+            self.log_text.tag_config(f"timestamp_{level}", foreground=color)
+        self.log_text.tag_config("timestamp_other", foreground="black")
+        self.log_text.tag_config("message", foreground="black")
 
         # Кнопки управления логом
         log_buttons_frame = ttk.Frame(frame)
@@ -296,6 +385,15 @@ class FileEncryptorApp:
             self.input_entry.insert(0, filename)
             self.log_message(f"Выбран файл: {os.path.basename(filename)}", "INFO")
 
+    def select_input_folder(self):
+        """Выбор каталога для пакетной обработки"""
+        folder = filedialog.askdirectory(title="Выберите папку для обработки")
+        if folder:
+            self.input_file = folder
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.insert(0, folder)
+            self.log_message(f"Выбрана папка: {folder}", "INFO")
+
     def toggle_password_visibility(self):
         """Показать/скрыть пароль"""
         show = self.show_password_var.get()
@@ -305,18 +403,66 @@ class FileEncryptorApp:
     def update_iterations_label(self, *args):
         """Обновить метку итераций"""
         value = self.iterations_var.get()
-        self.iterations_label.config(text=f"Итераций: {value:,}")
-
-        # Изменение цвета в зависимости от сложности
-        if value < 50000:
-            color = "#e74c3c"
-        elif value < 200000:
-            color = "#f39c12"
+        if self.kdf_rate is None:
+            self.iterations_label.config(text=f"Итераций: {value:,}")
+
+            # Изменение цвета в зависимости от сложности
+            if value < 50000:
+                color = "#e74c3c"
+            elif value < 200000:
+                color = "#f39c12"
+            else:
+                color = "#27ae60"
         else:
-            color = "#27ae60"
+            # Цвет по времени разблокировки на этой машине
+            seconds = value / self.kdf_rate
+            self.iterations_label.config(text=f"Итераций: {value:,} (~{seconds:.2f} с)")
+            if seconds < kdf.DEFAULT_TARGET_MS / 1000 / 2:
+                color = "#e74c3c"
+            elif seconds < kdf.DEFAULT_TARGET_MS / 1000:
+                color = "#f39c12"
+            else:
+                color = "#27ae60"
 
         self.iterations_label.config(foreground=color)
 
+    def measure_kdf_rate(self, then=None):
+        """Измерить скорость PBKDF2 в фоновом потоке; then() - после замера"""
+        if then is not None:
+            self.after_kdf_rate.append(then)
+        if self.kdf_measuring:
+            return
+        self.kdf_measuring = True
+
+        def measure():
+            rate = kdf.pbkdf2_rate()
+            # Результат передается в поток Tk
+            self.window.after(0, self.kdf_rate_measured, rate)
+
+        threading.Thread(target=measure, daemon=True).start()
+
+    def kdf_rate_measured(self, rate):
+        """Сохранить скорость PBKDF2 (в потоке Tk)"""
+        self.kdf_rate = rate
+        self.kdf_measuring = False
+        self.update_iterations_label()
+        callbacks, self.after_kdf_rate = self.after_kdf_rate, []
+        for callback in callbacks:
+            callback()
+
+    def calibrate_iterations(self):
+        """Подобрать число итераций под целевое время разблокировки"""
+        if self.kdf_rate is None:
+            self.log_message("Замер скорости PBKDF2...", "INFO")
+            self.measure_kdf_rate(then=self.calibrate_iterations)
+            return
+        iterations = kdf.calibrate_iterations(kdf.DEFAULT_TARGET_MS, self.kdf_rate)
+        # Значение ограничено диапазоном ползунка
+        iterations = max(kdf.MIN_ITERATIONS, min(kdf.MAX_ITERATIONS, iterations))
+        self.iterations_var.set(iterations)
+        self.log_message(f"Калибровка: {iterations:,} итераций "
+                         f"(~{iterations / self.kdf_rate * 1000:.0f} мс)", "INFO")
+
     def show_padding_info(self):
         """Показать информацию о дополнении"""
         info = """
@@ -339,36 +485,63 @@ class FileEncryptorApp:
         """
         messagebox.showinfo("О дополнении", info)
 
+    def _in_ui_thread(self):
+        """Выполняется ли код в потоке Tk"""
+        return threading.current_thread() is threading.main_thread()
+
+    def call_in_ui(self, func, *args):
+        """Выполнить вызов в потоке Tk (из рабочего потока - через очередь)"""
+        if self._in_ui_thread():
+            func(*args)
+        else:
+            self.ui_queue.put((func, args))
+
+    def poll_ui_queue(self):
+        """Разобрать очередь событий рабочего потока"""
+        with self.progress_lock:
+            pending, self.pending_progress = self.pending_progress, None
+        if pending is not None:
+            self._set_progress(*pending)
+        while True:
+            try:
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        self.flush_log()
+        self.window.after(UI_REFRESH_MS, self.poll_ui_queue)
+
     def log_message(self, message, level="INFO"):
-        """Добавить сообщение в лог"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-
-        # Цвета и иконки для разных уровней
-        level_config = {
-            "INFO": ("[ℹ]", "black"),
-            "SUCCESS": ("[✓]", "green"),
-            "ERROR": ("[✗]", "red"),
-            "WARNING": ("[⚠]", "orange"),
-            "DEBUG": ("[🐛]", "gray")
-        }
-
-        icon, color = level_config.get(level, ("[?]", "black"))
-        tag = f"[{timestamp}] {icon}"
-
-        # Вставка с тегами для цветов
-        self.log_text.insert(tk.END, f"{tag} ", f"timestamp_{level}")
-        self.log_text.insert(tk.END, f"{message}\n", f"message_{level}")
-        self.log_text.see(tk.END)
+        """Добавить сообщение в лог (из любого потока)"""
+        self.journal.add(message, level)
 
-        # Настройка тегов для цветов
-        self.log_text.tag_config(f"timestamp_{level}", foreground=color)
-        self.log_text.tag_config(f"message_{level}", foreground="black")
+    def flush_log(self):
+        """Вывести новые записи журнала одной вставкой"""
+        entries = self.journal.take_pending()
+        if not entries:
+            return
+        chunks = []
+        for entry in entries:
+            timestamp = datetime.fromtimestamp(entry.time).strftime("%H:%M:%S")
+            if entry.level in LOG_LEVELS:
+                icon, tag = LOG_LEVELS[entry.level][0], f"timestamp_{entry.level}"
+            else:
+                icon, tag = "[?]", "timestamp_other"
+            chunks += [f"[{timestamp}] {icon} ", tag, f"{entry.message}\n", "message"]
+        self.log_text.insert(tk.END, *chunks)
+
+        # Окно хранит не больше LOG_LINES строк
+        lines = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if lines > LOG_LINES:
+            self.log_text.delete(1.0, f"{lines - LOG_LINES + 1}.0")
+        self.log_text.see(tk.END)
 
-        # Обновить статус бар
-        self.status_var.set(f"{level}: {message}")
+        last = entries[-1]
+        self.status_var.set(f"{last.level}: {last.message}")
 
     def clear_log(self):
         """Очистить лог"""
+        self.journal.clear()
         self.log_text.delete(1.0, tk.END)
         self.log_message("Журнал очищен", "INFO")
 
@@ -401,6 +574,7 @@ class FileEncryptorApp:
                     "padding": self.padding_var.get(),
                     "iterations": self.iterations_var.get(),
                     "replace_mode": self.replace_mode.get(),
+                    "compression": self.compression_var.get(),
                     "timestamp": datetime.now().isoformat()
                 }
                 with open(filename, 'w', encoding='utf-8') as f:
@@ -450,9 +624,9 @@ class FileEncryptorApp:
         • Журналирование операций
 
         Алгоритм:
-        • AES-256 в режиме CBC
-        • Соль и вектор инициализации (IV)
-        • Дополнение PKCS7
+        • AES-256-GCM по сегментам (формат FENC)
+        • Заголовок с параметрами ключа, шифра и длиной
+        • Файлы старого формата AES! (CBC) расшифровываются
 
         Безопасность:
         • Минимальная длина пароля: 8 символов
@@ -467,172 +641,137 @@ class FileEncryptorApp:
 
     def derive_key(self, password, salt=None):
         """Создание ключа из пароля с использованием PBKDF2"""
-        if salt is None:
-            salt = get_random_bytes(16)
-
-        iterations = self.iterations_var.get()
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            iterations,
-            dklen=32  # AES-256 требует 32 байта
-        )
-        return key, salt
+        return core.derive_key(password, salt, self.iterations_var.get())
 
     def update_progress(self, value, status=""):
         """Обновить прогресс-бар"""
+        if self._in_ui_thread():
+            self._set_progress(value, status)
+            return
+        # Промежуточные значения не нужны - оставить только последнее
+        with self.progress_lock:
+            self.pending_progress = (value, status)
+
+    def _set_progress(self, value, status=""):
+        """Отобразить прогресс (только в потоке Tk)"""
         self.progress_var.set(value)
         self.progress_label.config(text=f"{int(value)}%")
         if status:
             self.status_var.set(status)
-        self.window.update_idletasks()
 
-    def process_file_in_place(self, file_path, password, encrypt=True):
+    def on_progress_event(self, event):
+        """Перевести событие прогресса ядра в строку статуса"""
+        status = event.status
+        if event.stage == STAGE_DATA and event.total:
+            done_mb = event.done / (1024 * 1024)
+            total_mb = event.total / (1024 * 1024)
+            status = f"{status} {done_mb:.1f}/{total_mb:.1f} МБ"
+            if event.rate:
+                status += f", {event.rate / (1024 * 1024):.1f} МБ/с"
+            if event.eta is not None:
+                status += f", осталось {format_eta(event.eta)}"
+        self.update_progress(event.percent, status)
+
+    def process_file_in_place(self, options):
         """Обработка файла на месте (замена исходного)"""
-        try:
-            mode_text = "шифрование" if encrypt else "дешифрование"
-            self.log_message(f"Начато {mode_text}: {os.path.basename(file_path)}", "INFO")
-            self.update_progress(10, f"{mode_text.capitalize()}...")
-
-            # Создаем временный файл
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"temp_enc_{os.path.basename(file_path)}")
-
-            # Определяем функцию для обработки
-            if encrypt:
-                success = self._encrypt_to_temp(file_path, temp_file, password)
-            else:
-                success = self._decrypt_to_temp(file_path, temp_file, password)
-
-            if not success:
-                return False
-
-            self.update_progress(80, "Замена файла...")
+        file_path = options.input_path
+        mode_text = "шифрование" if options.encrypt else "дешифрование"
+        self.log_message(f"Начато {mode_text}: {os.path.basename(file_path)}", "INFO")
+        self.update_progress(10, f"{mode_text.capitalize()}...")
+
+        if not self._run_core(options, core.process_file_in_place, file_path,
+                              options.password, options.encrypt,
+                              backup=options.keep_backup,
+                              compression=options.compression):
+            return False
 
-            # Резервное копирование (опционально)
+        self.update_progress(100, f"{mode_text.capitalize()} завершено")
+        self.log_message(f"Файл успешно обработан: {os.path.basename(file_path)}", "SUCCESS")
+        if options.keep_backup:
             backup_path = file_path + ".backup"
-            if os.path.exists(backup_path):
-                os.remove(backup_path)
-            shutil.copy2(file_path, backup_path)
-
-            # Заменяем исходный файл
-            shutil.move(temp_file, file_path)
-
-            self.update_progress(100, f"{mode_text.capitalize()} завершено")
-            self.log_message(f"Файл успешно обработан: {os.path.basename(file_path)}", "SUCCESS")
-
-            # Удаляем резервную копию (опционально)
-            # os.remove(backup_path)
             self.log_message(f"Резервная копия сохранена: {os.path.basename(backup_path)}", "INFO")
+        return True
 
-            return True
-
-        except Exception as e:
-            self.log_message(f"Ошибка обработки файла: {str(e)}", "ERROR")
-            return False
+    def process_file_copy(self, options, output_path):
+        """Обработка файла с созданием копии"""
+        input_path = options.input_path
+        mode_text = "шифрование" if options.encrypt else "дешифрование"
+        self.log_message(f"Начато {mode_text}: {os.path.basename(input_path)}", "INFO")
+        self.update_progress(10, "Чтение файла...")
+
+        if options.encrypt and options.resumable and options.compression is None:
+            # Сегментированный формат с контрольными точками .part/.ckpt
+            if resume.load_checkpoint(output_path) is not None:
+                self.log_message("Найдена контрольная точка: продолжение шифрования", "INFO")
+            success = self._run_core(options, resume.encrypt_file_resumable, input_path,
+                                     output_path, options.password)
+        else:
+            success = self._run_core(options, core.process_file, input_path, output_path,
+                                     options.password, options.encrypt,
+                                     compression=options.compression)
+        if success:
+            self.update_progress(100, f"{mode_text.capitalize()} завершено")
+            self.log_message(f"Файл сохранен: {os.path.basename(output_path)}", "SUCCESS")
+
+        return success
+
+    def process_batch(self, options):
+        """Пакетная обработка всех файлов каталога пулом потоков"""
+        folder = options.input_path
+        mode_text = "шифрование" if options.encrypt else "дешифрование"
+        files = batch.collect_files([folder])
+        self.log_message(f"Начато пакетное {mode_text}: {len(files)} файл(ов)", "INFO")
+        self.update_progress(0, f"{mode_text.capitalize()}...")
+
+        def on_progress(done, total, result):
+            name = os.path.relpath(result.path, folder)
+            if result.ok:
+                self.log_message(f"Обработан: {name}", "SUCCESS")
+            else:
+                self.log_message(f"Ошибка: {name}: {result.error}", "ERROR")
+            percent = done * 100 / total if total else 100
+            self.update_progress(percent, f"Обработано {percent:.0f}%")
 
-    def _encrypt_to_temp(self, input_path, temp_path, password):
-        """Шифрование во временный файл"""
         try:
-            # Чтение исходного файла
-            file_size = os.path.getsize(input_path)
-            with open(input_path, 'rb') as f:
-                data = f.read()
-
-            self.update_progress(30, "Генерация ключа...")
-
-            # Генерация ключа и соли
-            salt = get_random_bytes(16)
-            key, _ = self.derive_key(password, salt)
-            iv = get_random_bytes(16)
-            cipher = AES.new(key, AES.MODE_CBC, iv)
-
-            self.update_progress(50, "Шифрование данных...")
-
-            # Шифрование с дополнением
-            padded_data = pad(data, AES.block_size)
-            encrypted_data = cipher.encrypt(padded_data)
-
-            self.update_progress(70, "Сохранение...")
-
-            # Запись во временный файл
-            with open(temp_path, 'wb') as f:
-                f.write(b'AES!')
-                f.write(salt)
-                f.write(iv)
-                f.write(encrypted_data)
-
-            return True
-
-        except Exception as e:
-            self.log_message(f"Ошибка шифрования: {str(e)}", "ERROR")
+            results = batch.run_batch(files, options.password, options.encrypt,
+                                      iterations=options.iterations,
+                                      in_place=options.replace, progress=on_progress,
+                                      backup=options.keep_backup,
+                                      cancel=self.cancel_event,
+                                      compression=options.compression)
+        except CancelledError:
+            self.log_message("Пакет отменен", "WARNING")
             return False
 
-    def _decrypt_to_temp(self, input_path, temp_path, password):
-        """Дешифрование во временный файл"""
+        failed = sum(1 for result in results if not result.ok)
+        level = "ERROR" if failed else "SUCCESS"
+        self.log_message(f"Пакет завершен: успешно {len(results) - failed}, "
+                         f"ошибок {failed}", level)
+        return failed == 0
+
+    def read_options(self):
+        """Прочитать параметры операции из виджетов (только в потоке Tk)"""
+        encrypt = self.mode_var.get() == "encrypt"
+        return ProcessOptions(self.input_entry.get(), self.password_entry.get(),
+                              encrypt, self.replace_mode.get(),
+                              self.iterations_var.get(), self.keep_backup.get(),
+                              self.compression_var.get(), self.resumable.get())
+
+    def _run_core(self, options, func, *args, **kwargs):
+        """Вызвать функцию ядра и перевести её ошибки в записи журнала"""
         try:
-            # Чтение зашифрованного файла
-            with open(input_path, 'rb') as f:
-                header = f.read(4)
-                if header != b'AES!':
-                    raise ValueError("Неверный формат файла")
-                salt = f.read(16)
-                iv = f.read(16)
-                encrypted_data = f.read()
-
-            self.update_progress(30, "Восстановление ключа...")
-
-            # Восстановление ключа
-            key, _ = self.derive_key(password, salt)
-            cipher = AES.new(key, AES.MODE_CBC, iv)
-
-            self.update_progress(50, "Дешифрование данных...")
-
-            # Дешифрование
-            decrypted_padded = cipher.decrypt(encrypted_data)
-            decrypted_data = unpad(decrypted_padded, AES.block_size)
-
-            self.update_progress(70, "Сохранение...")
-
-            # Запись во временный файл
-            with open(temp_path, 'wb') as f:
-                f.write(decrypted_data)
-
+            func(*args, iterations=options.iterations,
+                 progress=self.on_progress_event, cancel=self.cancel_event, **kwargs)
             return True
-
-        except ValueError as e:
-            if "Padding" in str(e):
-                self.log_message("Ошибка: Неверный пароль или поврежденный файл", "ERROR")
-            else:
-                self.log_message(f"Ошибка формата: {str(e)}", "ERROR")
-            return False
-        except Exception as e:
-            self.log_message(f"Ошибка дешифрования: {str(e)}", "ERROR")
-            return False
-
-    def process_file_copy(self, input_path, output_path, encrypt=True):
-        """Обработка файла с созданием копии"""
-        try:
-            mode_text = "шифрование" if encrypt else "дешифрование"
-            self.log_message(f"Начато {mode_text}: {os.path.basename(input_path)}", "INFO")
-            self.update_progress(10, "Чтение файла...")
-
-            # Определяем функцию для обработки
-            if encrypt:
-                success = self._encrypt_to_temp(input_path, output_path, self.password_entry.get())
-            else:
-                success = self._decrypt_to_temp(input_path, output_path, self.password_entry.get())
-
-            if success:
-                self.update_progress(100, f"{mode_text.capitalize()} завершено")
-                self.log_message(f"Файл сохранен: {os.path.basename(output_path)}", "SUCCESS")
-
-            return success
-
+        except CancelledError:
+            self.log_message("Операция отменена", "WARNING")
+        except core.WrongPasswordError:
+            self.log_message("Ошибка: Неверный пароль или поврежденный файл", "ERROR")
+        except core.FormatError as e:
+            self.log_message(f"Ошибка формата: {str(e)}", "ERROR")
         except Exception as e:
             self.log_message(f"Ошибка обработки файла: {str(e)}", "ERROR")
-            return False
+        return False
 
     def validate_inputs(self):
         """Проверка введенных данных"""
@@ -662,7 +801,7 @@ class FileEncryptorApp:
             if not messagebox.askyesno("Подтверждение",
                                        f"Вы собираетесь {mode} файл '{os.path.basename(input_path)}'.\n"
                                        f"Исходный файл будет заменен.\n\n"
-                                       f"Рекомендуется сделать резервную копию.\n"
+                                       f"Рекомендуется сохранять резервную копию.\n"
                                        f"Продолжить?"):
                 return False
 
@@ -684,65 +823,69 @@ class FileEncryptorApp:
             self.status_var.set("Готов к работе")
             self.log_message("Все поля очищены", "INFO")
 
-    def process_in_thread(self):
+    def process_in_thread(self, options):
         """Обработка файла в отдельном потоке"""
-        if self.is_processing:
-            return
-
-        self.is_processing = True
+        input_path = options.input_path
+        encrypt, replace = options.encrypt, options.replace
 
         try:
-            # Получение данных
-            input_path = self.input_entry.get()
-            password = self.password_entry.get()
-            mode = self.mode_var.get()
-            encrypt = (mode == "encrypt")
-            replace = self.replace_mode.get()
-
             # Блокировка кнопки
-            self.action_button.config(state="disabled")
+            self.cancel_event.clear()
+            self.call_in_ui(self.action_button.config, {"state": "disabled"})
+            self.call_in_ui(self.cancel_button.config, {"state": "normal"})
 
             # Выполнение операции
             success = False
-            if replace:
+            if os.path.isdir(input_path):
+                # Пакетная обработка каталога
+                success = self.process_batch(options)
+                output_path = input_path
+            elif replace:
                 # Режим замены
-                success = self.process_file_in_place(input_path, password, encrypt)
+                success = self.process_file_in_place(options)
                 output_path = input_path
             else:
                 # Режим создания копии
-                base, ext = os.path.splitext(input_path)
-                if encrypt:
-                    output_path = base + "_encrypted" + ext
-                else:
-                    output_path = base + "_decrypted" + ext
-                success = self.process_file_copy(input_path, output_path, encrypt)
+                output_path = core.default_output_path(input_path, encrypt)
+                success = self.process_file_copy(options, output_path)
 
             # Показать результат
             if success:
-                result_text = f"{'Зашифрован' if encrypt else 'Расшифрован'}: {os.path.basename(input_path)}"
-                if not replace:
-                    result_text += f"\nСохранен как: {os.path.basename(output_path)}"
-
-                messagebox.showinfo("Успех", f"Операция завершена успешно!\n\n{result_text}")
-
-                # Открыть папку с результатом (только если не режим замены)
-                if not replace and messagebox.askyesno("Открыть папку", "Открыть папку с результатом?"):
-                    folder = os.path.dirname(output_path) or "."
-                    if sys.platform == "win32":
-                        os.startfile(folder)
-                    elif sys.platform == "darwin":
-                        os.system(f'open "{folder}"')
-                    else:
-                        os.system(f'xdg-open "{folder}"')
+                self.call_in_ui(self.show_result, input_path, output_path, encrypt, replace)
 
         except Exception as e:
             self.log_message(f"Критическая ошибка: {str(e)}", "ERROR")
-            messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
+            self.call_in_ui(messagebox.showerror, "Ошибка", f"Произошла ошибка: {str(e)}")
 
         finally:
             self.is_processing = False
             self.update_progress(0)
-            self.action_button.config(state="normal")
+            self.call_in_ui(self.action_button.config, {"state": "normal"})
+            self.call_in_ui(self.cancel_button.config, {"state": "disabled"})
+
+    def show_result(self, input_path, output_path, encrypt, replace):
+        """Сообщить об успешной операции (в потоке Tk)"""
+        result_text = f"{'Зашифрован' if encrypt else 'Расшифрован'}: {os.path.basename(input_path)}"
+        if not replace:
+            result_text += f"\nСохранен как: {os.path.basename(output_path)}"
+
+        messagebox.showinfo("Успех", f"Операция завершена успешно!\n\n{result_text}")
+
+        # Открыть папку с результатом (только если не режим замены)
+        if not replace and messagebox.askyesno("Открыть папку", "Открыть папку с результатом?"):
+            folder = os.path.dirname(output_path) or "."
+            if sys.platform == "win32":
+                os.startfile(folder)
+            elif sys.platform == "darwin":
+                os.system(f'open "{folder}"')
+            else:
+                os.system(f'xdg-open "{folder}"')
+
+    def cancel_processing(self):
+        """Запросить отмену текущей операции"""
+        if self.is_processing and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.log_message("Запрошена отмена...", "WARNING")
 
     def start_processing(self):
         """Начать обработку файла"""
@@ -753,8 +896,11 @@ class FileEncryptorApp:
         if not self.validate_inputs():
             return
 
-        # Запуск в отдельном потоке
-        thread = threading.Thread(target=self.process_in_thread, daemon=True)
+        # Параметры читаются здесь, в потоке Tk; рабочий поток не трогает виджеты
+        options = self.read_options()
+        self.is_processing = True
+        thread = threading.Thread(target=self.process_in_thread, args=(options,),
+                                  daemon=True)
         thread.start()
 
     def run(self):
@@ -772,8 +918,16 @@ class FileEncryptorApp:
         self.log_message("Режим: Создание копии файла", "INFO")
         self.log_message("Готов к работе", "SUCCESS")
 
+        # Замер скорости KDF после отображения окна
+        self.window.after(200, self.measure_kdf_rate)
+        # Очередь событий рабочего потока
+        self.window.after(UI_REFRESH_MS, self.poll_ui_queue)
+
         # Запуск главного цикла
-        self.window.mainloop()
+        try:
+            self.window.mainloop()
+        finally:
+            self.journal.close_file()
 
 
 def main():
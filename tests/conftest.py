@@ -0,0 +1,53 @@
+"""Общие фикстуры тестов"""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_encryptor import core  # noqa: E402
+
+PASSWORD = "correct horse"
+# Малое число итераций: тесты проверяют форматы, а не стойкость KDF
+ITERATIONS = 1000
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def baseline_plaintext():
+    """Открытый текст файла data/baseline_aes.enc, записанного версией 2.0"""
+    return b"".join(b"baseline line %d\n" % n for n in range(3000))
+
+
+def fenc_v1_plaintext():
+    """Открытый текст файла data/fenc_v1.enc: заголовок FENC без слотов ключа
+    и проверочного значения, ключ получен прямо из пароля"""
+    return b"".join(b"fenc line %d\n" % n for n in range(3000))
+
+
+def encrypt_bytes(data, password=PASSWORD, **options):
+    """Зашифровать data в памяти; возвращает шифртекст"""
+    options.setdefault("iterations", ITERATIONS)
+    dst = io.BytesIO()
+    core.encrypt_stream(io.BytesIO(data), dst, password, **options)
+    return dst.getvalue()
+
+
+def decrypt_bytes(data, password=PASSWORD, **options):
+    """Расшифровать data в памяти; возвращает открытый текст"""
+    options.setdefault("iterations", ITERATIONS)
+    dst = io.BytesIO()
+    core.decrypt_stream(io.BytesIO(data), dst, password, **options)
+    return dst.getvalue()
+
+
+@pytest.fixture
+def make_file(tmp_path):
+    """Создать файл со случайными (или заданными) данными"""
+    def make(name="plain.bin", size=100000, data=None):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(size) if data is None else data)
+        return str(path)
+    return make
@@ -0,0 +1,147 @@
+"""Асинхронный API: потоки asyncio, ограничение задач и ошибки"""
+import asyncio
+import io
+import os
+import threading
+
+import pytest
+
+from file_encryptor import aio, core
+from file_encryptor.errors import (EncryptorError, SegmentError, TruncatedError,
+                                   WrongPasswordError)
+
+from conftest import ITERATIONS, PASSWORD, decrypt_bytes, encrypt_bytes
+
+SEGMENT = 4096
+
+
+class Writer:
+    """Приемник с интерфейсом asyncio.StreamWriter"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.drains = 0
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    async def drain(self):
+        self.drains += 1
+        await asyncio.sleep(0)
+
+
+def reader_for(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def encrypt(data, length=None, **options):
+    writer = Writer()
+    async with aio.AsyncEncryptor(max_jobs=2, segment_size=SEGMENT) as encryptor:
+        await encryptor.encrypt_stream(reader_for(data), writer, PASSWORD,
+                                       len(data) if length is None else length,
+                                       ITERATIONS, **options)
+    return writer
+
+
+async def decrypt(data):
+    writer = Writer()
+    async with aio.AsyncEncryptor(max_jobs=2) as encryptor:
+        await encryptor.decrypt_stream(reader_for(data), writer, PASSWORD)
+    return writer.buffer.getvalue()
+
+
+@pytest.mark.parametrize("size", [0, 100, 5 * SEGMENT + 7])
+def test_stream_round_trip(size):
+    data = os.urandom(size)
+    writer = asyncio.run(encrypt(data))
+    encrypted = writer.buffer.getvalue()
+    # Формат совместим с синхронным ядром в обе стороны
+    assert decrypt_bytes(encrypted) == data
+    assert asyncio.run(decrypt(encrypted)) == data
+    assert asyncio.run(decrypt(encrypt_bytes(data, chunk_size=SEGMENT))) == data
+
+
+def test_backpressure():
+    writer = asyncio.run(encrypt(os.urandom(5 * SEGMENT)))
+    assert writer.drains == 5
+
+
+def test_short_input():
+    with pytest.raises(EncryptorError):
+        asyncio.run(encrypt(os.urandom(100), length=200))
+
+
+def test_truncated():
+    encrypted = encrypt_bytes(os.urandom(3 * SEGMENT), chunk_size=SEGMENT)
+    with pytest.raises(TruncatedError):
+        asyncio.run(decrypt(encrypted[:-10]))
+
+
+def test_tampered():
+    encrypted = bytearray(encrypt_bytes(os.urandom(3 * SEGMENT), chunk_size=SEGMENT))
+    encrypted[-SEGMENT] ^= 1
+    with pytest.raises(SegmentError):
+        asyncio.run(decrypt(bytes(encrypted)))
+
+
+def test_wrong_password():
+    encrypted = encrypt_bytes(b"data", "other password")
+    with pytest.raises(WrongPasswordError):
+        asyncio.run(decrypt(encrypted))
+
+
+def test_files_with_bounded_jobs(make_file, tmp_path):
+    sources = [make_file(f"f{n}.bin", 20000) for n in range(4)]
+
+    async def run():
+        async with aio.AsyncEncryptor(max_jobs=2) as encryptor:
+            await asyncio.gather(*(encryptor.encrypt_file(path, path + ".enc", PASSWORD,
+                                                          ITERATIONS)
+                                   for path in sources))
+            await asyncio.gather(*(encryptor.decrypt_file(path + ".enc", path + ".out",
+                                                          PASSWORD, ITERATIONS)
+                                   for path in sources))
+
+    asyncio.run(run())
+    for path in sources:
+        with open(path, 'rb') as a, open(path + ".out", 'rb') as b:
+            assert a.read() == b.read()
+    assert core.read_file_info(sources[0] + ".enc")["format"] == core.DEFAULT_FORMAT
+
+
+def test_cancel_keeps_slot_until_thread_stops(make_file, tmp_path):
+    source = make_file(size=200000)
+    output = str(tmp_path / "a.enc")
+    started = threading.Event()
+    resume = threading.Event()
+
+    def progress(event):
+        started.set()
+        resume.wait(10)
+
+    async def run():
+        async with aio.AsyncEncryptor(max_jobs=1) as encryptor:
+            task = asyncio.ensure_future(encryptor.encrypt_file(
+                source, output, PASSWORD, ITERATIONS, progress=progress))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            semaphore = encryptor._limit()
+            # Поток пула еще работает: слот не освобожден
+            assert semaphore.locked()
+            resume.set()
+            while semaphore.locked():
+                await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    # Ядро увидело флаг отмены и удалило недописанный файл
+    assert not os.path.exists(output)
+
+
+def test_invalid_depth():
+    with pytest.raises(EncryptorError):
+        aio.AsyncEncryptor(depth=0)
@@ -0,0 +1,111 @@
+"""Архив: индекс, извлечение по одному файлу и повреждения"""
+import io
+import os
+
+import pytest
+
+from file_encryptor import archive, header
+from file_encryptor.errors import (EncryptorError, FormatError, SegmentError,
+                                   TruncatedError, WrongPasswordError)
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 16 * 1024
+
+
+@pytest.fixture
+def packed(make_file, tmp_path):
+    """Архив из трех файлов; возвращает (путь, {имя: данные})"""
+    contents = {"a.txt": b"alpha" * 100, "dir/b.bin": os.urandom(5 * SEGMENT + 3),
+                "dir/empty": b""}
+    files = [(make_file("src/" + name, data=data), name) for name, data in contents.items()]
+    path = str(tmp_path / "pack.fenc")
+    archive.create_archive(path, files, PASSWORD, ITERATIONS, segment_size=SEGMENT)
+    return path, contents
+
+
+def test_index_lists_members(packed):
+    path, contents = packed
+    with archive.open_archive(path, PASSWORD) as arc:
+        assert arc.names() == list(contents)
+        assert [member.size for member in arc.members] == [len(d) for d in contents.values()]
+
+
+def test_extract_one_member(packed):
+    path, contents = packed
+    with archive.open_archive(path, PASSWORD) as arc:
+        dst = io.BytesIO()
+        arc.extract_to("dir/b.bin", dst)
+    assert dst.getvalue() == contents["dir/b.bin"]
+
+
+def test_extract_all(packed, tmp_path):
+    path, contents = packed
+    with archive.open_archive(path, PASSWORD) as arc:
+        arc.extract_all(str(tmp_path / "out"))
+    for name, data in contents.items():
+        with open(tmp_path / "out" / name, 'rb') as f:
+            assert f.read() == data
+
+
+def test_unknown_member(packed):
+    path, _ = packed
+    with archive.open_archive(path, PASSWORD) as arc:
+        with pytest.raises(EncryptorError):
+            arc.get("missing")
+
+
+def test_wrong_password(packed):
+    path, _ = packed
+    with pytest.raises(WrongPasswordError):
+        archive.open_archive(path, "wrong password")
+
+
+def test_truncated_archive(packed):
+    path, _ = packed
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    with pytest.raises(FormatError):
+        archive.open_archive(path, PASSWORD)
+
+
+def test_tampered_member(packed):
+    path, _ = packed
+    with archive.open_archive(path, PASSWORD) as arc:
+        offset = arc.get("dir/b.bin").offset
+    with open(path, 'r+b') as f:
+        f.seek(offset + 100)
+        value = f.read(1)[0]
+        f.seek(offset + 100)
+        f.write(bytes([value ^ 1]))
+    with archive.open_archive(path, PASSWORD) as arc:
+        # Другие файлы читаются, испорченный - нет
+        arc.extract_to("a.txt", io.BytesIO())
+        # Ключ проверен индексом: ошибка первого сегмента - повреждение,
+        # а не неверный пароль
+        with pytest.raises(SegmentError) as info:
+            arc.extract_to("dir/b.bin", io.BytesIO())
+    assert info.value.index == 0
+
+
+@pytest.mark.parametrize("name", ["../evil", "/etc/passwd", "a/../../b"])
+def test_unsafe_names_rejected(make_file, tmp_path, name):
+    with pytest.raises(EncryptorError):
+        archive.create_archive(str(tmp_path / "bad.fenc"), [(make_file(), name)],
+                               PASSWORD, ITERATIONS)
+
+
+def test_duplicate_names_rejected(make_file, tmp_path):
+    source = make_file()
+    with pytest.raises(EncryptorError):
+        archive.create_archive(str(tmp_path / "bad.fenc"), [(source, "x"), (source, "x")],
+                               PASSWORD, ITERATIONS)
+
+
+def test_missing_trailer_is_truncated(packed):
+    path, _ = packed
+    with open(path, 'r+b') as f:
+        _, header_size = header.read_header(f)
+        f.truncate(header_size + 10)
+    with pytest.raises(TruncatedError):
+        archive.open_archive(path, PASSWORD)
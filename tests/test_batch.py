@@ -0,0 +1,90 @@
+"""Пакетная обработка: зеркальное дерево, ошибки файлов и отмена"""
+import os
+import threading
+
+import pytest
+
+from file_encryptor import batch, core
+from file_encryptor.errors import CancelledError
+
+from conftest import ITERATIONS, PASSWORD
+
+
+def make_tree(tmp_path, names=("a.txt", "sub/b.txt", "sub/deep/c.txt")):
+    root = tmp_path / "src"
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode() * 1000)
+    return str(root)
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_round_trip_mirrors_tree(tmp_path, use_processes):
+    root = make_tree(tmp_path)
+    encrypted, decrypted = str(tmp_path / "enc"), str(tmp_path / "dec")
+    calls = []
+    results = batch.run_batch(batch.collect_files([root]), PASSWORD,
+                              iterations=ITERATIONS, output_root=encrypted, jobs=2,
+                              use_processes=use_processes,
+                              progress=lambda done, total, result: calls.append((done, total)))
+    assert len(results) == 3 and all(result.ok for result in results)
+    total = sum(len(name) * 1000 for name in ("a.txt", "sub/b.txt", "sub/deep/c.txt"))
+    assert calls[-1] == (total, total)
+
+    results = batch.run_batch(batch.collect_files([encrypted]), PASSWORD, encrypt=False,
+                              iterations=ITERATIONS, output_root=decrypted, jobs=2)
+    assert all(result.ok for result in results)
+    with open(os.path.join(decrypted, "sub", "deep", "c.txt"), 'rb') as f:
+        assert f.read() == b"sub/deep/c.txt" * 1000
+
+
+def test_unexpected_error_is_recorded(tmp_path, monkeypatch):
+    root = make_tree(tmp_path)
+    process_file = core.process_file
+
+    def failing(input_path, *args, **kwargs):
+        if input_path.endswith("b.txt"):
+            raise ValueError("неожиданная ошибка")
+        return process_file(input_path, *args, **kwargs)
+
+    monkeypatch.setattr(core, "process_file", failing)
+    results = batch.run_batch(batch.collect_files([root]), PASSWORD,
+                              iterations=ITERATIONS, output_root=str(tmp_path / "enc"))
+    failed = [result for result in results if not result.ok]
+    assert len(results) == 3
+    assert [os.path.basename(result.path) for result in failed] == ["b.txt"]
+    assert "неожиданная ошибка" in failed[0].error
+
+
+def test_wrong_password_is_per_file(tmp_path):
+    root = make_tree(tmp_path)
+    encrypted = str(tmp_path / "enc")
+    # Формат seg: неверный пароль обнаруживается всегда, а не по дополнению
+    batch.run_batch(batch.collect_files([root]), PASSWORD, iterations=ITERATIONS,
+                    fmt=core.FORMAT_SEGMENTED, output_root=encrypted)
+    results = batch.run_batch(batch.collect_files([encrypted]), "wrong password",
+                              encrypt=False, iterations=ITERATIONS,
+                              output_root=str(tmp_path / "dec"))
+    assert len(results) == 3 and not any(result.ok for result in results)
+
+
+def test_cancel_propagates(tmp_path):
+    root = make_tree(tmp_path)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        batch.run_batch(batch.collect_files([root]), PASSWORD, iterations=ITERATIONS,
+                        output_root=str(tmp_path / "enc"), cancel=cancel)
+
+
+def test_keyboard_interrupt_propagates(tmp_path, monkeypatch):
+    root = make_tree(tmp_path)
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(core, "process_file", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(batch.collect_files([root]), PASSWORD, iterations=ITERATIONS,
+                        output_root=str(tmp_path / "enc"), jobs=1)
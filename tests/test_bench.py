@@ -0,0 +1,38 @@
+"""Бенчмарк: замер варианта параметров и сетка вариантов"""
+import os
+
+import pytest
+
+from file_encryptor import bench, core, mmapio
+
+SIZE = 100000
+
+
+@pytest.mark.parametrize("fmt", core.FORMATS)
+def test_run_case(tmp_path, fmt):
+    input_path = str(tmp_path / "input")
+    bench.make_input(input_path, SIZE)
+    assert os.path.getsize(input_path) == SIZE
+    result = bench.run_case(input_path, str(tmp_path), SIZE, fmt, 16 * 1024, 2, 1000)
+    assert result["format"] == fmt
+    assert result["output_size"] > SIZE
+    assert result["encrypt_s"] > 0 and result["decrypt_s"] > 0
+    assert set(result["stages"]) == {"kdf_s", "cipher_s", "io_copy_s"}
+    # Временные файлы удалены
+    assert os.listdir(tmp_path) == ["input"]
+
+
+def test_run_benchmark_grid(tmp_path):
+    seen = []
+    report = bench.run_benchmark([SIZE], formats=(core.FORMAT_SEGMENTED, core.FORMAT_LEGACY),
+                                 workers=(1, 2), iterations=(1000,), work_dir=str(tmp_path),
+                                 progress=seen.append,
+                                 io_modes=(mmapio.IO_BUFFERED, mmapio.IO_MMAP))
+    cases = [(r["format"], r["workers"], r["io_mode"]) for r in report["results"]]
+    # Потоки и mmap перебираются только для формата seg
+    assert sorted(cases) == sorted(
+        [(core.FORMAT_SEGMENTED, w, m) for w in (1, 2)
+         for m in (mmapio.IO_BUFFERED, mmapio.IO_MMAP)]
+        + [(core.FORMAT_LEGACY, 1, mmapio.IO_BUFFERED)])
+    assert seen == report["results"]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,94 @@
+"""Сжатие перед шифрованием: алгоритмы, пропуск сжатых данных и временные файлы"""
+import io
+import os
+import tempfile
+
+import pytest
+
+from file_encryptor import compress, core, header
+from file_encryptor.errors import EncryptorError, TruncatedError
+
+from conftest import DATA_DIR, PASSWORD, decrypt_bytes, encrypt_bytes
+
+TEXT = b"".join(b"line %d: the quick brown fox\n" % i for i in range(20000))
+SEGMENT = 16 * 1024
+
+
+class Unseekable:
+    """Поток без перемотки, как stdin"""
+
+    def __init__(self, data):
+        self._src = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._src.read(size)
+
+    def seekable(self):
+        return False
+
+
+@pytest.mark.parametrize("name", compress.ALGORITHMS)
+def test_round_trip(name):
+    encrypted = encrypt_bytes(TEXT, compression=name, chunk_size=SEGMENT)
+    fields, _ = header.read_header(io.BytesIO(encrypted))
+    # Сжатый вывод шифруется кадрами: его длина заранее неизвестна
+    assert fields["type"] == header.TYPE_STREAM
+    assert fields["compression"] == name
+    assert fields["plain_length"] == len(TEXT)
+    assert len(encrypted) < len(TEXT) // 2
+    assert decrypt_bytes(encrypted) == TEXT
+
+
+def test_no_temporary_files(make_file, tmp_path, monkeypatch):
+    temp_dir = tmp_path / "tmp"
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp_dir))
+
+    def forbidden(*args, **kwargs):
+        raise AssertionError("открытый текст во временном файле")
+
+    for name in ("SpooledTemporaryFile", "TemporaryFile", "NamedTemporaryFile"):
+        monkeypatch.setattr(tempfile, name, forbidden)
+    source = make_file(data=TEXT)
+    encrypted = str(tmp_path / "a.enc")
+    core.encrypt_file(source, encrypted, PASSWORD, 1000,
+                      compression=compress.COMPRESSION_ZLIB)
+    assert list(temp_dir.iterdir()) == []
+    assert sorted(os.listdir(tmp_path)) == ["a.enc", "plain.bin", "tmp"]
+
+
+def test_unseekable_input_is_compressed():
+    dst = io.BytesIO()
+    core.encrypt_stream(Unseekable(TEXT), dst, PASSWORD, 1000, fmt=core.FORMAT_STREAM,
+                        compression=compress.COMPRESSION_ZLIB)
+    fields, _ = header.read_header(io.BytesIO(dst.getvalue()))
+    assert fields["compression"] == compress.COMPRESSION_ZLIB
+    assert "plain_length" not in fields
+    assert decrypt_bytes(dst.getvalue()) == TEXT
+
+
+def test_truncated():
+    encrypted = encrypt_bytes(TEXT, compression=compress.COMPRESSION_ZLIB, chunk_size=SEGMENT)
+    with pytest.raises(TruncatedError):
+        decrypt_bytes(encrypted[:-100])
+
+
+def test_incompressible_data_is_stored():
+    data = os.urandom(200000)
+    encrypted = encrypt_bytes(data, compression=compress.COMPRESSION_ZLIB)
+    fields, _ = header.read_header(io.BytesIO(encrypted))
+    assert "compression" not in fields
+    assert decrypt_bytes(encrypted) == data
+
+
+def test_old_segmented_file():
+    # Сжатые данные в сегментах seg, как писали ранние версии
+    with open(os.path.join(DATA_DIR, "seg_zlib.enc"), 'rb') as f:
+        encrypted = f.read()
+    assert decrypt_bytes(encrypted) == b"".join(b"compressed line %d\n" % n
+                                                for n in range(5000))
+
+
+def test_only_segmented_and_stream_formats():
+    with pytest.raises(EncryptorError):
+        encrypt_bytes(TEXT, fmt=core.FORMAT_CBC, compression=compress.COMPRESSION_ZLIB)
@@ -0,0 +1,147 @@
+"""Форматы seg, cbc и aes: заголовок FENC, шифрование, дешифрование и ошибки"""
+import io
+import os
+import stat
+import threading
+
+import pytest
+
+import file_encryptor
+from file_encryptor import core, header, keys
+from file_encryptor.errors import (CancelledError, FormatError, SegmentError,
+                                   WrongPasswordError)
+
+from conftest import (DATA_DIR, ITERATIONS, PASSWORD, decrypt_bytes, encrypt_bytes,
+                      fenc_v1_plaintext)
+
+SEGMENT = 16 * 1024
+
+
+@pytest.mark.parametrize("fmt", core.FORMATS)
+@pytest.mark.parametrize("size", [0, 1, SEGMENT, 5 * SEGMENT + 7])
+def test_round_trip(fmt, size):
+    data = os.urandom(size)
+    encrypted = encrypt_bytes(data, fmt=fmt, chunk_size=SEGMENT)
+    assert decrypt_bytes(encrypted) == data
+
+
+@pytest.mark.parametrize("fmt,cipher", [(core.FORMAT_SEGMENTED, "aes-256-gcm"),
+                                        (core.FORMAT_CBC, "aes-256-cbc")])
+def test_header_describes_file(fmt, cipher):
+    encrypted = encrypt_bytes(b"x" * 1000, fmt=fmt, chunk_size=SEGMENT)
+    fields, size = header.read_header(io.BytesIO(encrypted))
+    assert fields["cipher"] == cipher
+    assert fields["length"] == 1000
+    assert fields["segment_size"] == SEGMENT
+    # Запас под новые слоты ключей (смена пароля без переписывания данных)
+    assert size > header.HEADER_RESERVE
+    slot, = header.key_slots(fields)
+    assert header.kdf_params(slot)["iterations"] == ITERATIONS
+
+
+@pytest.mark.parametrize("fmt", [core.FORMAT_SEGMENTED, core.FORMAT_LEGACY])
+def test_file_info(make_file, tmp_path, fmt):
+    source = make_file(size=1000)
+    encrypted = str(tmp_path / "a.enc")
+    core.encrypt_file(source, encrypted, PASSWORD, ITERATIONS, fmt=fmt)
+    info = core.read_file_info(encrypted)
+    assert info["format"] == fmt
+    if fmt == core.FORMAT_SEGMENTED:
+        assert info["length"] == 1000
+        assert info["kdf"]["iterations"] == ITERATIONS
+
+
+# Для aes неверный пароль виден лишь по дополнению и изредка его проходит;
+# этот случай проверяется на фиксированном файле в test_legacy.py
+@pytest.mark.parametrize("fmt", [core.FORMAT_SEGMENTED, core.FORMAT_CBC])
+def test_wrong_password(fmt):
+    encrypted = encrypt_bytes(os.urandom(3 * SEGMENT), fmt=fmt, chunk_size=SEGMENT)
+    dst = io.BytesIO()
+    with pytest.raises(WrongPasswordError):
+        core.decrypt_stream(io.BytesIO(encrypted), dst, "wrong password", ITERATIONS)
+    # Проверочное значение отклоняет пароль до чтения данных
+    assert dst.getvalue() == b""
+
+
+@pytest.mark.parametrize("fmt", [core.FORMAT_SEGMENTED, core.FORMAT_CBC])
+@pytest.mark.parametrize("damage", ["truncate", "extend"])
+def test_length_checked_before_kdf(monkeypatch, fmt, damage):
+    encrypted = encrypt_bytes(os.urandom(3 * SEGMENT), fmt=fmt, chunk_size=SEGMENT)
+    encrypted = encrypted[:-SEGMENT] if damage == "truncate" else encrypted + b"\0"
+
+    def no_kdf(*args, **kwargs):
+        raise AssertionError("KDF запущен для поврежденного файла")
+
+    monkeypatch.setattr(keys, "derive_key_params", no_kdf)
+    with pytest.raises(FormatError):
+        decrypt_bytes(encrypted)
+
+
+def test_tampered_segment():
+    encrypted = bytearray(encrypt_bytes(os.urandom(3 * SEGMENT), chunk_size=SEGMENT))
+    encrypted[-SEGMENT] ^= 1
+    with pytest.raises(SegmentError) as info:
+        decrypt_bytes(bytes(encrypted))
+    assert info.value.index == 2
+
+
+def test_old_header_without_check(tmp_path):
+    with open(os.path.join(DATA_DIR, "fenc_v1.enc"), 'rb') as f:
+        encrypted = f.read()
+    assert decrypt_bytes(encrypted) == fenc_v1_plaintext()
+    # Без проверочного значения ошибка первого сегмента толкуется как неверный пароль
+    fields, size = header.read_header(io.BytesIO(encrypted))
+    assert "check" not in fields and "slots" not in fields
+    body = bytearray(encrypted[size:])
+    body[100] ^= 1
+    with pytest.raises(WrongPasswordError):
+        decrypt_bytes(encrypted[:size] + bytes(body))
+
+
+def test_not_encrypted():
+    with pytest.raises(FormatError):
+        decrypt_bytes(b"plain text, not a container")
+
+
+def test_in_place_keeps_backup(make_file):
+    source = make_file(size=50000)
+    with open(source, 'rb') as f:
+        data = f.read()
+    backup = core.process_file_in_place(source, PASSWORD, True, ITERATIONS)
+    with open(backup, 'rb') as f:
+        assert f.read() == data
+    core.process_file_in_place(source, PASSWORD, False, backup=False)
+    with open(source, 'rb') as f:
+        assert f.read() == data
+
+
+def test_in_place_keeps_mode(make_file):
+    source = make_file()
+    os.chmod(source, 0o600)
+    core.process_file_in_place(source, PASSWORD, True, ITERATIONS, backup=False)
+    assert stat.S_IMODE(os.stat(source).st_mode) == 0o600
+    assert os.listdir(os.path.dirname(source)) == ["plain.bin"]
+
+
+def test_in_place_failure_keeps_original(make_file):
+    source = make_file()
+    core.process_file_in_place(source, PASSWORD, True, ITERATIONS, backup=False)
+    with open(source, 'rb') as f:
+        encrypted = f.read()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        core.process_file_in_place(source, PASSWORD, False, cancel=cancel)
+    with pytest.raises(WrongPasswordError):
+        core.process_file_in_place(source, "wrong", False)
+    with open(source, 'rb') as f:
+        assert f.read() == encrypted
+    # Ни временных файлов, ни резервной копии
+    assert os.listdir(os.path.dirname(source)) == ["plain.bin"]
+
+
+def test_public_api():
+    exported = {name for name in vars(file_encryptor)
+                if not name.startswith("_") and not isinstance(
+                    getattr(file_encryptor, name), type(file_encryptor))}
+    assert set(file_encryptor.__all__) == exported
@@ -0,0 +1,87 @@
+"""Хранилище с дедупликацией: снимки, повторные фрагменты и повреждения"""
+import os
+
+import pytest
+
+from file_encryptor import dedup
+from file_encryptor.errors import EncryptorError, FormatError, WrongPasswordError
+
+from conftest import ITERATIONS, PASSWORD
+
+DATA = os.urandom(4 * 1024 * 1024)
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "store")
+    dedup.init_store(path, PASSWORD, ITERATIONS)
+    return dedup.open_store(path, PASSWORD)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_backup_and_restore(store, make_file, tmp_path):
+    files = [(make_file("a.bin", data=DATA), "a.bin"),
+             (make_file("docs/b.txt", data=b"hello"), "docs/b.txt")]
+    result = store.backup(files, "first", workers=2)
+    assert result.files == 2 and result.new_chunks == result.chunks
+    assert store.snapshots() == ["first"]
+
+    store.restore("first", str(tmp_path / "out"))
+    assert read(tmp_path / "out" / "a.bin") == DATA
+    assert read(tmp_path / "out" / "docs" / "b.txt") == b"hello"
+
+
+def test_insertion_reuses_chunks(store, make_file, tmp_path):
+    store.backup([(make_file("a.bin", data=DATA), "a.bin")], "first")
+    # Вставка в начало не сдвигает границы остальных фрагментов
+    changed = make_file("a2.bin", data=b"inserted" + DATA)
+    result = store.backup([(changed, "a.bin")], "second")
+    assert result.new_chunks <= 2 < result.chunks
+    store.restore("second", str(tmp_path / "out"))
+    assert read(tmp_path / "out" / "a.bin") == b"inserted" + DATA
+
+
+def test_wrong_password(store):
+    with pytest.raises(WrongPasswordError):
+        dedup.open_store(store.path, "wrong password")
+
+
+def test_existing_snapshot_and_bad_names(store, make_file):
+    files = [(make_file(data=b"x"), "x")]
+    store.backup(files, "daily")
+    with pytest.raises(EncryptorError):
+        store.backup(files, "daily")
+    with pytest.raises(EncryptorError):
+        store.backup(files, "../escape")
+
+
+def test_tampered_chunk(store, make_file, tmp_path):
+    store.backup([(make_file(data=DATA), "a.bin")], "first")
+    chunk_id, _ = store.manifest("first")["files"][0]["chunks"][1]
+    with open(store.chunk_path(chunk_id), 'r+b') as f:
+        f.seek(20)
+        value = f.read(1)[0]
+        f.seek(20)
+        f.write(bytes([value ^ 1]))
+    with pytest.raises(FormatError):
+        store.restore("first", str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "out" / "a.bin")
+
+
+def test_truncated_chunk_is_rewritten(store, make_file, tmp_path):
+    source = make_file(data=DATA)
+    store.backup([(source, "a.bin")], "first")
+    chunk_id, _ = store.manifest("first")["files"][0]["chunks"][1]
+    path = store.chunk_path(chunk_id)
+    # Фрагмент обрезан (сбой без сброса на диск): повторное копирование
+    # не должно счесть его готовым
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    result = store.backup([(source, "a.bin")], "second")
+    assert result.new_chunks == 1
+    store.restore("second", str(tmp_path / "out"))
+    assert read(tmp_path / "out" / "a.bin") == DATA
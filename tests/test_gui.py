@@ -0,0 +1,104 @@
+"""Интерфейс Tk: рабочие потоки не трогают виджеты (без запуска окна)"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+import main  # noqa: E402
+from file_encryptor import kdf  # noqa: E402
+
+
+class FakeWindow:
+    """window.after записывает вызовы вместо цикла Tk"""
+
+    def __init__(self):
+        self.calls = []
+
+    def after(self, ms, func, *args):
+        self.calls.append((threading.current_thread(), func, args))
+
+
+class TkVariable:
+    """Переменная, чтение которой из рабочего потока - ошибка"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        assert threading.current_thread() is threading.main_thread(), \
+            "переменная Tk прочитана вне потока Tk"
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+def make_app():
+    """Приложение без окна: только состояние, нужное проверяемым методам"""
+    app = main.FileEncryptorApp.__new__(main.FileEncryptorApp)
+    app.window = FakeWindow()
+    app.log = []
+    app.log_message = lambda message, level="INFO": app.log.append((level, message))
+    app.update_progress = lambda *args: None
+    app.update_iterations_label = lambda *args: None
+    return app
+
+
+def test_kdf_rate_is_measured_off_the_tk_thread(monkeypatch):
+    measured_in = []
+
+    def rate():
+        measured_in.append(threading.current_thread())
+        return 200000.0
+
+    monkeypatch.setattr(kdf, "pbkdf2_rate", rate)
+    app = make_app()
+    app.kdf_rate, app.kdf_measuring, app.after_kdf_rate = None, False, []
+    app.iterations_var = TkVariable(100000)
+
+    # Калибровка до замера ждет его результата, повторный замер не запускается
+    app.calibrate_iterations()
+    app.measure_kdf_rate()
+    for _ in range(100):
+        if app.window.calls:
+            break
+        time.sleep(0.01)
+
+    assert len(measured_in) == 1 and measured_in[0] is not threading.main_thread()
+    (thread, func, args), = app.window.calls
+    assert thread is not threading.main_thread()
+    func(*args)
+    assert app.kdf_rate == 200000.0
+    assert app.iterations_var.value == kdf.calibrate_iterations(kdf.DEFAULT_TARGET_MS, 200000.0)
+
+
+@pytest.mark.parametrize("replace", [False, True])
+def test_worker_uses_only_options(make_file, replace):
+    source = make_file("report.txt", size=5000)
+    app = make_app()
+    app.ui_calls = []
+    app.call_in_ui = lambda func, *args: app.ui_calls.append(func)
+    app.on_progress_event = lambda event: None
+    app.cancel_event = threading.Event()
+    app.action_button = app.cancel_button = type("Button", (), {"config": None})()
+    app.is_processing = True
+    app.input_entry = TkVariable(source)
+    app.password_entry = TkVariable("password1")
+    app.mode_var = TkVariable("encrypt")
+    app.replace_mode = TkVariable(replace)
+    app.iterations_var = TkVariable(1000)
+    app.keep_backup = TkVariable(False)
+    app.compression_var = TkVariable(main.NO_COMPRESSION)
+    app.resumable = TkVariable(False)
+
+    options = app.read_options()
+    worker = threading.Thread(target=app.process_in_thread, args=(options,))
+    worker.start()
+    worker.join()
+
+    assert not [entry for entry in app.log if entry[0] == "ERROR"], app.log
+    assert app.show_result in app.ui_calls
+    encrypted = source if replace else main.core.default_output_path(source, True)
+    assert main.core.read_file_info(encrypted)["kdf"]["iterations"] == 1000
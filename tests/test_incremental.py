@@ -0,0 +1,142 @@
+"""Режим update: перезапись только изменившихся сегментов и журнал повтора"""
+import os
+
+import pytest
+
+from file_encryptor import core, fsutil, incremental
+from file_encryptor.errors import EncryptorError, FormatError
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 16 * 1024
+
+
+def update(source, target, **options):
+    return incremental.update_file(source, target, PASSWORD, ITERATIONS,
+                                   segment_size=SEGMENT, workers=2, **options)
+
+
+def decrypted(path, tmp_path):
+    output = str(tmp_path / "out.bin")
+    core.decrypt_file(path, output, PASSWORD)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def synced(make_file, tmp_path):
+    """Исходный файл и его зашифрованная копия; возвращает (источник, копия, данные)"""
+    data = bytearray(os.urandom(10 * SEGMENT + 100))
+    source = make_file(data=bytes(data))
+    target = str(tmp_path / "copy.fenc")
+    result = update(source, target)
+    assert result.changed == result.total == 11
+    return source, target, data
+
+
+def rewrite(source, data):
+    with open(source, 'wb') as f:
+        f.write(bytes(data))
+
+
+def test_only_changed_segments(synced, tmp_path):
+    source, target, data = synced
+    data[3 * SEGMENT + 5] ^= 1
+    data[7 * SEGMENT] ^= 1
+    rewrite(source, data)
+    result = update(source, target)
+    assert (result.changed, result.total) == (2, 11)
+    assert decrypted(target, tmp_path) == data
+    assert update(source, target).changed == 0
+
+
+@pytest.mark.parametrize("delta", [3 * SEGMENT + 1, -(4 * SEGMENT + 50)])
+def test_grow_and_shrink(synced, tmp_path, delta):
+    source, target, data = synced
+    data = data + os.urandom(delta) if delta > 0 else data[:delta]
+    rewrite(source, data)
+    update(source, target)
+    assert decrypted(target, tmp_path) == data
+
+
+def fail_index(monkeypatch):
+    def broken(*args):
+        raise OSError("сбой при записи индекса")
+    monkeypatch.setattr(incremental, "write_index", broken)
+
+
+def test_atomic_by_default_keeps_old_version(synced, tmp_path, monkeypatch):
+    source, target, data = synced
+    old = bytes(data)
+    rewrite(source, bytes(data) + os.urandom(2 * SEGMENT))
+    fail_index(monkeypatch)
+    with pytest.raises(OSError):
+        update(source, target)
+    monkeypatch.undo()
+    # Недописанный журнал удален, файл не тронут
+    assert sorted(os.listdir(os.path.dirname(target))) == ["copy.fenc", "plain.bin"]
+    assert decrypted(target, tmp_path) == old
+
+
+def test_journal_holds_only_changes(synced, tmp_path, monkeypatch):
+    source, target, data = synced
+    inode = os.stat(target).st_ino
+    data[5 * SEGMENT] ^= 1
+    data += os.urandom(SEGMENT)
+    rewrite(source, data)
+
+    def crash(redo, path):
+        raise OSError("сбой после записи журнала")
+
+    monkeypatch.setattr(fsutil, "_replay", crash)
+    with pytest.raises(OSError):
+        update(source, target)
+    monkeypatch.undo()
+    # В журнале измененный, прежний последний и новые сегменты и индекс,
+    # а не копия файла
+    redo = fsutil.redo_path(target)
+    assert os.path.getsize(redo) < 5 * SEGMENT
+    # Следующее открытие доигрывает журнал на месте
+    assert decrypted(target, tmp_path) == data
+    assert not os.path.exists(redo)
+    assert os.stat(target).st_ino == inode
+    assert update(source, target).changed == 0
+
+
+def test_in_place_failure_is_detected(synced, tmp_path, monkeypatch):
+    source, target, data = synced
+    data[0] ^= 1
+    rewrite(source, data)
+    fail_index(monkeypatch)
+    with pytest.raises(OSError):
+        update(source, target, atomic=False)
+    monkeypatch.undo()
+    with pytest.raises(FormatError):
+        decrypted(target, tmp_path)
+
+
+def test_rolled_back_segment_is_detected(synced, tmp_path):
+    source, target, data = synced
+    with open(target, 'rb') as f:
+        old = f.read()
+    data[2 * SEGMENT] ^= 1
+    rewrite(source, data)
+    update(source, target)
+    with open(target, 'rb') as f:
+        new = bytearray(f.read())
+    # Вернуть старую версию одного сегмента при новом индексе
+    changed = [i for i in range(len(old)) if old[i] != new[i]]
+    start = changed[0]
+    new[start:start + SEGMENT] = old[start:start + SEGMENT]
+    with open(target, 'wb') as f:
+        f.write(new)
+    with pytest.raises(FormatError):
+        decrypted(target, tmp_path)
+
+
+def test_plain_target_rejected(make_file, tmp_path):
+    source = make_file()
+    target = str(tmp_path / "plain.enc")
+    core.encrypt_file(source, target, PASSWORD, ITERATIONS)
+    with pytest.raises(EncryptorError):
+        update(source, target)
@@ -0,0 +1,76 @@
+"""Журнал операций: кольцевой буфер, забор записей и файл JSON-lines"""
+import json
+import queue
+import threading
+
+from file_encryptor import journal
+
+
+def test_ring_buffer():
+    log = journal.Journal(capacity=3)
+    for n in range(5):
+        log.add(f"message {n}")
+    assert [entry.message for entry in log.entries()] == ["message 2", "message 3", "message 4"]
+
+
+def test_take_pending():
+    log = journal.Journal()
+    log.add("first")
+    log.add("second", "ERROR")
+    pending = log.take_pending()
+    assert [(entry.level, entry.message) for entry in pending] == [("INFO", "first"),
+                                                                   ("ERROR", "second")]
+    assert log.take_pending() == []
+    log.add("third")
+    assert [entry.message for entry in log.take_pending()] == ["third"]
+    assert len(log.entries()) == 3
+
+    log.clear()
+    assert log.entries() == [] and log.take_pending() == []
+
+
+def test_threads():
+    log = journal.Journal(capacity=10000)
+    threads = [threading.Thread(target=lambda: [log.add("x") for _ in range(500)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(log.take_pending()) == 2000
+
+
+def test_file(tmp_path):
+    path = str(tmp_path / "journal.log")
+    log = journal.Journal()
+    log.open_file(path)
+    log.add("привет")
+    log.add("failed", "ERROR")
+    log.close_file()
+    log.add("not written")
+    with open(path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [(line["level"], line["message"]) for line in lines] == [("INFO", "привет"),
+                                                                   ("ERROR", "failed")]
+
+
+def test_file_rotation(tmp_path):
+    path = tmp_path / "journal.log"
+    log = journal.Journal()
+    log.open_file(str(path), max_bytes=1000, backups=2)
+    for n in range(100):
+        log.add(f"message {n}")
+    log.close_file()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["journal.log", "journal.log.1",
+                                                          "journal.log.2"]
+    assert path.stat().st_size <= 1000
+
+
+def test_full_queue_drops():
+    log = journal.Journal()
+    # Очередь без фонового потока: вторая запись в файл не помещается
+    log._queue = queue.Queue(1)
+    log.add("kept")
+    log.add("dropped")
+    assert log.dropped == 1
+    assert len(log.entries()) == 2
@@ -0,0 +1,61 @@
+"""Стоимость KDF: калибровка PBKDF2, параметры scrypt и их проверка"""
+import pytest
+
+from file_encryptor import cli, core, kdf
+from file_encryptor.errors import FormatError
+
+from conftest import PASSWORD
+
+
+def test_calibrate_iterations():
+    assert kdf.calibrate_iterations(250, rate=400000.0) == 100000
+    assert kdf.calibrate_iterations(250, rate=1.0) == kdf.MIN_ITERATIONS
+    assert kdf.calibrate_iterations(10 ** 6, rate=10.0 ** 9) == kdf.MAX_CALIBRATED_ITERATIONS
+
+
+def test_calibrate_scrypt_respects_memory():
+    params = kdf.calibrate_scrypt(target_ms=10 ** 6, max_memory=8 * 1024 * 1024)
+    n = params["n"]
+    assert n & (n - 1) == 0
+    assert kdf.scrypt_memory(n, params["r"], params["p"]) <= 8 * 1024 * 1024
+    kdf.check_params(params)
+
+
+@pytest.mark.parametrize("params", [
+    {"name": "pbkdf2-sha256", "iterations": 0},
+    {"name": "pbkdf2-sha256", "iterations": "1000"},
+    {"name": "scrypt", "n": 1000, "r": 8, "p": 1},
+    {"name": "scrypt", "n": 2 ** 30, "r": 8, "p": 1},
+    {"name": "argon2"},
+    None,
+])
+def test_bad_params_rejected(params):
+    with pytest.raises(FormatError):
+        kdf.check_params(params)
+
+
+def test_scrypt_and_pbkdf2_keys_differ():
+    salt = b"s" * kdf.SALT_SIZE
+    scrypt = kdf.derive_key_params(PASSWORD, salt, kdf.scrypt_params(1024))
+    pbkdf2 = kdf.derive_key_params(PASSWORD, salt, kdf.pbkdf2_params(1000))
+    assert len(scrypt) == len(pbkdf2) == kdf.KEY_SIZE and scrypt != pbkdf2
+
+
+@pytest.mark.parametrize("fmt", [core.FORMAT_SEGMENTED, core.FORMAT_CBC, core.FORMAT_STREAM])
+def test_scrypt_round_trip(make_file, tmp_path, monkeypatch, fmt):
+    monkeypatch.setenv(cli.PASSWORD_ENV, PASSWORD)
+    source = make_file(size=5000)
+    encrypted, decrypted = str(tmp_path / "a.enc"), str(tmp_path / "a.out")
+    assert cli.main(["encrypt", source, "-o", encrypted, "--format", fmt,
+                     "--kdf", "scrypt", "--scrypt-n", "1024"]) == 0
+    assert core.read_file_info(encrypted)["kdf"]["name"] == "scrypt"
+    assert cli.main(["decrypt", encrypted, "-o", decrypted]) == 0
+    with open(source, 'rb') as a, open(decrypted, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_scrypt_rejected_for_legacy_format(make_file, tmp_path, monkeypatch):
+    monkeypatch.setenv(cli.PASSWORD_ENV, PASSWORD)
+    assert cli.main(["encrypt", make_file(), "-o", str(tmp_path / "a.enc"),
+                     "--format", core.FORMAT_LEGACY, "--kdf", "scrypt",
+                     "--scrypt-n", "1024"]) == 1
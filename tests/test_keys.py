@@ -0,0 +1,69 @@
+"""Сессия ключей: один KDF на соль, кэш и затирание"""
+import pytest
+
+from file_encryptor import core, keys
+from file_encryptor.errors import EncryptorError, FormatError
+from file_encryptor.kdf import pbkdf2_params
+
+from conftest import ITERATIONS, PASSWORD
+
+
+@pytest.fixture
+def kdf_calls(monkeypatch):
+    """Считать вызовы KDF внутри сессии"""
+    calls = []
+    derive = keys.derive_key_params
+
+    def counting(password, salt, params):
+        calls.append(bytes(salt))
+        return derive(password, salt, params)
+
+    monkeypatch.setattr(keys, "derive_key_params", counting)
+    return calls
+
+
+def test_one_kdf_per_salt(kdf_calls, make_file, tmp_path):
+    sources = [make_file(f"f{n}.bin", 1000 + n) for n in range(5)]
+    with keys.KeySession(PASSWORD, ITERATIONS) as session:
+        for source in sources:
+            core.encrypt_file(source, source + ".enc", PASSWORD, ITERATIONS,
+                              fmt=core.FORMAT_SEGMENTED, session=session)
+        assert len(kdf_calls) == 1
+        for source in sources:
+            core.decrypt_file(source + ".enc", source + ".out", PASSWORD, ITERATIONS,
+                              session=session)
+            with open(source, 'rb') as a, open(source + ".out", 'rb') as b:
+                assert a.read() == b.read()
+    # Соль мастер-ключа общая: дешифрование тоже не запускает KDF
+    assert len(kdf_calls) == 1
+
+
+def test_cache_evicts_and_wipes_old_keys():
+    session = keys.KeySession(PASSWORD, ITERATIONS, cache_size=2)
+    params = pbkdf2_params(ITERATIONS)
+    first = session.derive(b"1" * 16, params)
+    cached = session._cache[(b"1" * 16, keys.params_key(params))]
+    session.derive(b"2" * 16, params)
+    session.derive(b"3" * 16, params)
+    assert len(session._cache) == 2
+    assert cached == bytearray(len(first))
+
+
+def test_close_wipes_cache():
+    session = keys.KeySession(PASSWORD, ITERATIONS)
+    session.master_key()
+    cached = list(session._cache.values())
+    session.close()
+    assert all(key == bytearray(len(key)) for key in cached)
+    with pytest.raises(EncryptorError):
+        session.master_key()
+
+
+def test_failed_kdf_leaves_no_pending_lock():
+    session = keys.KeySession(PASSWORD, ITERATIONS)
+    with pytest.raises(FormatError):
+        session.derive(b"s" * 16, {"name": "unknown"})
+    assert session._pending == {}
+    # Следующий вызов с той же солью работает
+    assert len(session.derive(b"s" * 16, pbkdf2_params(ITERATIONS))) == 32
+    assert session._pending == {}
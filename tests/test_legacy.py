@@ -0,0 +1,58 @@
+"""Формат AES!: потоковое шифрование блоками и совместимость с версией 2.0"""
+import hashlib
+import os
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+from file_encryptor import core
+
+from conftest import (DATA_DIR, ITERATIONS, PASSWORD, baseline_plaintext,
+                      decrypt_bytes, encrypt_bytes)
+
+BASELINE = os.path.join(DATA_DIR, "baseline_aes.enc")
+
+
+# Несколько блоков чтения даже на малых данных
+SMALL_CHUNK = 64
+
+
+def whole_file_decrypt(data, password):
+    """Дешифрование целиком в памяти, как в версии 2.0"""
+    assert data[:4] == b'AES!'
+    salt, iv = data[4:20], data[20:36]
+    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, ITERATIONS, dklen=32)
+    return unpad(AES.new(key, AES.MODE_CBC, iv).decrypt(data[36:]), AES.block_size)
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 64, 65, 1000])
+def test_round_trip(size):
+    data = os.urandom(size)
+    encrypted = encrypt_bytes(data, fmt=core.FORMAT_LEGACY, chunk_size=SMALL_CHUNK)
+    assert decrypt_bytes(encrypted, chunk_size=SMALL_CHUNK) == data
+    # Потоковый вывод читается прежним дешифрованием целиком
+    assert whole_file_decrypt(encrypted, PASSWORD) == data
+
+
+def test_baseline_file(tmp_path):
+    output = str(tmp_path / "a.out")
+    core.decrypt_file(BASELINE, output, PASSWORD, ITERATIONS)
+    with open(output, 'rb') as f:
+        assert f.read() == baseline_plaintext()
+
+
+@pytest.mark.parametrize("damage,error", [("password", core.WrongPasswordError),
+                                          ("truncate", core.FormatError)])
+def test_failure_removes_output(tmp_path, damage, error):
+    source, password = BASELINE, PASSWORD
+    if damage == "password":
+        password = "wrong"
+    else:
+        source = str(tmp_path / "cut.enc")
+        with open(BASELINE, 'rb') as src, open(source, 'wb') as dst:
+            dst.write(src.read()[:-5])
+    output = str(tmp_path / "a.out")
+    with pytest.raises(error):
+        core.decrypt_file(source, output, password, ITERATIONS)
+    assert not os.path.exists(output)
@@ -0,0 +1,80 @@
+"""Метрики: стадии и счетчики операций, выгрузка и профилирование"""
+import json
+import os
+import pstats
+
+import pytest
+
+from file_encryptor import metrics
+from file_encryptor.errors import TruncatedError, WrongPasswordError
+
+from conftest import decrypt_bytes, encrypt_bytes
+
+
+@pytest.fixture
+def active():
+    """Включенные на время теста метрики"""
+    yield metrics.enable()
+    metrics.disable()
+
+
+def test_disabled_by_default():
+    assert metrics.current() is None
+    assert metrics.timed("cipher") is metrics.operation("encrypt")
+
+
+def test_operations(active):
+    data = os.urandom(100000)
+    encrypted = encrypt_bytes(data)
+    assert decrypt_bytes(encrypted) == data
+    stages = active.snapshot()["stages"]
+    # Операция учитывает входные байты, а не выход
+    assert stages["encrypt"]["bytes"] == len(data)
+    assert stages["decrypt"]["bytes"] == len(encrypted)
+    assert stages["encrypt"]["calls"] == stages["decrypt"]["calls"] == 1
+    assert stages["cipher"]["bytes"] >= len(data)
+    assert {"kdf", "read", "write"} <= set(stages)
+    assert active.snapshot()["counters"] == {"files": 2, "failures": 0, "wrong_passwords": 0}
+
+
+def test_failure_counters(active):
+    encrypted = encrypt_bytes(b"data")
+    with pytest.raises(WrongPasswordError):
+        decrypt_bytes(encrypted, "wrong")
+    with pytest.raises(TruncatedError):
+        decrypt_bytes(encrypted[:-5])
+    assert active.snapshot()["counters"] == {"files": 3, "failures": 1, "wrong_passwords": 1}
+
+
+def test_write_formats(active, tmp_path):
+    active.add_time("cipher", 0.5, 1024)
+    active.count("files")
+
+    path = str(tmp_path / "metrics.json")
+    active.write(path)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    assert data["stages"]["cipher"] == {"seconds": 0.5, "bytes": 1024, "calls": 1}
+    assert data["counters"]["files"] == 1
+
+    path = str(tmp_path / "metrics.prom")
+    active.write(path)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    assert 'file_encryptor_stage_bytes_total{stage="cipher"} 1024' in text
+    assert "file_encryptor_files_total 1" in text
+    assert sorted(os.listdir(tmp_path)) == ["metrics.json", "metrics.prom"]
+
+
+def test_capture(tmp_path):
+    profile_path = str(tmp_path / "run.prof")
+    memory_path = str(tmp_path / "memory.txt")
+    with metrics.Capture(profile_path, memory_path):
+        data = os.urandom(100000)
+        decrypt_bytes(encrypt_bytes(data))
+    with open(memory_path, encoding='utf-8') as f:
+        report = f.read()
+    assert report.startswith("current ")
+    for path in metrics.PROFILER_FILES:
+        assert path not in report
+    assert pstats.Stats(profile_path).total_calls > 0
@@ -0,0 +1,50 @@
+"""Ввод-вывод через mmap для формата seg: совпадение с буферизованным путем"""
+import os
+
+import pytest
+
+from file_encryptor import core, mmapio
+from file_encryptor.errors import FormatError, TruncatedError
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 16 * 1024
+
+
+@pytest.mark.parametrize("encrypt_mode", [mmapio.IO_BUFFERED, mmapio.IO_MMAP])
+@pytest.mark.parametrize("decrypt_mode", [mmapio.IO_BUFFERED, mmapio.IO_MMAP])
+def test_round_trip(make_file, tmp_path, encrypt_mode, decrypt_mode):
+    source = make_file(size=3 * 1024 * 1024 + 5)
+    encrypted, decrypted = str(tmp_path / "a.enc"), str(tmp_path / "a.out")
+    core.encrypt_file(source, encrypted, PASSWORD, ITERATIONS, io_mode=encrypt_mode)
+    core.decrypt_file(encrypted, decrypted, PASSWORD, io_mode=decrypt_mode)
+    with open(source, 'rb') as a, open(decrypted, 'rb') as b:
+        assert a.read() == b.read()
+
+
+@pytest.mark.parametrize("size", [0, 1])
+def test_small_files(make_file, tmp_path, size):
+    source = make_file(size=size)
+    encrypted, decrypted = str(tmp_path / "a.enc"), str(tmp_path / "a.out")
+    core.encrypt_file(source, encrypted, PASSWORD, ITERATIONS, io_mode=mmapio.IO_MMAP)
+    core.decrypt_file(encrypted, decrypted, PASSWORD, io_mode=mmapio.IO_MMAP)
+    assert os.path.getsize(decrypted) == size
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_damaged_file(make_file, tmp_path, damage):
+    source = make_file(size=3 * SEGMENT)
+    encrypted, decrypted = str(tmp_path / "a.enc"), str(tmp_path / "a.out")
+    core.encrypt_file(source, encrypted, PASSWORD, ITERATIONS)
+    with open(encrypted, 'r+b') as f:
+        if damage == "truncate":
+            f.truncate(os.path.getsize(encrypted) - 10)
+        else:
+            f.seek(-SEGMENT, os.SEEK_END)
+            byte = f.read(1)[0]
+            f.seek(-SEGMENT, os.SEEK_END)
+            f.write(bytes([byte ^ 1]))
+    error = TruncatedError if damage == "truncate" else FormatError
+    with pytest.raises(error):
+        core.decrypt_file(encrypted, decrypted, PASSWORD, io_mode=mmapio.IO_MMAP)
+    assert not os.path.exists(decrypted)
@@ -0,0 +1,99 @@
+"""Потоковый формат: каналы без перемотки, обрыв и лишние данные"""
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from file_encryptor import cli, core, header
+from file_encryptor.errors import FormatError, TruncatedError
+
+from conftest import ITERATIONS, PASSWORD, decrypt_bytes
+
+SEGMENT = 4096
+# Слово длины, сегмент и тег GCM
+FRAME = 4 + SEGMENT + 16
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def piped(data):
+    """Канал ОС, в который фоновый поток пишет data; возвращает конец для чтения"""
+    read_fd, write_fd = os.pipe()
+
+    def feed():
+        with open(write_fd, 'wb') as f:
+            f.write(data)
+
+    threading.Thread(target=feed, daemon=True).start()
+    return open(read_fd, 'rb')
+
+
+def encrypt_piped(data):
+    dst = io.BytesIO()
+    with piped(data) as src:
+        assert not src.seekable()
+        core.encrypt_stream(src, dst, PASSWORD, ITERATIONS, fmt=core.FORMAT_STREAM,
+                            chunk_size=SEGMENT, workers=2)
+    return dst.getvalue()
+
+
+def decrypt_piped(data):
+    dst = io.BytesIO()
+    with piped(data) as src:
+        core.decrypt_stream(src, dst, PASSWORD, ITERATIONS, workers=2)
+    return dst.getvalue()
+
+
+@pytest.mark.parametrize("size", [0, 100, SEGMENT, 5 * SEGMENT, 5 * SEGMENT + 7])
+def test_round_trip(size):
+    data = os.urandom(size)
+    encrypted = encrypt_piped(data)
+    src = io.BytesIO(encrypted)
+    fields, _ = header.read_header(src, src.read(len(header.MAGIC)))
+    assert fields["type"] == header.TYPE_STREAM and "length" not in fields
+    assert decrypt_piped(encrypted) == data
+
+
+def test_missing_final_frame():
+    encrypted = encrypt_piped(os.urandom(3 * SEGMENT + 10))
+    # Обрыв ровно на границе кадров
+    with pytest.raises(TruncatedError):
+        decrypt_piped(encrypted[:-(4 + 10 + 16)])
+    with pytest.raises(TruncatedError):
+        decrypt_piped(encrypted[:-(4 + 10 + 16 + FRAME)])
+
+
+def test_partial_frame():
+    encrypted = encrypt_piped(os.urandom(3 * SEGMENT))
+    with pytest.raises(TruncatedError):
+        decrypt_piped(encrypted[:-5])
+
+
+def test_trailing_data():
+    encrypted = encrypt_piped(os.urandom(2 * SEGMENT))
+    with pytest.raises(FormatError):
+        decrypt_piped(encrypted + b"x")
+
+
+def test_tampered_frame():
+    encrypted = bytearray(encrypt_piped(os.urandom(3 * SEGMENT)))
+    encrypted[-FRAME] ^= 1
+    with pytest.raises(FormatError):
+        decrypt_piped(bytes(encrypted))
+
+
+def test_cli_stdin_stdout():
+    data = os.urandom(3 * SEGMENT + 1)
+    env = dict(os.environ, **{cli.PASSWORD_ENV: PASSWORD})
+
+    def run(*args, stdin):
+        return subprocess.run([sys.executable, "-m", "file_encryptor", *args, "-",
+                               "--iterations", str(ITERATIONS)],
+                              input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              cwd=ROOT, env=env, check=True).stdout
+
+    encrypted = run("encrypt", stdin=data)
+    assert decrypt_bytes(encrypted) == data
+    assert run("decrypt", stdin=encrypted) == data
@@ -0,0 +1,61 @@
+"""События прогресса: этапы, обработанные байты и вывод CLI"""
+import io
+import json
+import os
+
+import pytest
+
+from file_encryptor import cli, core, progress
+
+from conftest import ITERATIONS, PASSWORD
+
+SIZE = 5 * 16 * 1024 + 7
+
+
+@pytest.mark.parametrize("fmt", core.FORMATS)
+def test_events_cover_all_bytes(fmt):
+    events = []
+    tracker = progress.ProgressTracker(events.append, interval=0)
+    core.encrypt_stream(io.BytesIO(os.urandom(SIZE)), io.BytesIO(), PASSWORD,
+                        ITERATIONS, tracker, fmt=fmt, chunk_size=16 * 1024)
+    assert events[0].stage == progress.STAGE_KDF
+    data = [event for event in events if event.stage == progress.STAGE_DATA]
+    assert data and data[-1].done == SIZE
+    assert [event.done for event in data] == sorted(event.done for event in data)
+    # Переданный трекер завершает вызывающий код
+    assert events[-1].stage == progress.STAGE_DATA
+
+
+def test_callback_gets_done_event():
+    events = []
+    core.encrypt_stream(io.BytesIO(b"x" * 100), io.BytesIO(), PASSWORD, ITERATIONS,
+                        events.append)
+    assert events[-1].stage == progress.STAGE_DONE
+    assert events[-1].percent == 100.0
+
+
+def test_events_are_rate_limited():
+    events = []
+    tracker = progress.ProgressTracker(events.append, total=100, interval=3600)
+    tracker.start("Обработка")
+    for _ in range(100):
+        tracker.advance(1)
+    tracker.finish()
+    assert [event.stage for event in events] == [progress.STAGE_DATA, progress.STAGE_DONE]
+    assert tracker.done == 100
+
+
+def test_format_eta():
+    assert progress.format_eta(None) == "--:--:--"
+    assert progress.format_eta(3725.9) == "01:02:05"
+
+
+def test_cli_json_progress(make_file, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv(cli.PASSWORD_ENV, PASSWORD)
+    source = make_file(size=SIZE)
+    assert cli.main(["encrypt", source, "-o", str(tmp_path / "a.enc"),
+                     "--iterations", "1000", "--progress", "json"]) == 0
+    events = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert events[-1]["stage"] == progress.STAGE_DONE
+    assert events[-1]["percent"] == 100.0
+    assert max(event["done"] for event in events) == SIZE
@@ -0,0 +1,92 @@
+"""Чтение диапазонов: seg и cbc, порции и отказ для неподдерживаемых файлов"""
+import io
+import os
+import random
+
+import pytest
+
+from file_encryptor import cli, compress, core, ranges
+from file_encryptor.errors import FormatError
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 16 * 1024
+DATA = os.urandom(20 * SEGMENT + 77)
+
+
+@pytest.fixture(params=[core.FORMAT_SEGMENTED, core.FORMAT_CBC])
+def encrypted(request, tmp_path):
+    path = str(tmp_path / "data.enc")
+    with open(path, 'wb') as dst:
+        core.encrypt_stream(io.BytesIO(DATA), dst, PASSWORD, ITERATIONS, fmt=request.param,
+                            chunk_size=SEGMENT)
+    return path
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(ranges, "CHUNK_BYTES", 3 * SEGMENT)
+
+
+def test_random_ranges(encrypted, small_chunks):
+    rng = random.Random(1)
+    with ranges.open_encrypted(encrypted, PASSWORD) as f:
+        for _ in range(100):
+            offset = rng.randrange(len(DATA) + 10)
+            size = rng.randrange(8 * SEGMENT)
+            assert f.read_range(offset, size) == DATA[offset:offset + size]
+
+
+def test_chunks_are_bounded(encrypted, small_chunks):
+    with ranges.open_encrypted(encrypted, PASSWORD) as f:
+        chunks = list(f.iter_range(100, len(DATA)))
+        assert b"".join(chunks) == DATA[100:]
+        assert max(len(chunk) for chunk in chunks) <= 3 * SEGMENT
+        dst = io.BytesIO()
+        assert f.copy_range(SEGMENT - 1, 10 * SEGMENT, dst) == 10 * SEGMENT
+        assert dst.getvalue() == DATA[SEGMENT - 1:11 * SEGMENT - 1]
+
+
+def test_file_interface(encrypted, small_chunks):
+    with ranges.open_encrypted(encrypted, PASSWORD) as f:
+        f.seek(-50, os.SEEK_END)
+        assert f.read() == DATA[-50:]
+        f.seek(7)
+        buffer = bytearray(5 * SEGMENT)
+        assert f.readinto(buffer) == len(buffer)
+        assert bytes(buffer) == DATA[7:7 + len(buffer)]
+        assert f.tell() == 7 + len(buffer)
+        f.seek(0)
+        assert f.read() == DATA
+
+
+def test_cli_streams_whole_tail(encrypted, tmp_path, monkeypatch, small_chunks):
+    monkeypatch.setenv(cli.PASSWORD_ENV, PASSWORD)
+    output = str(tmp_path / "tail.bin")
+    assert cli.main(["read", encrypted, "--offset", "1000", "-o", output]) == 0
+    with open(output, 'rb') as f:
+        assert f.read() == DATA[1000:]
+
+
+def test_tampered_segment(tmp_path):
+    path = str(tmp_path / "data.enc")
+    with open(path, 'wb') as dst:
+        core.encrypt_stream(io.BytesIO(DATA), dst, PASSWORD, ITERATIONS, chunk_size=SEGMENT)
+    with open(path, 'r+b') as f:
+        f.seek(-3 * SEGMENT, os.SEEK_END)
+        value = f.read(1)[0]
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([value ^ 1]))
+    with ranges.open_encrypted(path, PASSWORD) as f:
+        assert f.read_range(0, SEGMENT) == DATA[:SEGMENT]
+        with pytest.raises(FormatError):
+            f.read_range(len(DATA) - 3 * SEGMENT, 10)
+
+
+def test_compressed_file_rejected(tmp_path):
+    path = str(tmp_path / "data.enc")
+    with open(path, 'wb') as dst:
+        core.encrypt_stream(io.BytesIO(b"text " * 50000), dst, PASSWORD, ITERATIONS,
+                            compression=compress.COMPRESSION_ZLIB)
+    with pytest.raises(FormatError):
+        ranges.open_encrypted(path, PASSWORD)
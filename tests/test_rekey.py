@@ -0,0 +1,201 @@
+"""Смена пароля: слоты ключа и запись заголовка через журнал повтора"""
+import io
+import os
+import shutil
+import stat
+
+import pytest
+
+from file_encryptor import archive, core, fsutil, header, incremental, rekey
+from file_encryptor.errors import EncryptorError, FormatError, WrongPasswordError
+
+from conftest import DATA_DIR, ITERATIONS, PASSWORD, fenc_v1_plaintext
+
+NEW_PASSWORD = "battery staple"
+OTHER_PASSWORD = "tr0ub4dor"
+
+
+@pytest.fixture
+def encrypted(make_file, tmp_path):
+    """Зашифрованный файл; возвращает (путь, открытый текст)"""
+    source = make_file()
+    with open(source, 'rb') as f:
+        data = f.read()
+    path = str(tmp_path / "plain.fenc")
+    core.encrypt_file(source, path, PASSWORD, ITERATIONS)
+    return path, data
+
+
+def decrypted(path, password):
+    output = path + ".out"
+    core.decrypt_file(path, output, password, ITERATIONS)
+    with open(output, 'rb') as f:
+        data = f.read()
+    os.remove(output)
+    return data
+
+
+def test_change_password(encrypted):
+    path, data = encrypted
+    rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    assert decrypted(path, NEW_PASSWORD) == data
+    with pytest.raises(WrongPasswordError):
+        decrypted(path, PASSWORD)
+
+
+def test_add_and_remove_password(encrypted):
+    path, data = encrypted
+    assert rekey.add_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS) == 2
+    assert decrypted(path, PASSWORD) == data
+    assert decrypted(path, NEW_PASSWORD) == data
+
+    assert rekey.remove_password(path, PASSWORD) == 1
+    assert decrypted(path, NEW_PASSWORD) == data
+    with pytest.raises(WrongPasswordError):
+        decrypted(path, PASSWORD)
+    with pytest.raises(EncryptorError):
+        rekey.remove_password(path, NEW_PASSWORD)
+
+
+def test_wrong_password_keeps_file(encrypted):
+    path, data = encrypted
+    with open(path, 'rb') as f:
+        before = f.read()
+    with pytest.raises(WrongPasswordError):
+        rekey.change_password(path, OTHER_PASSWORD, NEW_PASSWORD, ITERATIONS)
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+
+def test_slot_limit(encrypted):
+    path, _ = encrypted
+    for n in range(1, header.MAX_KEY_SLOTS):
+        rekey.add_password(path, PASSWORD, f"{OTHER_PASSWORD}{n}", ITERATIONS)
+    with pytest.raises(EncryptorError):
+        rekey.add_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+
+
+def read_body(path):
+    with open(path, 'rb') as f:
+        f.read(len(header.MAGIC))
+        _, size = header.read_header(f, header.MAGIC)
+        f.seek(size)
+        return size, f.read()
+
+
+def test_header_rewritten_in_place(encrypted):
+    path, data = encrypted
+    os.chmod(path, 0o640)
+    size, body = read_body(path)
+    inode = os.stat(path).st_ino
+
+    rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    # Заголовок переписан на месте, данные не копировались
+    assert os.stat(path).st_ino == inode
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert read_body(path) == (size, body)
+    # Журнал повтора удален
+    assert sorted(os.listdir(os.path.dirname(path))) == ["plain.bin", "plain.fenc"]
+    assert decrypted(path, NEW_PASSWORD) == data
+
+
+def test_journal_replayed_after_crash(encrypted, monkeypatch):
+    path, data = encrypted
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    def crash(redo, target):
+        raise OSError("сбой после записи журнала")
+
+    monkeypatch.setattr(fsutil, "_replay", crash)
+    with pytest.raises(OSError):
+        rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    monkeypatch.undo()
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert os.path.exists(fsutil.redo_path(path))
+
+    # Следующее открытие доигрывает журнал
+    assert decrypted(path, NEW_PASSWORD) == data
+    assert not os.path.exists(fsutil.redo_path(path))
+    with pytest.raises(WrongPasswordError):
+        decrypted(path, PASSWORD)
+
+
+def test_crash_before_journal_keeps_file(encrypted, monkeypatch):
+    path, data = encrypted
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    def crash(temp_path, target):
+        raise OSError("сбой до записи журнала")
+
+    monkeypatch.setattr(fsutil, "replace_atomic", crash)
+    with pytest.raises(OSError):
+        rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    monkeypatch.undo()
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert sorted(os.listdir(os.path.dirname(path))) == ["plain.bin", "plain.fenc"]
+    assert decrypted(path, PASSWORD) == data
+
+
+def test_damaged_journal_is_not_replayed(encrypted, monkeypatch):
+    path, _ = encrypted
+    with open(path, 'rb') as f:
+        before = f.read()
+    monkeypatch.setattr(fsutil, "_replay", lambda redo, target: None)
+    rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    monkeypatch.undo()
+    redo = fsutil.redo_path(path)
+    with open(redo, 'r+b') as f:
+        f.seek(100)
+        byte = f.read(1)[0]
+        f.seek(100)
+        f.write(bytes([byte ^ 1]))
+    with pytest.raises(FormatError):
+        decrypted(path, PASSWORD)
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+
+def test_file_without_check_is_refused(tmp_path):
+    path = str(tmp_path / "old.fenc")
+    shutil.copy(os.path.join(DATA_DIR, "fenc_v1.enc"), path)
+    # Неверный пароль здесь не обнаружить: новый слот мог бы испортить файл
+    with pytest.raises(EncryptorError):
+        rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    assert decrypted(path, PASSWORD) == fenc_v1_plaintext()
+
+
+def test_archive(make_file, tmp_path):
+    source = make_file("a.bin")
+    with open(source, 'rb') as f:
+        data = f.read()
+    path = str(tmp_path / "pack.fenc")
+    archive.create_archive(path, [(source, "a.bin")], PASSWORD, ITERATIONS)
+    rekey.change_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    with archive.open_archive(path, NEW_PASSWORD) as arc:
+        dst = io.BytesIO()
+        arc.extract_to("a.bin", dst)
+    assert dst.getvalue() == data
+    with pytest.raises(WrongPasswordError):
+        archive.open_archive(path, PASSWORD)
+
+
+def test_incremental(make_file, tmp_path):
+    source = make_file()
+    with open(source, 'rb') as f:
+        data = bytearray(f.read())
+    path = str(tmp_path / "copy.fenc")
+    incremental.update_file(source, path, PASSWORD, ITERATIONS)
+    rekey.add_password(path, PASSWORD, NEW_PASSWORD, ITERATIONS)
+    assert decrypted(path, NEW_PASSWORD) == data
+
+    # Обновление другим паролем меняет только измененный сегмент
+    data[10] ^= 1
+    with open(source, 'wb') as f:
+        f.write(bytes(data))
+    result = incremental.update_file(source, path, NEW_PASSWORD, ITERATIONS)
+    assert result.changed == 1
+    assert decrypted(path, PASSWORD) == data
@@ -0,0 +1,146 @@
+"""Возобновляемое шифрование: контрольные точки, отмена и смена исходного файла"""
+import json
+import os
+import threading
+
+import pytest
+
+from file_encryptor import core, fsutil, resume
+from file_encryptor.errors import CancelledError, WrongPasswordError
+from file_encryptor.progress import ProgressTracker
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 64 * 1024
+SIZE = 20 * SEGMENT + 123
+
+
+def encrypt(source, output, **options):
+    return resume.encrypt_file_resumable(source, output, PASSWORD, ITERATIONS,
+                                         segment_size=SEGMENT, workers=2,
+                                         checkpoint_bytes=4 * SEGMENT, **options)
+
+
+def interrupt(source, output, after=10 * SEGMENT, lost=0):
+    """Отменить шифрование после after байт; lost сегментов - как при сбое
+    после последней контрольной точки (записаны, но не подтверждены)"""
+    cancel = threading.Event()
+    tracker = ProgressTracker(None, cancel=cancel)
+    advance = tracker.advance
+
+    def advance_and_cancel(size):
+        if tracker.done >= after:
+            cancel.set()
+        advance(size)
+
+    tracker.advance = advance_and_cancel
+    with pytest.raises(CancelledError):
+        encrypt(source, output, progress=tracker)
+    state = resume.load_checkpoint(output)
+    state["segments"] -= lost
+    with open(resume.checkpoint_path(output), 'w') as f:
+        json.dump(state, f)
+    return state["segments"]
+
+
+def modify(path, position):
+    """Изменить байт, сохранив размер и время изменения файла"""
+    stat = os.stat(path)
+    with open(path, 'r+b') as f:
+        f.seek(position)
+        value = f.read(1)[0]
+        f.seek(position)
+        f.write(bytes([value ^ 1]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def decrypted(path, tmp_path):
+    output = str(tmp_path / "out.bin")
+    core.decrypt_file(path, output, PASSWORD)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def files(make_file, tmp_path):
+    return make_file(size=SIZE), str(tmp_path / "out.enc")
+
+
+def test_uninterrupted(files, tmp_path):
+    source, output = files
+    assert encrypt(source, output) == 0
+    assert not os.path.exists(resume.part_path(output))
+    assert not os.path.exists(resume.checkpoint_path(output))
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+def test_resume_after_cancel(files, tmp_path):
+    source, output = files
+    done = interrupt(source, output)
+    assert done > 0 and os.path.exists(resume.part_path(output))
+    assert encrypt(source, output) == done
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+def test_resume_after_crash_past_checkpoint(files, tmp_path):
+    source, output = files
+    done = interrupt(source, output, lost=2)
+    assert encrypt(source, output) == done
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+@pytest.mark.parametrize("where", ["confirmed", "after_checkpoint"])
+def test_changed_source_restarts(files, tmp_path, where):
+    source, output = files
+    done = interrupt(source, output, lost=2)
+    # Сегменты после контрольной точки уже записаны под своими nonce:
+    # другой текст под теми же nonce недопустим
+    modify(source, 10 if where == "confirmed" else done * SEGMENT + 10)
+    assert encrypt(source, output) == 0
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+def test_change_in_unwritten_part_resumes(files, tmp_path):
+    source, output = files
+    done = interrupt(source, output)
+    modify(source, SIZE - 1)
+    assert encrypt(source, output) == done
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+def test_damaged_part_restarts(files, tmp_path):
+    source, output = files
+    interrupt(source, output)
+    with open(resume.part_path(output), 'r+b') as f:
+        f.seek(-5, os.SEEK_END)
+        f.write(b"xxxxx")
+    assert encrypt(source, output) == 0
+    with open(source, 'rb') as f:
+        assert decrypted(output, tmp_path) == f.read()
+
+
+def test_wrong_password_keeps_part(files):
+    source, output = files
+    interrupt(source, output)
+    with pytest.raises(WrongPasswordError):
+        resume.encrypt_file_resumable(source, output, "wrong password", ITERATIONS)
+    assert os.path.exists(resume.part_path(output))
+
+
+def test_checkpoint_changes_reach_disk(files, monkeypatch):
+    _, output = files
+    synced = []
+    monkeypatch.setattr(fsutil, "fsync_dir", synced.append)
+    resume.save_checkpoint(output, {"version": resume.CHECKPOINT_VERSION})
+    assert resume.load_checkpoint(output) is not None
+    resume.discard(output)
+    assert resume.load_checkpoint(output) is None
+    # Каталог сбрасывается после записи точки и после ее удаления
+    directory = os.path.dirname(os.path.abspath(output))
+    assert synced == [directory, directory]
+    assert os.listdir(directory) == ["plain.bin"]
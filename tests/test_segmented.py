@@ -0,0 +1,99 @@
+"""Формат seg: сегменты AES-GCM на пуле потоков и порядок результатов"""
+import os
+import threading
+import time
+
+import pytest
+
+from file_encryptor import core, segmented
+from file_encryptor.errors import FormatError, WrongPasswordError
+
+from conftest import ITERATIONS, PASSWORD
+
+SEGMENT = 16 * 1024
+
+
+def encrypt(source, target, workers):
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        segmented.encrypt_stream(src, dst, PASSWORD, ITERATIONS,
+                                 segment_size=SEGMENT, workers=workers)
+
+
+def decrypt(path, output, workers, password=PASSWORD):
+    core.decrypt_file(path, output, password, ITERATIONS, workers=workers)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("size", [0, 1, SEGMENT, 5 * SEGMENT + 7])
+def test_workers_give_identical_plaintext(make_file, tmp_path, size):
+    source = make_file(size=size)
+    with open(source, 'rb') as f:
+        data = f.read()
+    for workers in (1, 4):
+        encrypted = str(tmp_path / f"w{workers}.enc")
+        encrypt(source, encrypted, workers)
+        for decrypt_workers in (1, 4):
+            output = str(tmp_path / f"w{workers}_{decrypt_workers}.out")
+            assert decrypt(encrypted, output, decrypt_workers) == data
+
+
+def test_ordered_map_keeps_order():
+    finished = []
+    submitted = []
+    lock = threading.Lock()
+
+    def work(index):
+        # Ранние элементы окна выполняются дольше поздних и завершаются последними
+        time.sleep(0.001 * (8 - index % 8))
+        with lock:
+            finished.append(index)
+        return index
+
+    def items():
+        for index in range(64):
+            submitted.append(index)
+            yield (index,)
+
+    results = []
+    for result in segmented.ordered_map(work, items(), 4):
+        results.append(result)
+        # Окно задач ограничено: вперед уходит не больше 2 * workers элементов
+        assert len(submitted) - len(results) <= 8
+    assert results == list(range(64))
+    assert finished != results
+
+
+def test_ordered_map_propagates_errors():
+    def work(index):
+        if index == 5:
+            raise FormatError("сегмент 5")
+        return index
+
+    with pytest.raises(FormatError):
+        list(segmented.ordered_map(work, ((n,) for n in range(20)), 4))
+
+
+def test_wrong_password(make_file, tmp_path):
+    encrypted = str(tmp_path / "a.enc")
+    encrypt(make_file(), encrypted, 2)
+    with pytest.raises(WrongPasswordError):
+        decrypt(encrypted, str(tmp_path / "a.out"), 2, "wrong")
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_damaged(make_file, tmp_path, damage):
+    encrypted = str(tmp_path / "a.enc")
+    encrypt(make_file(size=5 * SEGMENT), encrypted, 2)
+    with open(encrypted, 'r+b') as f:
+        if damage == "truncate":
+            f.truncate(os.path.getsize(encrypted) - 10)
+        else:
+            f.seek(-SEGMENT, os.SEEK_END)
+            byte = f.read(1)[0]
+            f.seek(-SEGMENT, os.SEEK_END)
+            f.write(bytes([byte ^ 1]))
+    output = str(tmp_path / "a.out")
+    with pytest.raises(FormatError):
+        decrypt(encrypted, output, 2)
+    assert not os.path.exists(output)
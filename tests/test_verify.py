@@ -0,0 +1,84 @@
+"""Проверка файлов без записи: статусы и сводный отчет"""
+import os
+
+import pytest
+
+from file_encryptor import archive, core, header, verify
+from file_encryptor.progress import MB
+
+from conftest import ITERATIONS, PASSWORD
+
+
+@pytest.fixture
+def encrypted(make_file, tmp_path):
+    """Создать зашифрованный файл; возвращает путь"""
+    def make(name="plain.fenc", size=100000):
+        path = str(tmp_path / name)
+        core.encrypt_file(make_file(name + ".src", size), path, PASSWORD, ITERATIONS)
+        return path
+    return make
+
+
+def status(path, password=PASSWORD):
+    return verify.verify_file(path, password, ITERATIONS).status
+
+
+def test_ok(encrypted):
+    result = verify.verify_file(encrypted(), PASSWORD, ITERATIONS)
+    assert result.ok and result.error is None
+    assert result.size == os.path.getsize(result.path)
+
+
+def test_archive_ok(make_file, tmp_path):
+    path = str(tmp_path / "pack.fenc")
+    archive.create_archive(path, [(make_file("a.bin"), "a.bin"), (make_file("b.bin"), "b.bin")],
+                           PASSWORD, ITERATIONS)
+    assert status(path) == verify.STATUS_OK
+
+
+def test_wrong_password(encrypted):
+    assert status(encrypted(), "wrong") == verify.STATUS_WRONG_PASSWORD
+
+
+def test_corrupt(encrypted):
+    path = encrypted()
+    with open(path, 'r+b') as f:
+        f.seek(-100, os.SEEK_END)
+        byte = f.read(1)[0]
+        f.seek(-100, os.SEEK_END)
+        f.write(bytes([byte ^ 1]))
+    assert status(path) == verify.STATUS_CORRUPT
+
+
+def test_truncated(encrypted):
+    path = encrypted()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1000)
+    assert status(path) == verify.STATUS_TRUNCATED
+
+
+def test_error(tmp_path):
+    result = verify.verify_file(str(tmp_path / "missing.fenc"), PASSWORD, ITERATIONS)
+    assert result.status == verify.STATUS_ERROR
+    assert result.error
+
+
+def test_verify_files_and_summary(encrypted, tmp_path):
+    good = [encrypted(f"f{n}.fenc") for n in range(4)]
+    bad = encrypted("bad.fenc")
+    with open(bad, 'r+b') as f:
+        f.write(header.MAGIC[::-1])
+    calls = []
+    results = verify.verify_files(good + [bad], PASSWORD, ITERATIONS, jobs=2,
+                                  progress=lambda done, total, result: calls.append((done, total)))
+    assert sorted(r.path for r in results) == sorted(good + [bad])
+    total = sum(os.path.getsize(path) for path in good + [bad])
+    assert calls[-1] == (total, total)
+
+    report = verify.summarize(results, 0.5)
+    assert report["files"] == 5
+    assert report["counts"][verify.STATUS_OK] == 4
+    assert [failure["path"] for failure in report["failures"]] == [bad]
+    assert report["bytes"] == total
+    assert report["mbps"] == round(total / 0.5 / MB, 1)
+    assert verify.summarize([], 0)["mbps"] == 0.0
@@ -0,0 +1,135 @@
+"""Наблюдение за каталогом: стабилизация, шифрование и файл состояния"""
+import contextlib
+import os
+import threading
+import time
+
+import pytest
+
+from file_encryptor import core, watch
+from file_encryptor.errors import EncryptorError
+
+from conftest import ITERATIONS, PASSWORD
+
+SETTLE = 0.2
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.02)
+
+
+@contextlib.contextmanager
+def running(watcher):
+    """Запустить наблюдение в отдельном потоке на время блока"""
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def new_watcher(tmp_path, results, use_inotify=False):
+    return watch.FolderWatcher(str(tmp_path / "src"), str(tmp_path / "out"), PASSWORD,
+                               ITERATIONS, jobs=2, settle=SETTLE, interval=0.05,
+                               use_inotify=use_inotify, on_result=results.append)
+
+
+def decrypted(path):
+    output = path + ".plain"
+    core.decrypt_file(path, output, PASSWORD, ITERATIONS)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_encrypts_new_files(tmp_path, use_inotify):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.txt").write_bytes(b"first")
+    results = []
+    with running(new_watcher(tmp_path, results, use_inotify)):
+        (tmp_path / "src" / "sub").mkdir()
+        (tmp_path / "src" / "sub" / "b.bin").write_bytes(b"second" * 1000)
+        (tmp_path / "src" / ".partial").write_bytes(b"hidden")
+        wait_for(lambda: len(results) == 2)
+    assert all(result.ok for result in results)
+    assert decrypted(str(tmp_path / "out" / "a.txt")) == b"first"
+    assert decrypted(str(tmp_path / "out" / "sub" / "b.bin")) == b"second" * 1000
+    assert not (tmp_path / "out" / ".partial").exists()
+    assert sorted(watch.load_state(str(tmp_path / "out" / watch.STATE_NAME))) == [
+        "a.txt", os.path.join("sub", "b.bin")]
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="нужны FIFO и ссылки")
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_only_regular_files(tmp_path, use_inotify):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "secret.txt").write_bytes(b"outside")
+    (tmp_path / "src" / "a.txt").write_bytes(b"first")
+    results = []
+    with running(new_watcher(tmp_path, results, use_inotify)):
+        # Первый файл зашифрован: наблюдение уже идет
+        wait_for(lambda: len(results) == 1)
+        os.mkfifo(str(tmp_path / "src" / "pipe"))
+        os.symlink(str(tmp_path / "secret.txt"), str(tmp_path / "src" / "link.txt"))
+        (tmp_path / "src" / "b.txt").write_bytes(b"second")
+        wait_for(lambda: len(results) == 2)
+        time.sleep(3 * SETTLE)
+    assert sorted(os.path.basename(result.path) for result in results) == ["a.txt", "b.txt"]
+    assert sorted(os.listdir(str(tmp_path / "out"))) == sorted(
+        ["a.txt", "b.txt", watch.STATE_NAME])
+
+
+def test_restart_skips_encrypted_files(tmp_path):
+    (tmp_path / "src").mkdir()
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / "src" / name).write_bytes(name.encode())
+    results = []
+    with running(new_watcher(tmp_path, results)):
+        wait_for(lambda: len(results) == 2)
+
+    (tmp_path / "src" / "b.txt").write_bytes(b"changed")
+    results = []
+    with running(new_watcher(tmp_path, results)):
+        wait_for(lambda: len(results) == 1)
+        # Неизменный файл не шифруется повторно
+        time.sleep(3 * SETTLE)
+    assert [os.path.basename(result.path) for result in results] == ["b.txt"]
+    assert decrypted(str(tmp_path / "out" / "b.txt")) == b"changed"
+
+
+def test_waits_until_file_settles(tmp_path):
+    (tmp_path / "src").mkdir()
+    path = str(tmp_path / "src" / "a.txt")
+    watcher = watch.FolderWatcher(str(tmp_path / "src"), str(tmp_path / "out"), PASSWORD,
+                                  settle=5)
+    with open(path, 'wb') as f:
+        f.write(b"part")
+    watcher._observe(path, watcher._stat(path), 0)
+    watcher._promote(4)
+    assert watcher._ready == {}
+
+    # Дописанный файл ждет заново с момента изменения
+    with open(path, 'ab') as f:
+        f.write(b" more")
+    watcher._promote(4)
+    watcher._promote(8)
+    assert watcher._ready == {}
+    watcher._promote(9)
+    assert watcher._ready == {path: watcher._stat(path)}
+
+
+def test_bad_state_file(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{broken")
+    with pytest.raises(EncryptorError):
+        watch.load_state(str(path))
+    path.write_text('{"version": 999, "files": {}}')
+    with pytest.raises(EncryptorError):
+        watch.load_state(str(path))
+    assert watch.load_state(str(tmp_path / "missing.json")) == {}